@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the numeric kernels in ``source/kernels.py``.
+
+All inputs are synthetic (``source/synthetic.py``), so the suite runs offline
+without Sentinel Hub credentials. Each kernel is timed over a grid of input
+sizes; the scaling exponent (slope of log(time) over log(size)) is reported
+next to the raw timings.
+
+Usage (from the project root):
+
+    python -m benchmarks.bench_kernels                  # run and compare with the baseline
+    python -m benchmarks.bench_kernels --quick          # smaller grid, fewer repeats
+    python -m benchmarks.bench_kernels --update-baseline
+
+Before timing, the kernels that replaced slower code are checked against that
+code on synthetic inputs (``check_equivalence``); a mismatch fails the run.
+
+The baseline is stored in ``benchmarks/baseline.json``. A case is reported as a
+regression when it is slower than the baseline by more than ``--tolerance``
+(a ratio, default 1.5); the exit code is then 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from source.kernels import (
+    fill_time_gaps,
+    find_onset,
+    find_onsets,
+    lagged_correlation,
+    lagrange_fill,
+    lttb,
+    mean_ndvi,
+    season_metrics,
+    trend_slope,
+    zonal_stats,
+)
+from source.synthetic import (
+    synthetic_ndvi_cube,
+    synthetic_ndvi_raster,
+    synthetic_ndvi_season_cube,
+    synthetic_ndvi_series,
+    synthetic_temperature,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+# --- 1. BENCHMARK CASES ---
+# Each kernel: (setup(params) -> callable, full grid, quick grid, name of the scaling parameter, size(params))
+
+def _setup_trend_slope(years, size, nan):
+    cube = synthetic_ndvi_cube(years, size, size, nan_fraction=nan, seed=42)
+    return lambda: trend_slope(cube)
+
+
+def _setup_mean_ndvi(size, nan):
+    raster = synthetic_ndvi_raster(size, size, nan_fraction=nan, seed=42)
+    # mean_ndvi treats zeros as no-data, like the raw Sentinel Hub rasters
+    raster[np.isnan(raster)] = 0.0
+    return lambda: mean_ndvi(raster)
+
+
+def _setup_lagrange_fill(length, gaps):
+    series = synthetic_ndvi_series(length, gap_fraction=gaps, seed=42)
+    return lambda: lagrange_fill(series)
+
+
+def _setup_find_onset(days):
+    temperatures = synthetic_temperature(days, seed=42)
+    return lambda: find_onset(temperatures)
+
+
+def _setup_season_metrics(periods, size, nan):
+    doy = np.linspace(40, 320, periods)
+    values = synthetic_ndvi_season_cube(doy, size, size, nan_fraction=nan, seed=42).reshape(periods, -1)
+    return lambda: season_metrics(fill_time_gaps(values, doy), doy)
+
+
+def _setup_zonal_stats(size, zones):
+    raster = synthetic_ndvi_raster(size, size, nan_fraction=0.1, seed=42) - 0.45
+    labels = np.random.default_rng(42).integers(0, zones + 1, size=(size, size))
+    return lambda: zonal_stats(raster, labels, zones, stable=0.005)
+
+
+def _setup_lagged_correlation(series, days, lags):
+    temperatures = np.array([synthetic_temperature(days, seed=seed) for seed in range(series)])
+    ndvi = np.roll(temperatures, 10, axis=-1) / 40 + 0.3
+    return lambda: lagged_correlation(ndvi, temperatures, lags)
+
+
+def _setup_lttb(length, points):
+    series = synthetic_temperature(length, seed=42)
+    x = np.arange(length)
+    return lambda: lttb(x, series, points)
+
+
+KERNELS = {
+    'trend_slope': {
+        'setup': _setup_trend_slope,
+        'grid': [dict(years=y, size=s, nan=n) for y in (3, 6, 9) for s in (100, 250, 500) for n in (0.0, 0.3)],
+        'quick': [dict(years=6, size=s, nan=0.1) for s in (100, 250)],
+        # pixels processed
+        'size': lambda p: p['years'] * p['size'] ** 2,
+    },
+    'mean_ndvi': {
+        'setup': _setup_mean_ndvi,
+        'grid': [dict(size=s, nan=n) for s in (250, 500, 1000) for n in (0.0, 0.5)],
+        'quick': [dict(size=s, nan=0.2) for s in (250, 500)],
+        'size': lambda p: p['size'] ** 2,
+    },
+    'lagrange_fill': {
+        'setup': _setup_lagrange_fill,
+        'grid': [dict(length=n, gaps=g) for n in (12, 24, 48) for g in (0.2, 0.5)],
+        'quick': [dict(length=n, gaps=0.3) for n in (12, 24)],
+        'size': lambda p: p['length'],
+    },
+    'find_onset': {
+        'setup': _setup_find_onset,
+        'grid': [dict(days=d) for d in (200, 2000, 20000)],
+        'quick': [dict(days=d) for d in (200, 2000)],
+        'size': lambda p: p['days'],
+    },
+    'season_metrics': {
+        'setup': _setup_season_metrics,
+        'grid': [dict(periods=t, size=s, nan=0.1) for t in (10, 20) for s in (100, 250, 500)],
+        'quick': [dict(periods=20, size=s, nan=0.1) for s in (100, 250)],
+        # pixel values processed (gap filling included)
+        'size': lambda p: p['periods'] * p['size'] ** 2,
+    },
+    'zonal_stats': {
+        'setup': _setup_zonal_stats,
+        'grid': [dict(size=s, zones=z) for s in (250, 500, 1000) for z in (10, 500)],
+        'quick': [dict(size=s, zones=10) for s in (250, 500)],
+        'size': lambda p: p['size'] ** 2,
+    },
+    'lagged_correlation': {
+        'setup': _setup_lagged_correlation,
+        'grid': [dict(series=n, days=166, lags=l) for n in (50, 200, 1000) for l in (10, 30)],
+        'quick': [dict(series=n, days=166, lags=30) for n in (50, 200)],
+        # correlation samples processed
+        'size': lambda p: p['series'] * (2 * p['lags'] + 1) * (p['days'] - 2 * p['lags']),
+    },
+    'lttb': {
+        'setup': _setup_lttb,
+        'grid': [dict(length=n, points=p) for n in (2_000, 20_000, 200_000) for p in (200, 1000)],
+        'quick': [dict(length=n, points=400) for n in (2_000, 20_000)],
+        'size': lambda p: p['length'],
+    },
+}
+
+
+def case_id(kernel, params):
+    return f"{kernel}[{','.join(f'{k}={v}' for k, v in params.items())}]"
+
+
+# --- 2. EQUIVALENCE CHECKS ---
+
+def _reference_onset(temperatures, threshold=5, days=5):
+    """The former per-row pandas onset search of /api/plot (rolling minimum skipping NaN)."""
+    series = pd.Series(temperatures)
+    for i in range(len(series) - days + 1):
+        if series.iloc[i:i + days].min() >= threshold:
+            return i
+    return None
+
+
+def check_equivalence(cases=200, length=120):
+    """Compares find_onset / find_onsets with the former pandas search on series with gaps; returns mismatches."""
+    rng = np.random.default_rng(42)
+    mismatches = []
+    series = []
+    for seed in range(cases):
+        temperatures = synthetic_temperature(length, seed=seed, start_temperature=-5.0, end_temperature=10.0)
+        temperatures[rng.random(length) < rng.choice([0.0, 0.2, 0.6, 1.0])] = np.nan
+        series.append(temperatures)
+        expected = _reference_onset(temperatures)
+        if find_onset(temperatures) != expected:
+            mismatches.append(f"find_onset[seed={seed}]: {find_onset(temperatures)} != {expected}")
+    batched = find_onsets(np.array(series))
+    for seed, temperatures in enumerate(series):
+        expected = _reference_onset(temperatures)
+        if (batched[seed] if batched[seed] >= 0 else None) != expected:
+            mismatches.append(f"find_onsets[seed={seed}]: {batched[seed]} != {expected}")
+    return mismatches
+
+
+# --- 3. MEASUREMENT ---
+
+def time_call(func, repeat):
+    """Returns the best time per call in seconds (auto-scaling the loop count like timeit's CLI)."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def scaling_exponent(points):
+    """Slope of log(time) over log(size); ~1 means linear, ~2 quadratic scaling."""
+    if len(points) < 2:
+        return None
+    sizes, times = zip(*points)
+    if len(set(sizes)) < 2:
+        return None
+    slope, _ = np.polyfit(np.log(sizes), np.log(times), 1)
+    return round(float(slope), 3)
+
+
+def run(kernels, quick=False, repeat=5):
+    results = {}
+    scaling = {}
+    for name in kernels:
+        spec = KERNELS[name]
+        points = []
+        for params in spec['quick' if quick else 'grid']:
+            seconds = time_call(spec['setup'](**params), repeat)
+            results[case_id(name, params)] = seconds
+            points.append((spec['size'](params), seconds))
+            print(f"{case_id(name, params):<45} {seconds * 1e3:10.3f} ms")
+        scaling[name] = scaling_exponent(points)
+        print(f"{name:<45} scaling exponent: {scaling[name]}")
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor() or platform.machine(),
+            'quick': quick,
+        },
+        'results': results,
+        'scaling': scaling,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Prints the ratio to the baseline for every shared case and returns the regressed case ids."""
+    regressions = []
+    print(f"\n{'case':<45} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for case, seconds in current['results'].items():
+        reference = baseline['results'].get(case)
+        if reference is None:
+            continue
+        ratio = seconds / reference
+        flag = '  REGRESSION' if ratio > tolerance else ''
+        print(f"{case:<45} {reference * 1e3:10.3f}ms {seconds * 1e3:10.3f}ms {ratio:8.2f}{flag}")
+        if ratio > tolerance:
+            regressions.append(case)
+    return regressions
+
+
+# --- 4. COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the numeric kernels on synthetic data.')
+    parser.add_argument('--kernel', action='append', choices=sorted(KERNELS), help='Run only this kernel (repeatable).')
+    parser.add_argument('--quick', action='store_true', help='Smaller grid for a fast smoke run.')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repeats per case (best one is kept).')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='Allowed slowdown ratio against the baseline.')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Path to the baseline JSON file.')
+    parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline.')
+    args = parser.parse_args(argv)
+
+    mismatches = check_equivalence()
+    for mismatch in mismatches:
+        print(f"MISMATCH {mismatch}")
+    if mismatches:
+        print(f"\n{len(mismatches)} kernel result(s) differ from the code they replaced.")
+        return 1
+
+    current = run(args.kernel or list(KERNELS), quick=args.quick, repeat=args.repeat)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n✅ Baseline saved to: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than {args.tolerance}x the baseline.")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
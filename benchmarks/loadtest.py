@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP load test for the Flask endpoints.
+
+Runs a scenario from ``benchmarks/scenarios/*.json`` against the app and reports
+latency percentiles, throughput and error rate per request kind. By default the
+app from ``manage.py`` is started in-process on a free port with
+``FETCH_BACKEND=replay``, so no Sentinel Hub or Open-Meteo access is needed.
+
+Usage (from the project root):
+
+    python -m benchmarks.loadtest                                   # default scenario
+    python -m benchmarks.loadtest benchmarks/scenarios/analysis_burst.json --concurrency 16
+    python -m benchmarks.loadtest --url http://127.0.0.1:5001       # against a running server
+    python -m benchmarks.loadtest --replay-latency 0.5 --output result.json
+
+Scenario keys: ``duration`` (s), ``concurrency`` (client threads), ``mix``
+(relative weights of the request kinds below), ``locations``, ``seasons``,
+``repeated_analysis`` and ``years`` (inclusive range for unique analyses).
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_SCENARIO = os.path.join(os.path.dirname(__file__), 'scenarios', 'pollen_season.json')
+
+
+# --- 1. REQUEST KINDS ---
+
+def _plot(scenario, rng):
+    return 'POST', '/api/plot', {'location': rng.choice(scenario['locations'])}
+
+
+def _current_pollen(scenario, rng):
+    return 'GET', '/api/current_pollen', None
+
+
+def _analyze_repeated(scenario, rng):
+    return 'POST', '/api/analyze', scenario['repeated_analysis']
+
+
+def _analyze_unique(scenario, rng):
+    first, last = scenario['years']
+    years = sorted(rng.sample(range(first, last + 1), rng.randint(2, 4)))
+    return 'POST', '/api/analyze', {'years': years, 'season': rng.choice(scenario['seasons'])}
+
+
+REQUEST_KINDS = {
+    'plot': _plot,
+    'current_pollen': _current_pollen,
+    'analyze_repeated': _analyze_repeated,
+    'analyze_unique': _analyze_unique,
+}
+
+
+def send(base_url, method, path, payload, timeout):
+    """Sends one request; returns (status code or None, latency in seconds)."""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, OSError):
+        status = None
+    return status, time.perf_counter() - started
+
+
+# --- 2. LOCAL SERVER ---
+
+def start_local_server(replay_latency):
+    """Starts manage.app with the replay backend on a free port; returns (base_url, server)."""
+    os.environ.setdefault('FETCH_BACKEND', 'replay')
+    os.environ['REPLAY_LATENCY'] = str(replay_latency)
+    from werkzeug.serving import make_server
+
+    import manage
+
+    server = make_server('127.0.0.1', 0, manage.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+# --- 3. LOAD GENERATION AND REPORT ---
+
+def run_scenario(base_url, scenario, seed=0, timeout=300):
+    kinds = list(scenario['mix'])
+    weights = [scenario['mix'][k] for k in kinds]
+    deadline = time.perf_counter() + scenario['duration']
+    results = defaultdict(list)
+    lock = threading.Lock()
+
+    def client(worker_id):
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            method, path, payload = REQUEST_KINDS[kind](scenario, rng)
+            status, latency = send(base_url, method, path, payload, timeout)
+            with lock:
+                results[kind].append((status, latency))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=scenario['concurrency']) as executor:
+        list(executor.map(client, range(scenario['concurrency'])))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    summary = {}
+    for kind, samples in sorted(results.items()):
+        latencies = np.array([latency for _, latency in samples]) * 1e3
+        errors = sum(1 for status, _ in samples if status is None or status >= 400)
+        p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+        summary[kind] = {
+            'requests': len(samples),
+            'errors': errors,
+            'error_rate': errors / len(samples),
+            'throughput_rps': len(samples) / elapsed,
+            'p50_ms': p50, 'p90_ms': p90, 'p95_ms': p95, 'p99_ms': p99,
+            'max_ms': float(latencies.max()),
+        }
+    return summary
+
+
+def print_report(scenario, summary, elapsed):
+    print(f"\nScenario '{scenario['name']}': {scenario['concurrency']} clients, {elapsed:.1f} s")
+    print(f"{'kind':<18} {'req':>6} {'err%':>6} {'rps':>8} {'p50':>9} {'p90':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for kind, s in summary.items():
+        print(f"{kind:<18} {s['requests']:>6} {s['error_rate'] * 100:>5.1f}% {s['throughput_rps']:>8.2f} "
+              f"{s['p50_ms']:>7.1f}ms {s['p90_ms']:>7.1f}ms {s['p95_ms']:>7.1f}ms {s['p99_ms']:>7.1f}ms "
+              f"{s['max_ms']:>7.1f}ms")
+    total = sum(s['requests'] for s in summary.values())
+    print(f"{'total':<18} {total:>6} {'':>6} {total / elapsed:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the Flask API endpoints.')
+    parser.add_argument('scenario', nargs='?', default=DEFAULT_SCENARIO, help='Scenario JSON file.')
+    parser.add_argument('--url', help='Base URL of a running server (default: start manage.py in-process).')
+    parser.add_argument('--duration', type=float, help='Override the scenario duration (seconds).')
+    parser.add_argument('--concurrency', type=int, help='Override the number of client threads.')
+    parser.add_argument('--replay-latency', type=float, default=0.0,
+                        help='Latency injected into every replayed Sentinel Hub request (local server only).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix.')
+    parser.add_argument('--output', help='Write the summary as JSON to this file.')
+    args = parser.parse_args(argv)
+
+    with open(args.scenario, encoding='utf-8') as f:
+        scenario = json.load(f)
+    if args.duration is not None:
+        scenario['duration'] = args.duration
+    if args.concurrency is not None:
+        scenario['concurrency'] = args.concurrency
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        base_url, server = start_local_server(args.replay_latency)
+    print(f"Load testing {base_url} ...")
+
+    try:
+        results, elapsed = run_scenario(base_url.rstrip('/'), scenario, seed=args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    summary = summarize(results, elapsed)
+    print_report(scenario, summary, elapsed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'scenario': scenario, 'elapsed': elapsed, 'summary': summary}, f, indent=2, default=float)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
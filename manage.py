@@ -2,28 +2,204 @@
 import json
 import logging
 import os
+from datetime import date
 
-import pandas as pd
 import plotly.graph_objs as go
 import plotly.utils
-from flask import Flask, jsonify, render_template, request, send_from_directory
-
-from source.long_term_analysis_trnava import generate_trend_map
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+
+from source.assets import init_assets
+from source.chart_payload import MIN_POINTS, PAYLOAD_ENCODINGS, columnar
+from source.climatology import MIN_BASELINE_YEARS, anomaly_map, update_baseline
+from source.compression import init_compression
+from source.correlation import CORRELATION_MAX_LAG, POLLEN_CSV, correlation
+from source.green_areas import parse_polygon, registry as green_areas
+from source.imagery import LEVELS as IMAGERY_LEVELS, gallery
+from source.kernels import find_onset
+from source.long_term_analysis_trnava import (
+    POLLEN_TO_MONTHS,
+    PYRAMID_LEVELS,
+    cached_trend_map,
+    can_afford_trend_map,
+    custom_geometry,
+    generate_trend_map,
+    geometry_digest,
+    is_trend_map_pending,
+    latest_area_trend,
+    level_size,
+    schedule_trend_map,
+    stored_geometry,
+    trend_zones
+)
+from source.phenology import PHENOLOGY_METHODS, phenology_map
+from source.pollen_store import DEFAULT_STATION, store as pollen_store
+from source.profiling import init_profiling
+from source.pu_budget import BudgetExceeded, init_budget, is_low as pu_budget_low, status as pu_budget_status
+from source.progress import AnalysisJob
+from source.shared_cache import load_csv
+from source.timeseries_index import VARIABLES as TIMESERIES_VARIABLES, get_index, window_key
 
 # --- 1. NASTAVENIE APLIKÁCIE FLASK ---
-app = Flask(__name__, static_folder='static')
+# Statické súbory servíruje source/assets.py (odtlačky v URL, predkomprimované varianty, ETag)
+app = Flask(__name__, static_folder=None)
 logging.basicConfig(level=logging.INFO)
 
-# Definovanie mapovania sezón na mesiace
-POLLEN_TO_MONTHS = {
-    "early_spring": ("02-01", "03-31"),
-    "mid_spring": ("04-01", "05-31"),
-    "late_spring": ("06-01", "08-31"),
-    "year": ("01-01", "12-31"),
-}
+# Kompresia odpovedí (brotli/gzip); registruje sa prvá, aby bežala ako posledná z after_request funkcií
+init_compression(app)
+
+# Statické súbory a vygenerované mapy (endpoint 'static')
+init_assets(app)
+
+# Spotreba processing units (PU) Sentinel Hub sa pripisuje klientovi, ktorý požiadavku poslal
+init_budget(app)
+
+# Voliteľné profilovanie jednotlivých požiadaviek (iba pre administrátorov)
+init_profiling(app)
+
+
+# --- 2. POMOCNÉ FUNKCIE ---
+
+def parse_analysis_params(years, season):
+    """
+    Validuje roky a obdobie analýzy. Vracia (roky, obdobie, chyba); chyba je None, ak sú vstupy v poriadku.
+    Roky sú zoradené vzostupne, aby trend mal správne znamienko a rovnaké požiadavky zdieľali jeden záznam v cache.
+    """
+    if not years or not isinstance(years, list) or len(years) < 2:
+        return None, None, "Je potrebné poskytnúť pole s aspoň dvoma rokmi."
+
+    if not season or season not in POLLEN_TO_MONTHS:
+        return None, None, f"Neplatné obdobie. Dostupné možnosti: {', '.join(POLLEN_TO_MONTHS.keys())}"
+
+    # Konvertujeme roky na celé čísla
+    try:
+        years = sorted({int(y) for y in years})
+    except (ValueError, TypeError):
+        return None, None, "Pole 'years' musí obsahovať iba celé čísla."
+    if len(years) < 2:
+        return None, None, "Je potrebné poskytnúť pole s aspoň dvoma rôznymi rokmi."
+
+    return years, season, None
+
+
+def parse_area_params(area_id=None, geojson=None, geometry_id=None):
+    """
+    Validuje oblasť analýzy: id registrovanej oblasti, nahraný GeoJSON polygón alebo hash už nahraného polygónu.
+    Vracia (oblasť, chyba); oblasť je dict s 'geometry' (sentinelhub Geometry, None pre celé mesto),
+    'name' (do nadpisu mapy) a 'query' (parametre URL, ktoré oblasť určujú v ďalších požiadavkách).
+    """
+    if area_id:
+        area = green_areas.get(area_id)
+        if area is None:
+            return None, f"Neznáma oblasť '{area_id}'."
+        geometry, name, query = area.geometry(), area.name, f"&area={area_id}"
+    elif geojson:
+        try:
+            geometry = custom_geometry(parse_polygon(geojson))
+        except ValueError as e:
+            return None, f"Neplatný GeoJSON polygón: {e}"
+        name = "custom area"
+        query = f"&geometry_id={geometry_digest(geometry)}"
+    elif geometry_id:
+        geometry = stored_geometry(geometry_id)
+        if geometry is None:
+            return None, f"Neznámy polygón '{geometry_id}'. Pošlite ho znova v poli 'geometry'."
+        name, query = "custom area", f"&geometry_id={geometry_id}"
+    else:
+        return {'geometry': None, 'name': 'Trnava', 'query': ''}, None
+
+    # Oblasť sa sťahuje vo výreze svojho ohraničujúceho obdĺžnika, v rovnakom rozlíšení ako celé mesto
+    try:
+        level_size('full', geometry)
+    except ValueError:
+        return None, "Oblasť je príliš veľká na jednu požiadavku na Sentinel Hub."
+    return {'geometry': geometry, 'name': name, 'query': query}, None
 
 
-# --- 2. DEFINOVANIE ENDPOINTOV (ROUTES) ---
+def onset_windows(temp_df, temp_threshold=5, days_threshold=5):
+    """
+    Nájde pre každý rok prvých 5 po sebe idúcich dní s teplotou aspoň 5°C.
+    Vracia {stĺpec roka: {start_index, end_index, start_date, end_date, dates, values}}.
+    """
+    threshold_dates = {}
+    for year_col in temp_df.columns[1:]:  # Skip first column (date)
+        i = find_onset(temp_df[year_col].to_numpy(), temp_threshold, days_threshold)
+        if i is not None:
+            window = slice(i, i + days_threshold)
+            threshold_dates[year_col] = {
+                'start_index': i,
+                'end_index': i + days_threshold - 1,
+                'start_date': temp_df['date'].iloc[i],
+                'end_date': temp_df['date'].iloc[i + days_threshold - 1],
+                # Dni nástupu aj s hodnotami, aby ich klient vedel vykresliť aj nad zredukovaným radom
+                'dates': temp_df['date'].iloc[window].tolist(),
+                'values': temp_df[year_col].iloc[window].tolist(),
+            }
+    return threshold_dates
+
+
+def parse_payload_params(params):
+    """
+    Validuje parametre formátu grafových dát (format, encoding, max_points).
+    Vracia (formát, kódovanie, max. počet bodov, chyba); chyba je None, ak sú vstupy v poriadku.
+    """
+    payload_format = params.get('format') or 'plotly'
+    if payload_format not in ('plotly', 'columns'):
+        return None, None, None, "Neplatný formát. Dostupné možnosti: plotly, columns"
+
+    encoding = params.get('encoding') or 'json'
+    if encoding not in PAYLOAD_ENCODINGS:
+        return None, None, None, f"Neplatné kódovanie. Dostupné možnosti: {', '.join(PAYLOAD_ENCODINGS)}"
+
+    max_points = params.get('max_points')
+    if max_points not in (None, ''):
+        try:
+            max_points = int(max_points)
+        except (ValueError, TypeError):
+            return None, None, None, "Parameter 'max_points' musí byť celé číslo."
+        if max_points < MIN_POINTS:
+            return None, None, None, f"Parameter 'max_points' musí byť aspoň {MIN_POINTS}."
+    else:
+        max_points = None
+
+    return payload_format, encoding, max_points, None
+
+
+def to_url(path):
+    """Prevedie cestu k súboru na URL, napr. 'static/output/map.png' -> '/static/output/map.png'."""
+    return "/" + path.replace(os.path.sep, '/')
+
+
+def area_payload(area):
+    """Metadáta zelenej plochy s posledným vypočítaným trendom NDVI (None, ak ešte žiadna mapa plochu nepokryla)."""
+    trend = latest_area_trend(area.id)
+    if trend is not None:
+        trend = dict(trend)
+        trend['image_url'] = to_url(trend.pop('image_path'))
+    return {**area.to_dict(), "trend": trend}
+
+
+def degraded_analysis(years, month_start, month_end, geometry, progressive=True):
+    """
+    Rozhodne pred prvým stiahnutím, ako sa mapa trendu vypočíta: None = hneď v plnom rozlíšení (je uložená,
+    alebo sa nežiada náhľad a rozpočet stačí), False = náhľad a plné rozlíšenie na pozadí, True = iba náhľad,
+    lebo rozpočet PU je nízky alebo celá mapa v plnom rozlíšení (všetky roky) do neho nevojde.
+    """
+    if cached_trend_map(years, month_start, month_end, geometry=geometry):
+        return None
+    degraded = pu_budget_low() or not can_afford_trend_map(years, month_start, month_end, geometry=geometry)
+    if not degraded and not progressive:
+        return None
+    return degraded
+
+
+def budget_exceeded_response(error):
+    """Odpoveď 429 pre požiadavku, ktorá by prekročila rozpočet processing units Sentinel Hub."""
+    app.logger.warning(f"Požiadavka odmietnutá pre rozpočet PU: {error}")
+    return jsonify({"error": "Rozpočet processing units pre Sentinel Hub je vyčerpaný. Skúste to neskôr.",
+                    "budget": pu_budget_status()}), 429
+
+
+# --- 3. DEFINOVANIE ENDPOINTOV (ROUTES) ---
 
 @app.route('/')
 def index():
@@ -31,36 +207,33 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/static/<path:path>')
-def send_static(path):
-    """Servíruje statické súbory (ako CSS, JS, a vygenerované obrázky)."""
-    return send_from_directory('static', path)
-
-
 @app.route('/api/plot', methods=['POST'])
 def plot():
     try:
         data = request.get_json()
         location = data.get('location')
+        payload_format, encoding, max_points, error = parse_payload_params(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        # Map location values to CSV filenames
-        location_map = {
-            'janka-krala': 'janka-krala.csv',
-            'nemocnicny': 'nemocnicny.csv',
-            'strky': 'strky.csv',
-            'druzba': 'druzba.csv',
-            'zahradkarska': 'zahradkarska.csv',
-            'kamenac': 'kamenac.csv',
-            'rybniky': 'rybniky.csv'
-        }
-
-        csv_file = location_map.get(location)
-        if not csv_file:
+        # Locations are the ids of the green areas in static/geojson that have chart data
+        area = green_areas.get(location)
+        if area is None or area.chart_csv is None:
             return jsonify({"error": "Neplatná lokalita"}), 400
 
         # Load NDVI data
-        csv_path = f'static/csv_interpol_lin/{csv_file}'
-        df = pd.read_csv(csv_path)
+        df = load_csv(area.chart_csv)
+        temp_df = load_csv('static/temperature_comparison.csv')
+        threshold_dates = onset_windows(temp_df)
+
+        if payload_format == 'columns':
+            # Kompaktný formát: spoločná os x, stĺpce hodnôt; štýl grafu dopĺňa main.js
+            return jsonify({
+                "ndvi": columnar(df['Obdobie'], {col: df[col] for col in df.columns[1:]}, encoding, max_points),
+                "temperature": columnar(temp_df['date'], {col: temp_df[col] for col in temp_df.columns[1:]},
+                                        encoding, max_points),
+                "threshold_dates": threshold_dates,
+            })
 
         ndvi_traces = []
         for year_col in df.columns[1:]:  # Skip first column (Obdobie)
@@ -75,27 +248,6 @@ def plot():
             )
             ndvi_traces.append(trace)
 
-        # Load temperature data
-        temp_df = pd.read_csv('static/temperature_comparison.csv')
-
-        # Find first occurrence of 5 consecutive days above 5°C for each year
-        temp_threshold = 5
-        days_threshold = 5
-        threshold_dates = {}
-
-        for year_col in temp_df.columns[1:]:  # Skip first column (date)
-            for i in range(len(temp_df) - days_threshold + 1):
-                # Check if 5 consecutive days are all >= 5°C
-                five_day_temps = temp_df[year_col].iloc[i:i + days_threshold]
-                if five_day_temps.min() >= temp_threshold:
-                    threshold_dates[year_col] = {
-                        'start_index': i,
-                        'end_index': i + days_threshold - 1,
-                        'start_date': temp_df['date'].iloc[i],
-                        'end_date': temp_df['date'].iloc[i + days_threshold - 1]
-                    }
-                    break
-
         temp_traces = []
         for year_col in temp_df.columns[1:]:  # Skip first column (date)
             trace = go.Scatter(
@@ -124,6 +276,39 @@ def plot():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/areas', methods=['GET'])
+def areas():
+    """
+    Zoznam zelených plôch s ich metadátami (bbox, plocha, ťažisko) a posledným vypočítaným trendom NDVI.
+    Voliteľné parametre: ?bbox=min_lon,min_lat,max_lon,max_lat (iba plochy zasahujúce do výrezu mapy), ?kind=park
+    """
+    kind = request.args.get('kind')
+    bbox = request.args.get('bbox')
+    if bbox is None:
+        found = green_areas.all(kind)
+    else:
+        try:
+            bbox = [float(value) for value in bbox.split(',')]
+        except ValueError:
+            bbox = None
+        if not bbox or len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            return jsonify({"error": "Parameter 'bbox' musí mať tvar min_lon,min_lat,max_lon,max_lat."}), 400
+        found = green_areas.in_bbox(bbox, kind)
+    return jsonify({"areas": [area_payload(area) for area in found]})
+
+
+@app.route('/api/areas/at', methods=['GET'])
+def areas_at():
+    """Zelené plochy, ktoré obsahujú zadaný bod (od najmenšej). Parametre: ?lat=48.37&lon=17.58[&kind=park]"""
+    try:
+        lat = float(request.args.get('lat', ''))
+        lon = float(request.args.get('lon', ''))
+    except ValueError:
+        return jsonify({"error": "Parametre 'lat' a 'lon' musia byť čísla."}), 400
+    found = green_areas.at(lon, lat, request.args.get('kind'))
+    return jsonify({"areas": [area_payload(area) for area in found]})
+
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
     """
@@ -134,58 +319,441 @@ def analyze():
         data = request.get_json()
         app.logger.info(f"Prijatá požiadavka na analýzu s dátami: {data}")
 
-        years = data.get('years')
-        season = data.get('season')
-
-        # --- Validácia vstupov ---
-        if not years or not isinstance(years, list) or len(years) < 2:
-            return jsonify({"error": "Je potrebné poskytnúť pole s aspoň dvoma rokmi."}), 400
-
-        if not season or season not in POLLEN_TO_MONTHS:
-            return jsonify({"error": f"Neplatné obdobie. Dostupné možnosti: {', '.join(POLLEN_TO_MONTHS.keys())}"}), 400
-
-        # Konvertujeme roky na celé čísla
-        try:
-            years = [int(y) for y in years]
-        except (ValueError, TypeError):
-            return jsonify({"error": "Pole 'years' musí obsahovať iba celé čísla."}), 400
+        years, season, error = parse_analysis_params(data.get('years'), data.get('season'))
+        if error:
+            return jsonify({"error": error}), 400
+        area, error = parse_area_params(data.get('area_id'), data.get('geometry'))
+        if error:
+            return jsonify({"error": error}), 400
+        geometry, name = area['geometry'], area['name']
+        query = f"years={','.join(map(str, years))}&season={season}{area['query']}"
 
         month_start, month_end = POLLEN_TO_MONTHS[season]
 
         app.logger.info(
-            f"Spúšťam generovanie mapy pre roky {years} a obdobie {season} ({month_start} - {month_end})...")
+            f"Spúšťam generovanie mapy pre roky {years} a obdobie {season} ({month_start} - {month_end}), "
+            f"oblasť {name}...")
 
         # --- Spustenie analýzy ---
         # Funkcia generate_trend_map je importovaná z long_term_analysis_trnava.py
-        image_path = generate_trend_map(years, month_start, month_end)
+        # V progresívnom režime sa najprv vráti náhľad v nízkom rozlíšení a plná mapa sa počíta na pozadí.
+        # Pri nízkom rozpočte PU, alebo ak celá mapa v plnom rozlíšení (všetky roky) do rozpočtu nevojde,
+        # sa nová mapa v plnom rozlíšení nepočíta vôbec, vráti sa iba náhľad. Rozhoduje sa pred prvým
+        # stiahnutím, aby sa PU neminuli na mapu, ktorú nie je možné dokončiť.
+        degraded = degraded_analysis(years, month_start, month_end, geometry, bool(data.get('progressive')))
+        if degraded is not None:
+            if not can_afford_trend_map(years, month_start, month_end, level='preview', geometry=geometry):
+                return budget_exceeded_response("náhľad mapy trendu nevojde do rozpočtu")
+            preview_path = generate_trend_map(years, month_start, month_end, level='preview', geometry=geometry,
+                                              name=name)
+            if preview_path and not degraded:
+                schedule_trend_map(years, month_start, month_end, geometry=geometry, name=name)
+                return jsonify({
+                    "image_url": to_url(preview_path),
+                    "level": "preview",
+                    "full_ready": False,
+                    "degraded": False,
+                    "status_url": f"/api/analyze/status?{query}",
+                })
+            if preview_path:
+                # Plné rozlíšenie sa nepočíta, takže nie je na čo čakať (bez 'status_url')
+                return jsonify({"image_url": to_url(preview_path), "level": "preview", "full_ready": False,
+                                "degraded": True})
+            if degraded:
+                app.logger.warning("Rozpočet PU na plnú mapu nestačí a náhľad sa nepodaril, mapa sa nepočíta.")
+                return jsonify({"error": "Rozpočet processing units pre Sentinel Hub je takmer vyčerpaný "
+                                         "a náhľad sa nepodarilo vytvoriť. Skúste to neskôr.",
+                                "budget": pu_budget_status()}), 503
+
+        image_path = generate_trend_map(years, month_start, month_end, geometry=geometry, name=name)
 
         if image_path:
             # Prevedieme cestu k súboru na URL, ktorú môže frontend použiť
-            # napr. 'static/output/map.png' -> '/static/output/map.png'
-            image_url = "/" + image_path.replace(os.path.sep, '/')
+            image_url = to_url(image_path)
             app.logger.info(f"Generovanie úspešné. Obrázok dostupný na: {image_url}")
-            return jsonify({"image_url": image_url})
+            return jsonify({
+                "image_url": image_url,
+                "level": "full",
+                "full_ready": True,
+                "degraded": False,
+                "zones_url": f"/api/analyze/zones?{query}",
+            })
         else:
             app.logger.error("Generovanie zlyhalo, nebol vrátený žiadny obrázok.")
             return jsonify({"error": "Nepodarilo sa vygenerovať mapu. Skontrolujte logy pre viac detailov."}), 500
 
+    except BudgetExceeded as e:
+        # Rozpočet minula súbežná požiadavka: radšej náhľad v nízkom rozlíšení (uložený alebo lacný nový)
+        preview_path = None
+        if can_afford_trend_map(years, month_start, month_end, level='preview', geometry=geometry):
+            try:
+                preview_path = generate_trend_map(years, month_start, month_end, level='preview',
+                                                  geometry=geometry, name=name)
+            except BudgetExceeded:
+                pass
+        if preview_path:
+            return jsonify({"image_url": to_url(preview_path), "level": "preview", "full_ready": False,
+                            "degraded": True})
+        return budget_exceeded_response(e)
     except Exception as e:
         app.logger.error(f"Nastala neočakávaná chyba v /api/analyze: {e}", exc_info=True)
         return jsonify({"error": f"Interná chyba servera: {e}"}), 500
 
 
+@app.route('/api/analyze/status', methods=['GET'])
+def analyze_status():
+    """
+    Vráti URL už vygenerovaných úrovní mapy trendu (náhľad a plné rozlíšenie)
+    a informáciu, či sa plné rozlíšenie ešte počíta.
+    Parametre: ?years=2023,2024&season=late_spring[&area=strky | &geometry_id=<hash>]
+    """
+    years, season, error = parse_analysis_params(request.args.get('years', '').split(','),
+                                                 request.args.get('season'))
+    if error:
+        return jsonify({"error": error}), 400
+    area, error = parse_area_params(request.args.get('area'), geometry_id=request.args.get('geometry_id'))
+    if error:
+        return jsonify({"error": error}), 400
+
+    month_start, month_end = POLLEN_TO_MONTHS[season]
+    levels = {}
+    for level in PYRAMID_LEVELS:
+        path = cached_trend_map(years, month_start, month_end, level, area['geometry'])
+        levels[level] = to_url(path) if path else None
+    return jsonify({
+        "levels": levels,
+        "full_ready": levels['full'] is not None,
+        "pending": is_trend_map_pending(years, month_start, month_end, geometry=area['geometry']),
+    })
+
+
+@app.route('/api/analyze/zones', methods=['GET'])
+def analyze_zones():
+    """
+    Štatistiky trendu pre jednotlivé parky (priemerný a mediánový sklon, podiel zlepšujúcich sa
+    a zhoršujúcich sa pixelov, počet platných pixelov) pre už vygenerovanú mapu trendu.
+    Parametre: ?years=2023,2024&season=late_spring[&level=preview][&area=strky | &geometry_id=<hash>]
+    """
+    years, season, error = parse_analysis_params(request.args.get('years', '').split(','),
+                                                 request.args.get('season'))
+    if error:
+        return jsonify({"error": error}), 400
+    area, error = parse_area_params(request.args.get('area'), geometry_id=request.args.get('geometry_id'))
+    if error:
+        return jsonify({"error": error}), 400
+    level = request.args.get('level', 'full')
+    if level not in PYRAMID_LEVELS:
+        return jsonify({"error": f"Neplatná úroveň. Dostupné možnosti: {', '.join(PYRAMID_LEVELS)}"}), 400
+
+    month_start, month_end = POLLEN_TO_MONTHS[season]
+    zones = trend_zones(years, month_start, month_end, level, area['geometry'])
+    if zones is None:
+        return jsonify({"error": "Mapa trendu pre tieto parametre ešte nebola vygenerovaná."}), 404
+    return jsonify(dict(zones, season=season, level=level))
+
+
+@app.route('/api/analyze/stream', methods=['GET'])
+def analyze_stream():
+    """
+    Spustí analýzu trendu a priebežne posiela jej stav ako Server-Sent Events
+    (stiahnutie každého roka, výpočet trendu, vykreslenie, výsledná URL).
+    Parametre: ?years=2023,2024&season=late_spring[&area=strky | &geometry_id=<hash>].
+    Ak sa klient odpojí, analýza sa zruší. Ak rozpočet PU na mapu v plnom rozlíšení nestačí,
+    pošle sa iba náhľad a udalosť 'degraded' a stream sa skončí.
+    """
+    years, season, error = parse_analysis_params(request.args.get('years', '').split(','),
+                                                 request.args.get('season'))
+    if error:
+        return jsonify({"error": error}), 400
+    area, error = parse_area_params(request.args.get('area'), geometry_id=request.args.get('geometry_id'))
+    if error:
+        return jsonify({"error": error}), 400
+    geometry, name = area['geometry'], area['name']
+
+    month_start, month_end = POLLEN_TO_MONTHS[season]
+    app.logger.info(f"Spúšťam streamovanú analýzu pre roky {years} a obdobie {season}...")
+
+    def run(job):
+        job.emit('start', years=years, season=season, total=len(years))
+        # Najprv rýchly náhľad v nízkom rozlíšení, potom plné rozlíšenie (ak naň rozpočet PU stačí)
+        degraded = degraded_analysis(years, month_start, month_end, geometry)
+        if degraded is not None:
+            if degraded and not can_afford_trend_map(years, month_start, month_end, level='preview',
+                                                     geometry=geometry):
+                job.emit('error', error="Rozpočet processing units pre Sentinel Hub je vyčerpaný. Skúste to neskôr.")
+                return
+            preview_path = generate_trend_map(years, month_start, month_end, level='preview', geometry=geometry,
+                                              name=name)
+            if preview_path:
+                job.emit('preview', image_url=to_url(preview_path))
+            if degraded:
+                if preview_path:
+                    job.emit('degraded', image_url=to_url(preview_path), budget=pu_budget_status())
+                else:
+                    job.emit('error', error="Rozpočet processing units pre Sentinel Hub je takmer vyčerpaný "
+                                            "a náhľad sa nepodarilo vytvoriť. Skúste to neskôr.")
+                return
+            job.check_cancelled()
+        image_path = generate_trend_map(years, month_start, month_end, job=job, geometry=geometry, name=name)
+        if image_path:
+            job.emit('done', image_url=to_url(image_path))
+        else:
+            job.emit('error', error="Nepodarilo sa vygenerovať mapu. Skontrolujte logy pre viac detailov.")
+
+    job = AnalysisJob(run, name=f"{season}:{','.join(map(str, years))}").start()
+    return Response(stream_with_context(job.events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/anomaly', methods=['POST'])
+def anomaly():
+    """
+    Porovná jeden rok s dlhodobým priemerom (klimatológiou) obdobia a vráti mapu odchýlok (z-skóre).
+    Telo: {"year": 2025, "season": "late_spring", "baseline_years": [2018, ..., 2024]}.
+    Voliteľné 'baseline_years' doplnia do klimatológie chýbajúce roky; inak sa použije uložená klimatológia.
+    """
+    try:
+        data = request.get_json()
+        season = data.get('season')
+        if not season or season not in POLLEN_TO_MONTHS:
+            return jsonify({"error": f"Neplatné obdobie. Dostupné možnosti: {', '.join(POLLEN_TO_MONTHS.keys())}"}), 400
+        try:
+            year = int(data.get('year'))
+            baseline_years = [int(y) for y in data.get('baseline_years') or []]
+        except (ValueError, TypeError):
+            return jsonify({"error": "Polia 'year' a 'baseline_years' musia obsahovať iba celé čísla."}), 400
+
+        if baseline_years:
+            update_baseline(season, baseline_years)
+
+        try:
+            result = anomaly_map(season, year)
+        except ValueError:
+            return jsonify({"error": f"Klimatológia obdobia {season} musí obsahovať aspoň {MIN_BASELINE_YEARS} "
+                                     f"iné roky ako {year}. Pošlite 'baseline_years'."}), 409
+        if result is None:
+            return jsonify({"error": f"Pre rok {year} nie sú dostupné dáta."}), 404
+
+        return jsonify({
+            "image_url": to_url(result['image_path']),
+            "year": year,
+            "season": season,
+            "baseline_years": result['baseline_years'],
+            "mean_z": result['mean_z'],
+            "share_below": result['share_below'],
+            "share_above": result['share_above'],
+        })
+
+    except BudgetExceeded as e:
+        return budget_exceeded_response(e)
+    except Exception as e:
+        app.logger.error(f"Nastala neočakávaná chyba v /api/anomaly: {e}", exc_info=True)
+        return jsonify({"error": f"Interná chyba servera: {e}"}), 500
+
+
+@app.route('/api/phenology', methods=['GET'])
+def phenology():
+    """
+    Vráti mapu začiatku vegetačného obdobia (green-up) pre každý pixel a jej porovnanie
+    s teplotným nástupom jari z grafu /api/plot. Parametre: ?year=2024&method=threshold|derivative
+    """
+    try:
+        try:
+            year = int(request.args.get('year', ''))
+        except ValueError:
+            return jsonify({"error": "Parameter 'year' musí byť celé číslo."}), 400
+        method = request.args.get('method', 'threshold')
+        if method not in PHENOLOGY_METHODS:
+            return jsonify({"error": f"Neplatná metóda. Dostupné možnosti: {', '.join(PHENOLOGY_METHODS)}"}), 400
+
+        result = phenology_map(year, method)
+        if result is None:
+            return jsonify({"error": f"Pre rok {year} nie sú dostupné dáta."}), 404
+
+        response = {key: value for key, value in result.items() if key not in ('image_path', 'rasters')}
+        response['image_url'] = to_url(result['image_path'])
+        return jsonify(response)
+
+    except BudgetExceeded as e:
+        return budget_exceeded_response(e)
+    except Exception as e:
+        app.logger.error(f"Nastala neočakávaná chyba v /api/phenology: {e}", exc_info=True)
+        return jsonify({"error": f"Interná chyba servera: {e}"}), 500
+
+
+@app.route('/api/correlation', methods=['GET'])
+def correlation_analysis():
+    """
+    Vráti krížové korelácie NDVI parkov, teploty a peľových koncentrácií pre posuny -max_lag..+max_lag dní
+    a oneskorenia nástupu vegetácie a peľovej sezóny za teplotným nástupom jari.
+    Parametre: ?max_lag=30&curves=1 (curves=1 pridá celé korelačné krivky)
+    """
+    try:
+        try:
+            max_lag = int(request.args.get('max_lag', CORRELATION_MAX_LAG))
+        except ValueError:
+            return jsonify({"error": "Parameter 'max_lag' musí byť celé číslo."}), 400
+        if not 0 <= max_lag <= 60:
+            return jsonify({"error": "Parameter 'max_lag' musí byť v rozsahu 0 až 60 dní."}), 400
+        curves = request.args.get('curves') == '1'
+
+        try:
+            result = correlation(max_lag)
+        except ValueError as e:
+            return jsonify({"error": f"Nedostatok spoločných dát: {e}"}), 400
+
+        if not curves:
+            result = dict(result)
+            result.pop('lags')
+            for pairs in ('ndvi_temperature', 'pollen_temperature', 'pollen_ndvi'):
+                result[pairs] = [{key: value for key, value in record.items() if key != 'curve'}
+                                 for record in result[pairs]]
+        return jsonify(result)
+
+    except Exception as e:
+        app.logger.error(f"Nastala neočakávaná chyba v /api/correlation: {e}", exc_info=True)
+        return jsonify({"error": f"Interná chyba servera: {e}"}), 500
+
+
+@app.route('/api/timeseries', methods=['GET'])
+def timeseries():
+    """
+    Vráti súčet, priemer a počet hodnôt denných časových radov v zvolenom okne dátumov
+    (napr. súčet teplotných stupňov GDD od 1. marca do 30. apríla pre každý rok).
+    Parametre: ?variable=temperature|gdd|pollen&start=03-01&end=04-30&series=2024,2025
+    'start' a 'end' sú dni v tvare MM-DD, rok sa volí parametrom 'series'. Okno so začiatkom po konci
+    prechádza cez Nový rok (napr. start=12-01&end=02-28); pri ročných radoch sa december berie
+    z predchádzajúceho roka. 'first_date' a 'last_date' sú v odpovedi tiež v tvare MM-DD.
+    """
+    try:
+        variable = request.args.get('variable', '')
+        if variable not in TIMESERIES_VARIABLES:
+            return jsonify({"error": f"Neplatná premenná. Dostupné možnosti: {', '.join(TIMESERIES_VARIABLES)}"}), 400
+        start = request.args.get('start', '')
+        end = request.args.get('end', '')
+        try:
+            window_key(start)
+            window_key(end)
+        except ValueError:
+            return jsonify({"error": "Parametre 'start' a 'end' musia byť dni v tvare MM-DD "
+                                     "(rok sa volí časovým radom, napr. series=2024)."}), 400
+
+        index = get_index(variable)
+        series = [label for label in request.args.get('series', '').split(',') if label]
+        unknown = [label for label in series if label not in index.labels]
+        if unknown:
+            return jsonify({"error": f"Neznáme časové rady: {', '.join(unknown)}. "
+                                     f"Dostupné možnosti: {', '.join(index.labels)}"}), 400
+
+        first_date, last_date, days = index.span(start, end)
+        return jsonify({
+            "variable": variable,
+            "start": start,
+            "end": end,
+            "first_date": first_date,
+            "last_date": last_date,
+            "days": days,
+            "series": index.query(start, end, series),
+        })
+
+    except Exception as e:
+        app.logger.error(f"Nastala neočakávaná chyba v /api/timeseries: {e}", exc_info=True)
+        return jsonify({"error": f"Interná chyba servera: {e}"}), 500
+
+
+@app.route('/api/gallery', methods=['GET'])
+def image_gallery():
+    """
+    Vráti stránku uložených RGB satelitných snímok parkov s URL zmenšenín vo formáte WebP.
+    Parametre: ?area=strky&year=2024&level=thumb|medium|full&offset=0&limit=60
+    """
+    try:
+        area_id = request.args.get('area') or None
+        if area_id is not None and area_id not in green_areas:
+            return jsonify({"error": "Neplatná lokalita"}), 400
+        level = request.args.get('level', 'thumb')
+        if level not in IMAGERY_LEVELS:
+            return jsonify({"error": f"Neplatná veľkosť. Dostupné možnosti: {', '.join(IMAGERY_LEVELS)}"}), 400
+        try:
+            year = int(request.args['year']) if request.args.get('year') else None
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', 60))
+        except ValueError:
+            return jsonify({"error": "Parametre 'year', 'offset' a 'limit' musia byť celé čísla."}), 400
+        if offset < 0 or not 1 <= limit <= 500:
+            return jsonify({"error": "Parameter 'offset' musí byť nezáporný a 'limit' v rozsahu 1 až 500."}), 400
+
+        total, entries = gallery(area_id, year, level, offset, limit)
+        items = []
+        for entry in entries:
+            item = {key: value for key, value in entry.items() if key not in ('path', 'paths', 'fetched_at')}
+            # Kým sa zmenšeniny generujú na pozadí, URL je null a klient sa môže opýtať znova
+            item['url'] = to_url(entry['path']) if entry['path'] else None
+            item['urls'] = {name: to_url(path) for name, path in entry['paths'].items()}
+            items.append(item)
+        return jsonify({"total": total, "offset": offset, "limit": limit, "items": items})
+
+    except Exception as e:
+        app.logger.error(f"Nastala neočakávaná chyba v /api/gallery: {e}", exc_info=True)
+        return jsonify({"error": f"Interná chyba servera: {e}"}), 500
+
+
+@app.route('/api/budget', methods=['GET'])
+def budget():
+    """
+    Stav rozpočtu processing units (PU) Sentinel Hub: spotreba a zostatok celej aplikácie za mesiac
+    a volajúceho klienta za deň, a či sa výsledky pre nízky zostatok zjednodušujú ('low').
+    """
+    try:
+        return jsonify(pu_budget_status())
+    except Exception as e:
+        app.logger.error(f"Nastala neočakávaná chyba v /api/budget: {e}", exc_info=True)
+        return jsonify({"error": f"Interná chyba servera: {e}"}), 500
+
+
 @app.route('/api/current_pollen', methods=['GET'])
 def current_pollen():
-    """API endpoint na získanie aktuálnych dát o peľových koncentráciách."""
+    """
+    API endpoint na získanie aktuálnych dát o peľových koncentráciách zo skladu source/pollen_store.py.
+    Parametre: ?start=2025-03-01&end=2025-04-30&taxa=Lieska,Breza&station=default
+               &format=plotly|columns&encoding=json|f32&max_points=200
+    """
     try:
-        # Cesta k súboru s aktuálnymi dátami
-        data_file = 'static/pollenAverageLoads.csv'
+        payload_format, encoding, max_points, error = parse_payload_params(request.args)
+        if error:
+            return jsonify({"error": error}), 400
 
-        if not os.path.exists(data_file):
+        start = request.args.get('start') or None
+        end = request.args.get('end') or None
+        try:
+            first, last = (date.fromisoformat(day) if day else None for day in (start, end))
+        except ValueError:
+            return jsonify({"error": "Parametre 'start' a 'end' musia byť dátumy v tvare YYYY-MM-DD."}), 400
+        if first and last and first > last:
+            return jsonify({"error": "Začiatok obdobia musí byť pred jeho koncom."}), 400
+
+        if not os.path.exists(POLLEN_CSV):
             return jsonify({"error": "Súbor s aktuálnymi dátami nebol nájdený."}), 404
 
-        # Načítanie dát zo súboru
-        df = pd.read_csv(data_file)
+        # Pri zmene CSV súboru sa dáta znovu načítajú do skladu, inak sa súbor nečíta
+        pollen_store.sync(POLLEN_CSV)
+
+        station = request.args.get('station', DEFAULT_STATION)
+        stations = pollen_store.stations()
+        if station not in stations:
+            return jsonify({"error": f"Neznáma stanica. Dostupné možnosti: {', '.join(stations)}"}), 400
+        available = pollen_store.taxa(station)
+        taxa = [taxon for taxon in request.args.get('taxa', '').split(',') if taxon] or None
+        unknown = [taxon for taxon in taxa or [] if taxon not in available]
+        if unknown:
+            return jsonify({"error": f"Neznáme taxóny: {', '.join(unknown)}. "
+                                     f"Dostupné možnosti: {', '.join(available)}"}), 400
+
+        df = pollen_store.query(first and first.isoformat(), last and last.isoformat(), taxa, station)
+
+        if payload_format == 'columns':
+            return jsonify({"pollen": columnar(df['date'], {col: df[col] for col in df.columns[1:]}, encoding,
+                                               max_points)})
 
         pollen = []
 
@@ -209,7 +777,7 @@ def current_pollen():
         return jsonify({"error": f"Interná chyba servera: {e}"}), 500
 
 
-# --- 3. SPUSTENIE SERVERA ---
+# --- 4. SPUSTENIE SERVERA ---
 
 if __name__ == '__main__':
     # Spustenie Flask servera v debug móde pre jednoduchší vývoj
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Production server: preloads the Flask app and serves it from several worker processes.
+
+The parent process imports ``manage.app`` once, warms the shared cache with the
+parsed datasets, opens the listening socket and forks the workers. Each worker
+serves requests from that socket with a threaded WSGI server. Parsed CSVs and
+computed trend maps are stored in the SQLite cache (``source/shared_cache.py``),
+so a result computed by one worker is a cache hit for all others. Dead workers
+are restarted; SIGINT/SIGTERM stops all of them.
+
+Usage:
+
+    python3 serve.py                           # 4 workers on 127.0.0.1:5001
+    python3 serve.py --workers 8 --host 0.0.0.0 --port 8000
+    python3 serve.py --warm                    # also precompute common trend maps at night
+
+Defaults can also be set with SERVE_WORKERS, SERVE_HOST, SERVE_PORT and CACHE_WARMER.
+The cache warmer (``source/cache_warmer.py``) runs in its own forked process,
+so there is one warmer however many workers serve requests, and the parent stays
+free of threads: restarted workers are forked from it without inheriting locks
+held by the warmer.
+Linux/macOS only (uses fork).
+"""
+
+import argparse
+import glob
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+
+from decouple import config
+from werkzeug.serving import make_server
+
+logger = logging.getLogger('serve')
+
+SERVE_WORKERS = config('SERVE_WORKERS', default=4, cast=int)
+SERVE_HOST = config('SERVE_HOST', default='127.0.0.1')
+SERVE_PORT = config('SERVE_PORT', default=5001, cast=int)
+
+# Datasets read by the API; parsed once in the parent so that workers start with a warm cache
+PRELOAD_CSV = ['static/temperature_comparison.csv', 'static/pollenAverageLoads.csv'] + sorted(
+    glob.glob('static/csv_interpol_lin/*.csv'))
+
+
+def preload():
+    """Imports the app and fills the shared cache with the parsed datasets."""
+    from manage import app
+    from source.shared_cache import cache, load_csv
+
+    for path in PRELOAD_CSV:
+        load_csv(path)
+    cache.purge_expired()
+    logger.info(f"Preloaded {len(PRELOAD_CSV)} datasets into the shared cache")
+    return app
+
+
+def run_worker(app, sock):
+    """Worker process: serves requests from the inherited listening socket."""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = make_server(SERVE_HOST, SERVE_PORT, app, threaded=True, fd=sock.fileno())
+    logger.info(f"Worker {os.getpid()} ready")
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def spawn(app, sock):
+    pid = os.fork()
+    if pid == 0:
+        run_worker(app, sock)
+    return pid
+
+
+def run_warmer(sock):
+    """Warmer process: precomputes common trend maps once a day in the off-peak window."""
+    from source.cache_warmer import run_scheduled
+
+    sock.close()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    logger.info(f"Cache warmer {os.getpid()} ready")
+    try:
+        run_scheduled(stop)
+    finally:
+        os._exit(0)
+
+
+def spawn_warmer(sock):
+    pid = os.fork()
+    if pid == 0:
+        run_warmer(sock)
+    return pid
+
+
+def main(argv=None):
+    global SERVE_HOST, SERVE_PORT
+    parser = argparse.ArgumentParser(description='Serve the application with several worker processes.')
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='Number of worker processes.')
+    parser.add_argument('--host', default=SERVE_HOST)
+    parser.add_argument('--port', type=int, default=SERVE_PORT)
+    parser.add_argument('--warm', action='store_true', help='Precompute common trend maps in the off-peak window.')
+    args = parser.parse_args(argv)
+    SERVE_HOST, SERVE_PORT = args.host, args.port
+
+    logging.basicConfig(level=logging.INFO)
+    app = preload()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    workers = {spawn(app, sock) for _ in range(args.workers)}
+    logger.info(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    # A process of its own, not a thread: workers restarted below are forked from this process
+    from source.cache_warmer import CACHE_WARMER
+    warmer = spawn_warmer(sock) if args.warm or CACHE_WARMER else None
+
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in workers | ({warmer} if warmer else set()):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Supervise: restart workers and the warmer when they die unexpectedly
+    while workers or warmer:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == warmer:
+            warmer = None
+            if not stopping:
+                logger.warning(f"Cache warmer {pid} exited with status {status}, restarting")
+                warmer = spawn_warmer(sock)
+            continue
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            workers.add(spawn(app, sock))
+
+    sock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
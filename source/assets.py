@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Static asset pipeline: content fingerprints, precompressed variants and cache validators.
+
+``python -m source.assets build`` hashes every file in ``static/`` (except the
+generated ``static/output``) and writes, to ``ASSETS_DIR``:
+
+    manifest.json           {"js/main.js": {"hash": "3f2a9c1b0d", "mtime_ns": ..., "size": ...}, ...}
+    <path>.gz / <path>.br   precompressed variants of the text assets (.br needs the optional brotli package)
+
+At runtime ``init_assets(app)`` replaces Flask's static route (endpoint ``static``):
+
+- ``url_for('static', filename='js/main.js')`` returns the fingerprinted URL ``/static/js/main.3f2a9c1b0d.js``,
+- fingerprinted URLs are served with ``Cache-Control: public, max-age=31536000, immutable``,
+- scene files of ``source/imagery.py`` (content-addressed) are immutable as well,
+- other files (including ``static/output``) get ``Cache-Control: no-cache`` and an ETag, so browsers
+  revalidate them and receive ``304 Not Modified`` while the file is unchanged,
+- a precompressed variant is sent when the client accepts it and the variant belongs to the current file.
+
+Files that changed after the last build are hashed on first use (and served without precompressed
+variants), so a missing or stale manifest never serves outdated content.
+
+Usage (from the project root):
+
+    python -m source.assets build
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from decouple import config
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STATIC_DIR = 'static'
+ASSETS_DIR = config('ASSETS_DIR', default='cache/assets')
+
+# Generated artifacts: names are reused for new content, so they are revalidated instead of fingerprinted
+OUTPUT_DIR = 'output'
+
+# Content-addressed directories (the file name is the content hash), served as immutable like fingerprinted URLs
+CONTENT_ADDRESSED_DIRS = ('output/imagery/scenes/',)
+
+TEXT_EXTENSIONS = ('.css', '.csv', '.geojson', '.html', '.js', '.json', '.svg', '.txt')
+
+# Precompressed variants smaller than this share of the original are kept
+MIN_SAVING = 0.9
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Files hashed at runtime (changed since the build) that are remembered
+MAX_HASHED = 1024
+
+HASH_LENGTH = 10
+_FINGERPRINT = re.compile(rf'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{{{HASH_LENGTH}}})(?P<ext>\.[^./]+)$')
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def fingerprinted(filename, file_hash):
+    """'js/main.js' -> 'js/main.<hash>.js'."""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{file_hash}{ext}"
+
+
+def _is_output(filename):
+    return filename == OUTPUT_DIR or filename.startswith(OUTPUT_DIR + '/')
+
+
+# --- 1. BUILD ---
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR, assets_dir=ASSETS_DIR):
+    """Hashes the static files, writes the precompressed variants and the manifest. Returns the manifest."""
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if not _is_output(os.path.relpath(os.path.join(root, d), static_dir)))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_dir).replace(os.path.sep, '/')
+            stat = os.stat(path)
+            entry = {'hash': content_hash(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'encodings': []}
+
+            if name.endswith(TEXT_EXTENSIONS):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                variants = {'gzip': ('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))}
+                if brotli is not None:
+                    variants['br'] = ('.br', lambda: brotli.compress(data, quality=11))
+                for encoding, (suffix, compress) in variants.items():
+                    compressed = compress()
+                    if len(compressed) < MIN_SAVING * len(data):
+                        _write_atomic(os.path.join(assets_dir, filename + suffix), compressed)
+                        entry['encodings'].append(encoding)
+            manifest[filename] = entry
+
+    _write_atomic(os.path.join(assets_dir, 'manifest.json'),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+# --- 2. RUNTIME ---
+
+class AssetManifest:
+    """Fingerprints of the static files: from the built manifest, or hashed on first use if the file changed."""
+
+    def __init__(self, static_dir=STATIC_DIR, assets_dir=ASSETS_DIR):
+        self.static_dir = static_dir
+        self.assets_dir = assets_dir
+        self._built = (None, {})
+        self._hashed = {}
+        self._lock = threading.Lock()
+
+    def _manifest(self):
+        # Re-read after every build, so running servers pick up new variants without a restart
+        path = os.path.join(self.assets_dir, 'manifest.json')
+        try:
+            version = os.stat(path).st_mtime_ns
+        except OSError:
+            version = None
+        if version != self._built[0]:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._built = (version, json.load(f))
+            except (OSError, ValueError):
+                self._built = (version, {})
+        return self._built[1]
+
+    def entry(self, filename):
+        """Returns {'hash', 'encodings'} of the current file, or None if it does not exist."""
+        path = safe_join(self.static_dir, filename)
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            return None
+        if stat is None or not os.path.isfile(path):
+            return None
+
+        built = self._manifest().get(filename)
+        if built and (built['mtime_ns'], built['size']) == (stat.st_mtime_ns, stat.st_size):
+            return built
+        # Changed since the build: hash it once per version of the file, without precompressed variants
+        key = (filename, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._hashed.get(key)
+        if entry is None:
+            entry = {'hash': content_hash(path), 'encodings': []}
+            with self._lock:
+                # Generated maps keep getting new versions; old entries are dropped now and then
+                if len(self._hashed) >= MAX_HASHED:
+                    self._hashed.clear()
+                self._hashed[key] = entry
+        return entry
+
+    def url_filename(self, filename):
+        """Filename to use in URLs: fingerprinted unless it is a generated artifact or does not exist."""
+        if _is_output(filename):
+            return filename
+        entry = self.entry(filename)
+        return fingerprinted(filename, entry['hash']) if entry else filename
+
+    def resolve(self, requested):
+        """Maps a requested filename to (real filename, entry, immutable)."""
+        match = _FINGERPRINT.match(requested)
+        if match:
+            filename = match['stem'] + match['ext']
+            entry = self.entry(filename)
+            if entry is not None:
+                # An outdated fingerprint still gets the current file, but must not be cached forever
+                return filename, entry, entry['hash'] == match['hash']
+        return requested, self.entry(requested), requested.startswith(CONTENT_ADDRESSED_DIRS)
+
+
+def _accepted_variant(entry, filename, assets_dir):
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in entry['encodings'] and request.accept_encodings[encoding]:
+            path = os.path.join(assets_dir, filename + suffix)
+            if os.path.exists(path):
+                return encoding, path
+    return None, None
+
+
+def init_assets(app, static_dir=STATIC_DIR, assets_dir=ASSETS_DIR):
+    """Registers the static route (endpoint 'static') and fingerprinted url_for; the app needs static_folder=None."""
+    manifest = AssetManifest(static_dir, assets_dir)
+    app.extensions['assets'] = manifest
+
+    @app.url_defaults
+    def _fingerprint_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.url_filename(values['filename'])
+
+    @app.route('/static/<path:filename>', endpoint='static')
+    def static_file(filename):
+        """Servíruje statické súbory a vygenerované obrázky s hlavičkami pre cache."""
+        real_filename, entry, immutable = manifest.resolve(filename)
+        if entry is None:
+            abort(404)
+        path = safe_join(static_dir, real_filename)
+
+        encoding, variant = _accepted_variant(entry, real_filename, assets_dir)
+        # Without max_age, send_file marks the response no-cache (revalidate on every use)
+        response = send_file(variant or path, mimetype=_mimetype(real_filename), etag=False, conditional=False,
+                             max_age=IMMUTABLE_MAX_AGE if immutable else None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # The ETag names the content of the original file and the encoding it is sent in
+        response.set_etag(f"{entry['hash']}-{encoding}" if encoding else entry['hash'])
+        if immutable:
+            response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+
+def _mimetype(filename):
+    if filename.endswith('.geojson'):
+        return 'application/geo+json'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+# --- 3. COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress the static assets.')
+    parser.add_argument('command', choices=['build'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        manifest = build()
+        compressed = sum(1 for entry in manifest.values() if entry['encodings'])
+        print(f"✅ {len(manifest)} files fingerprinted, {compressed} precompressed into {ASSETS_DIR}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
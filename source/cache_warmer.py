@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Cache warmer: precomputes the trend maps that users ask for most often.
+
+The matrix is every season of ``POLLEN_TO_MONTHS`` × the year ranges of
+``CACHE_WARM_SPANS`` (the last N years, ``all`` = every year since
+``CACHE_WARM_FIRST_YEAR``). Ranges end with the current year once the season has
+started, otherwise with the previous year. Jobs run in priority order: shorter
+spans first (the UI preselects the last two years), and within a span the
+current season first, then the seasons that started before it. Trend maps that
+are already in the shared cache are skipped, and the downloaded NDVI layers go
+to the datacube, so a warm run only downloads what is missing or expired.
+
+The warmer stops when the processing unit budget runs low (``source/pu_budget.py``),
+so users keep the rest of it, and a run inside the off-peak window
+(``CACHE_WARM_HOURS``, local time) stops when the window ends. Runs are serialized
+with a file lock, so a cron run and the in-process thread never overlap.
+
+Usage (from the project root), e.g. from cron at night:
+
+    python -m source.cache_warmer                         # warm the whole matrix now
+    python -m source.cache_warmer --list                  # print the matrix in priority order
+    python -m source.cache_warmer --seasons late_spring --spans 2,3 --levels preview,full
+
+In the server, ``serve.py --warm`` (or ``CACHE_WARMER=True``) runs ``run_scheduled()``
+in a separate process, once a day inside the off-peak window. ``start_warmer()``
+runs the same loop as a background thread of a single-process server.
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from decouple import Csv, config
+
+from source import pu_budget
+from source.long_term_analysis_trnava import POLLEN_TO_MONTHS, PYRAMID_LEVELS, cached_trend_map, generate_trend_map
+from source.shared_cache import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Start the background thread in serve.py
+CACHE_WARMER = config('CACHE_WARMER', default=False, cast=bool)
+
+# Year ranges to precompute: numbers of years ending with the latest year, or 'all'
+CACHE_WARM_SPANS = config('CACHE_WARM_SPANS', default='2,3,5,all', cast=Csv())
+CACHE_WARM_SEASONS = config('CACHE_WARM_SEASONS', default=','.join(POLLEN_TO_MONTHS), cast=Csv())
+CACHE_WARM_LEVELS = config('CACHE_WARM_LEVELS', default='full', cast=Csv())
+
+# First year offered by the UI (static/js/main.js)
+CACHE_WARM_FIRST_YEAR = config('CACHE_WARM_FIRST_YEAR', default=2017, cast=int)
+
+# Off-peak window of the background thread, local hours 'start-end' (end exclusive, may wrap past midnight)
+CACHE_WARM_HOURS = config('CACHE_WARM_HOURS', default='2-6')
+
+# Seconds between checks of the background thread whether it is time to run
+CACHE_WARM_POLL = config('CACHE_WARM_POLL', default=600, cast=int)
+
+LOCK_PATH = 'cache/cache_warmer'
+
+
+# --- 1. MATRIX ---
+
+def latest_year(season, today):
+    """The current year once the season has started, otherwise the previous one."""
+    month, day = (int(part) for part in POLLEN_TO_MONTHS[season][0].split('-'))
+    return today.year if (today.month, today.day) >= (month, day) else today.year - 1
+
+
+def season_order(seasons, today):
+    """Seasons ordered by priority: the one that started last (the current one) first, then the earlier ones."""
+    def started(season):
+        month, day = (int(part) for part in POLLEN_TO_MONTHS[season][0].split('-'))
+        start = date(latest_year(season, today), month, day)
+        return (today - start).days
+
+    return sorted(seasons, key=started)
+
+
+def warm_matrix(spans=CACHE_WARM_SPANS, seasons=CACHE_WARM_SEASONS, first_year=CACHE_WARM_FIRST_YEAR, today=None):
+    """List of (years, season) in priority order; ranges with fewer than two years are left out."""
+    today = today or date.today()
+    ordered_spans = sorted(spans, key=lambda span: (span == 'all', int(span) if span != 'all' else 0))
+    jobs = []
+    for span in ordered_spans:
+        for season in season_order(seasons, today):
+            last = latest_year(season, today)
+            first = first_year if span == 'all' else max(first_year, last - int(span) + 1)
+            years = list(range(first, last + 1))
+            if len(years) >= 2 and (years, season) not in jobs:
+                jobs.append((years, season))
+    return jobs
+
+
+# --- 2. WARMING ---
+
+def warm(jobs=None, levels=CACHE_WARM_LEVELS, deadline=None, stop=None):
+    """
+    Generates the missing trend maps of `jobs` (default: warm_matrix()) at the given pyramid levels.
+    Stops at `deadline` (epoch seconds), when `stop` (threading.Event) is set or when the processing unit
+    budget runs low. Returns counts of computed, fresh (skipped) and failed maps and the reason it stopped.
+    """
+    jobs = warm_matrix() if jobs is None else jobs
+    result = {'computed': 0, 'fresh': 0, 'failed': 0, 'stopped': None}
+    with file_lock(LOCK_PATH):
+        for years, season in jobs:
+            month_start, month_end = POLLEN_TO_MONTHS[season]
+            for level in levels:
+                if cached_trend_map(years, month_start, month_end, level):
+                    result['fresh'] += 1
+                    continue
+
+                if stop is not None and stop.is_set():
+                    result['stopped'] = 'stopped'
+                elif deadline is not None and time.time() >= deadline:
+                    result['stopped'] = 'off-peak window ended'
+                elif pu_budget.is_low():
+                    result['stopped'] = 'processing unit budget is low'
+                if result['stopped']:
+                    logger.info(f"Cache warming stopped: {result['stopped']}")
+                    return result
+
+                logger.info(f"Warming trend map {season} {years[0]}-{years[-1]} ({level})")
+                try:
+                    path = generate_trend_map(years, month_start, month_end, level=level)
+                except pu_budget.BudgetExceeded as e:
+                    result['stopped'] = str(e)
+                    logger.info(f"Cache warming stopped: {e}")
+                    return result
+                except Exception as e:
+                    logger.error(f"Warming {season} {years} ({level}) failed: {e}", exc_info=True)
+                    path = None
+                result['computed' if path else 'failed'] += 1
+    return result
+
+
+# --- 3. SCHEDULING ---
+
+def parse_hours(text):
+    """'2-6' -> (2, 6)."""
+    start, end = (int(part) for part in text.split('-', 1))
+    return start, end
+
+
+def window_end(now, hours=CACHE_WARM_HOURS):
+    """End of the off-peak window containing `now` (datetime), or None if `now` is outside of it."""
+    start, end = parse_hours(hours)
+    inside = start <= now.hour < end if start <= end else (now.hour >= start or now.hour < end)
+    if not inside:
+        return None
+    end_time = now.replace(hour=end, minute=0, second=0, microsecond=0)
+    return end_time if end_time > now else end_time + timedelta(days=1)
+
+
+def run_scheduled(stop, hours=CACHE_WARM_HOURS, poll=CACHE_WARM_POLL):
+    """Loop of the background thread: one warm run per day inside the off-peak window, until `stop` is set."""
+    last_run = None
+    while not stop.is_set():
+        now = datetime.now()
+        end = window_end(now, hours)
+        if end is not None and last_run != now.date():
+            last_run = now.date()
+            try:
+                result = warm(deadline=end.timestamp(), stop=stop)
+                logger.info(f"Cache warming finished: {result}")
+            except Exception as e:
+                logger.error(f"Cache warming failed: {e}", exc_info=True)
+        stop.wait(poll)
+
+
+def start_warmer(hours=CACHE_WARM_HOURS, poll=CACHE_WARM_POLL):
+    """Starts the background warming thread; returns the Event that stops it."""
+    stop = threading.Event()
+    threading.Thread(target=run_scheduled, args=(stop, hours, poll), name='cache-warmer', daemon=True).start()
+    logger.info(f"Cache warmer scheduled daily between {hours} h")
+    return stop
+
+
+# --- 4. COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute the common trend maps into the shared cache.')
+    parser.add_argument('--seasons', type=Csv(), default=CACHE_WARM_SEASONS, help='Comma-separated seasons.')
+    parser.add_argument('--spans', type=Csv(), default=CACHE_WARM_SPANS,
+                        help="Comma-separated numbers of years, or 'all'.")
+    parser.add_argument('--levels', type=Csv(), default=CACHE_WARM_LEVELS,
+                        help=f"Comma-separated pyramid levels ({', '.join(PYRAMID_LEVELS)}).")
+    parser.add_argument('--list', action='store_true', help='Only print the matrix in priority order.')
+    args = parser.parse_args(argv)
+
+    unknown = [season for season in args.seasons if season not in POLLEN_TO_MONTHS]
+    unknown += [level for level in args.levels if level not in PYRAMID_LEVELS]
+    unknown += [span for span in args.spans if span != 'all' and not span.isdigit()]
+    if unknown:
+        parser.error(f"Unknown values: {', '.join(unknown)}")
+
+    jobs = warm_matrix(args.spans, args.seasons)
+    if args.list:
+        for years, season in jobs:
+            print(f"{season:<13} {years[0]}-{years[-1]}")
+        return 0
+
+    logging.basicConfig(level=logging.INFO)
+    result = warm(jobs, args.levels)
+    print(f"✅ {result['computed']} trend maps computed, {result['fresh']} already fresh, {result['failed']} failed"
+          + (f" (stopped: {result['stopped']})" if result['stopped'] else ''))
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
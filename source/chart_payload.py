@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Compact columnar chart payloads for the ``/api/plot`` and ``/api/current_pollen`` charts.
+
+Instead of a list of Plotly traces (each repeating the styling and the full x axis),
+a chart is sent as one shared x axis and one numeric column per series; styling is
+applied by ``static/js/main.js``:
+
+    {
+        "x": ["2024-01-15", "2024-01-16", ...],
+        "encoding": "json",                                  # or "f32"
+        "series": [
+            {"name": "Rok 2020", "y": [1.2, 3.4, null, ...]},
+            {"name": "Rok 2021", "y": "AACAPwAAAEA...", "index": [0, 5, ...]},
+            ...
+        ]
+    }
+
+- ``encoding="f32"`` sends every column as base64 of little-endian float32 values (NaN stays NaN),
+  ``"json"`` as a list of numbers with ``null`` for missing values,
+- with ``max_points`` each series is downsampled with LTTB (``source.kernels.lttb``); ``index`` then
+  gives the positions of its values on ``x``, which only keeps the points used by some series.
+"""
+
+import base64
+
+import numpy as np
+
+from source.kernels import lttb
+
+PAYLOAD_ENCODINGS = ('json', 'f32')
+
+# Fewer points per series would not show a curve
+MIN_POINTS = 3
+
+
+def encode_column(values, encoding='json'):
+    """Encodes a float column as a JSON list (NaN -> None) or base64 little-endian float32."""
+    values = np.asarray(values, dtype=np.float64)
+    if encoding == 'f32':
+        return base64.b64encode(values.astype('<f4').tobytes()).decode('ascii')
+    return [None if not np.isfinite(value) else float(value) for value in values]
+
+
+def downsample(values, max_points):
+    """Indices of at most `max_points` points of the column that keep its shape (missing values are dropped)."""
+    valid = np.flatnonzero(np.isfinite(values))
+    if len(valid) <= max_points:
+        return valid
+    return valid[lttb(valid, values[valid], max_points)]
+
+
+def columnar(x, columns, encoding='json', max_points=None):
+    """
+    Builds the payload of one chart: `x` are the shared x values, `columns` a dict
+    {series name: values of the same length as `x`}. Raises ValueError for an unknown
+    encoding or `max_points` below MIN_POINTS.
+    """
+    if encoding not in PAYLOAD_ENCODINGS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    if max_points is not None and max_points < MIN_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_POINTS}")
+
+    x = list(x)
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    if max_points is None or all(len(values) <= max_points for values in columns.values()):
+        return {
+            'x': x,
+            'encoding': encoding,
+            'series': [{'name': name, 'y': encode_column(values, encoding)} for name, values in columns.items()],
+        }
+
+    selected = {name: downsample(values, max_points) for name, values in columns.items()}
+    # Only the x values used by at least one series are sent
+    used = np.unique(np.concatenate(list(selected.values()) or [np.zeros(0, dtype=np.intp)]))
+    return {
+        'x': [x[i] for i in used],
+        'encoding': encoding,
+        'series': [{
+            'name': name,
+            'y': encode_column(columns[name][idx], encoding),
+            'index': np.searchsorted(used, idx).tolist(),
+        } for name, idx in selected.items()],
+    }
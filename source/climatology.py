@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Per-pixel NDVI climatology (multi-year baseline) and single-year anomaly maps.
+
+For every season of ``POLLEN_TO_MONTHS`` the baseline keeps, per pixel, the
+number of valid years, the running mean and the sum of squared deviations
+(Welford's algorithm). Adding a year only needs that year's raster, so the
+baseline is updated incrementally and never re-downloads years it already
+contains. An anomaly map then needs a single download (the target year):
+``z = (ndvi - mean) / std``. If the target year is part of the baseline, it is
+removed from the statistics before the comparison. The raster each year
+contributed is stored with the baseline, so exactly that sample is removed,
+even after the year's layer in the datacube has been refreshed.
+
+Baselines are stored as ``.npz`` files in ``CLIMATOLOGY_DIR``; updates are
+serialized with a file lock, so several worker processes can share them.
+
+Usage (from the project root):
+
+    python -m source.climatology late_spring --years 2018-2024      # build / extend the baseline
+    python -m source.climatology late_spring --anomaly 2025         # z-score map of one year
+"""
+
+import argparse
+import os
+import sys
+from datetime import date
+
+import numpy as np
+from decouple import config
+from matplotlib.colors import LinearSegmentedColormap
+
+from source.fetch_backend import get_backend
+from source.long_term_analysis_trnava import (
+    AOI_GEOMETRY,
+    OUTPUT_SIZE,
+    POLLEN_TO_MONTHS,
+    TREND_CACHE_TTL,
+    get_ndvi_for_year,
+    save_map_image,
+    sh_config
+)
+from source.shared_cache import cache, file_lock
+
+CLIMATOLOGY_DIR = config('CLIMATOLOGY_DIR', default='cache/climatology')
+
+# Pixels with fewer valid baseline years have no z-score
+MIN_BASELINE_YEARS = 2
+
+# Color scale of the anomaly map is fixed to ±ANOMALY_VLIM standard deviations
+ANOMALY_VLIM = 3.0
+
+
+# --- 1. BASELINE STORAGE ---
+
+def baseline_path(season, size=OUTPUT_SIZE):
+    return os.path.join(CLIMATOLOGY_DIR, f"{season}_{size[0]}x{size[1]}.npz")
+
+
+def load_baseline(season, size=OUTPUT_SIZE):
+    """
+    Returns the stored baseline as a dict (years, count, mean, m2, layers: {year: raster added}),
+    or None if it does not exist yet.
+    """
+    path = baseline_path(season, size)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {
+            'years': [int(year) for year in data['years']],
+            'count': data['count'],
+            'mean': data['mean'],
+            'm2': data['m2'],
+            # Baselines written before the layers were kept have none
+            'layers': {int(name[len('layer_'):]): data[name] for name in data.files if name.startswith('layer_')},
+        }
+
+
+def _save_baseline(season, baseline, size=OUTPUT_SIZE):
+    path = baseline_path(season, size)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    layers = {f"layer_{year}": raster for year, raster in baseline['layers'].items()}
+    np.savez_compressed(tmp_path, years=np.array(baseline['years'], dtype=np.int32), count=baseline['count'],
+                        mean=baseline['mean'], m2=baseline['m2'], **layers)
+    os.replace(tmp_path, path)
+
+
+def _empty_baseline(shape):
+    return {
+        'years': [],
+        'count': np.zeros(shape, dtype=np.int32),
+        'mean': np.zeros(shape, dtype=np.float64),
+        'm2': np.zeros(shape, dtype=np.float64),
+        'layers': {},
+    }
+
+
+# --- 2. INCREMENTAL STATISTICS ---
+
+def add_year(baseline, year, ndvi):
+    """Adds one year's raster to the baseline in place (Welford update of valid pixels) and keeps the raster."""
+    ndvi = np.asarray(ndvi, dtype=np.float32)
+    valid = np.isfinite(ndvi)
+    x = ndvi[valid]
+    count = baseline['count'][valid] + 1
+    mean = baseline['mean'][valid]
+    delta = x - mean
+    new_mean = mean + delta / count
+    baseline['m2'][valid] += delta * (x - new_mean)
+    baseline['mean'][valid] = new_mean
+    baseline['count'][valid] = count
+    baseline['layers'][year] = ndvi
+    baseline['years'] = sorted(baseline['years'] + [year])
+
+
+def remove_year(baseline, year):
+    """
+    Returns a copy of the baseline without `year` (inverse Welford update with the raster the year added).
+    Raises KeyError if the baseline does not keep that raster.
+    """
+    ndvi = baseline['layers'][year]
+    result = {
+        'years': [y for y in baseline['years'] if y != year],
+        'count': baseline['count'].copy(),
+        'mean': baseline['mean'].copy(),
+        'm2': baseline['m2'].copy(),
+        'layers': {y: raster for y, raster in baseline['layers'].items() if y != year},
+    }
+    valid = np.isfinite(ndvi) & (result['count'] > 0)
+    x = ndvi[valid]
+    count = result['count'][valid] - 1
+    mean = result['mean'][valid]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        new_mean = np.where(count > 0, mean - (x - mean) / count, 0.0)
+    m2 = np.where(count > 0, result['m2'][valid] - (x - new_mean) * (x - mean), 0.0)
+    result['count'][valid] = count
+    result['mean'][valid] = new_mean
+    # Rounding can leave tiny negative values
+    result['m2'][valid] = np.maximum(m2, 0.0)
+    return result
+
+
+def baseline_std(baseline):
+    """Per-pixel sample standard deviation; NaN where fewer than MIN_BASELINE_YEARS years are valid."""
+    count = baseline['count']
+    std = np.full(count.shape, np.nan)
+    enough = count >= MIN_BASELINE_YEARS
+    std[enough] = np.sqrt(baseline['m2'][enough] / (count[enough] - 1))
+    return std
+
+
+def update_baseline(season, years, size=OUTPUT_SIZE, rebuild=False):
+    """
+    Extends the season's baseline with the given years; only years that are not in it yet are downloaded.
+    With `rebuild`, the baseline is built anew from `years` (layers already in the datacube are not downloaded).
+    Returns the updated baseline (None if there is no baseline and no year could be downloaded).
+    """
+    if get_backend().requires_credentials and not sh_config.sh_client_id:
+        raise Exception("Configuration error: Sentinel Hub Client ID is not set.")
+
+    month_start, month_end = POLLEN_TO_MONTHS[season]
+    path = baseline_path(season, size)
+    with file_lock(path):
+        baseline = None if rebuild else load_baseline(season, size)
+        known = set(baseline['years']) if baseline else set()
+        missing = sorted(set(years) - known)
+        if not missing:
+            return baseline
+
+        added = 0
+        for year in missing:
+            ndvi = get_ndvi_for_year(year, month_start, month_end, sh_config, AOI_GEOMETRY, size)
+            if ndvi is None or np.isnan(ndvi).all():
+                print(f"Warning: Year {year} has no data and was not added to the {season} baseline.")
+                continue
+            if baseline is None:
+                baseline = _empty_baseline(ndvi.shape)
+            add_year(baseline, year, ndvi)
+            added += 1
+
+        if added:
+            _save_baseline(season, baseline, size)
+            print(f"Baseline {season} now contains years {baseline['years']}.")
+        return baseline
+
+
+# --- 3. ANOMALY MAPS ---
+
+def anomaly_cache_key(season, year, baseline_years, size=OUTPUT_SIZE):
+    years = ','.join(str(y) for y in baseline_years)
+    return f"anomaly:{season}:{year}:{years}:{size[0]}x{size[1]}"
+
+
+def anomaly_map(season, year, size=OUTPUT_SIZE):
+    """
+    Compares one year with the stored baseline of the season and renders the z-score map.
+    Returns a dict (image_path, baseline_years, mean_z, share_below, share_above), or None if the
+    target year has no data. Raises ValueError if the baseline has fewer than MIN_BASELINE_YEARS
+    years other than the target year.
+    """
+    baseline = load_baseline(season, size)
+    if baseline and year in baseline['years'] and year not in baseline['layers']:
+        # Baselines stored before the per-year rasters were kept cannot remove a year exactly
+        print(f"Rebuilding the {season} baseline to keep the raster of every year...")
+        baseline = update_baseline(season, baseline['years'], size, rebuild=True)
+    baseline_years = [y for y in (baseline['years'] if baseline else []) if y != year]
+    if len(baseline_years) < MIN_BASELINE_YEARS:
+        raise ValueError(f"The {season} baseline needs at least {MIN_BASELINE_YEARS} years other than {year}.")
+
+    key = anomaly_cache_key(season, year, baseline_years, size)
+    cached = cache.get(key)
+    if cached is not None and os.path.exists(cached['image_path']):
+        return cached
+
+    if get_backend().requires_credentials and not sh_config.sh_client_id:
+        raise Exception("Configuration error: Sentinel Hub Client ID is not set.")
+
+    month_start, month_end = POLLEN_TO_MONTHS[season]
+    ndvi = get_ndvi_for_year(year, month_start, month_end, sh_config, AOI_GEOMETRY, size)
+    if ndvi is None or np.isnan(ndvi).all():
+        return None
+
+    # The target year must not be compared with a baseline that contains it
+    if year in baseline['years']:
+        baseline = remove_year(baseline, year)
+
+    std = baseline_std(baseline)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (ndvi - baseline['mean']) / std
+    z[~np.isfinite(z)] = np.nan
+
+    print("Creating and saving anomaly map...")
+    cmap_anomaly = LinearSegmentedColormap.from_list("anomaly_map", [(0, "saddlebrown"), (0.5, "white"), (1, "green")])
+    filename = f"anomaly_map_{season}_{year}_vs_{baseline_years[0]}-{baseline_years[-1]}_{len(baseline_years)}y.png"
+    image_path = save_map_image(z, filename, cmap_anomaly, ANOMALY_VLIM, "NDVI anomaly (standard deviations)",
+                                f"NDVI Anomaly in Trnava {year} vs. {baseline_years[0]}-{baseline_years[-1]} ({season})")
+    print(f"✅ Anomaly map successfully saved as: {image_path}")
+
+    valid = np.isfinite(z)
+    result = {
+        'image_path': image_path,
+        'baseline_years': baseline_years,
+        'mean_z': float(z[valid].mean()) if valid.any() else None,
+        # Share of pixels more than 2 standard deviations below / above normal
+        'share_below': float((z[valid] < -2).mean()) if valid.any() else None,
+        'share_above': float((z[valid] > 2).mean()) if valid.any() else None,
+    }
+    # A running year's layer is refreshed in the datacube, so its anomaly map must expire as well
+    cache.set(key, result, ttl=TREND_CACHE_TTL if year >= date.today().year else None)
+    return result
+
+
+# --- 4. COMMAND LINE ---
+
+def parse_years(text):
+    """'2018-2024' or '2018,2020,2022' -> list of years."""
+    if '-' in text:
+        first, last = (int(part) for part in text.split('-', 1))
+        return list(range(first, last + 1))
+    return [int(part) for part in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build NDVI climatology baselines and anomaly maps.')
+    parser.add_argument('season', choices=sorted(POLLEN_TO_MONTHS), help='Season from POLLEN_TO_MONTHS.')
+    parser.add_argument('--years', type=parse_years, help="Baseline years, e.g. '2018-2024' or '2018,2020'.")
+    parser.add_argument('--anomaly', type=int, help='Render the anomaly map of this year.')
+    args = parser.parse_args(argv)
+
+    if args.years:
+        update_baseline(args.season, args.years)
+    if args.anomaly:
+        result = anomaly_map(args.season, args.anomaly)
+        if result is None:
+            print(f"No data for year {args.anomaly}.")
+            return 1
+        print(f"Mean z-score {result['mean_z']:.2f}, below -2σ: {result['share_below']:.1%}, "
+              f"above +2σ: {result['share_above']:.1%}")
+    if not args.years and not args.anomaly:
+        baseline = load_baseline(args.season)
+        print(f"Baseline {args.season}: {baseline['years'] if baseline else 'not built yet'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
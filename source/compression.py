@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Response compression (brotli or gzip) for the Flask app.
+
+JSON and text responses larger than ``COMPRESS_MIN_SIZE`` bytes are compressed
+according to the client's ``Accept-Encoding``. Brotli is used when the optional
+``brotli`` package is installed and the client accepts it, gzip otherwise.
+Streamed responses (server-sent events, files) are left alone.
+
+    from source.compression import init_compression
+
+    init_compression(app)
+"""
+
+import gzip
+
+from decouple import config
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Smaller responses are sent uncompressed; the saving would not pay for the CPU time
+COMPRESS_MIN_SIZE = config('COMPRESS_MIN_SIZE', default=1024, cast=int)
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/javascript', 'text/html', 'text/css', 'text/plain',
+                          'image/svg+xml')
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None, from the client's Accept-Encoding (werkzeug MIMEAccept-like object)."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def init_compression(app):
+    """Registers the compression hook on the Flask app."""
+
+    @app.after_request
+    def _compress(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
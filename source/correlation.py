@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-correlation of park NDVI, air temperature and pollen loads.
+
+The three datasets behind the dashboard charts use different time axes:
+
+- ``static/csv_interpol_lin/<area id>.csv``: park NDVI per half-month period (``Feb 1-14`` ... ``Jul 15-31``),
+  one column per year,
+- ``static/temperature_comparison.csv``: daily mean temperature, one column per year, all on one calendar,
+- ``static/pollenAverageLoads.csv``: average daily pollen load per taxon (multi-year average, no year axis).
+
+All series are put on one daily calendar (day of a non-leap year, 29 February is dropped);
+NDVI is placed at the middle of each period and interpolated linearly between them.
+Correlations use the days covered by all three datasets. The analysis then runs as a
+few batched NumPy operations over all parks x years x lags at once:
+
+1. lagged Pearson correlations (``source.kernels.lagged_correlation``) of NDVI vs. temperature,
+   pollen vs. temperature and pollen vs. NDVI for lags of -``CORRELATION_MAX_LAG``..+``CORRELATION_MAX_LAG`` days,
+2. onsets: green-up of every park and year (``source.kernels.season_metrics``), the temperature onset of
+   every year (as in ``/api/plot``) and the start of each pollen season (``POLLEN_SEASON_SHARE`` of the
+   annual load reached), and the lags between them.
+
+Results are cached in the shared cache until one of the input files (or the set of parks) changes.
+
+Usage (from the project root):
+
+    python -m source.correlation
+    python -m source.correlation --max-lag 20
+"""
+
+import argparse
+import calendar
+import hashlib
+import sys
+from datetime import date
+
+import numpy as np
+from decouple import config
+
+from source.green_areas import registry as green_areas
+from source.kernels import find_onsets, lagged_correlation, season_metrics
+from source.phenology import ONSET_DAYS, ONSET_THRESHOLD, TEMPERATURE_CSV, doy_to_date
+from source.shared_cache import cache, file_version, load_csv
+
+POLLEN_CSV = 'static/pollenAverageLoads.csv'
+
+# Largest lag (days) in both directions
+CORRELATION_MAX_LAG = config('CORRELATION_MAX_LAG', default=30, cast=int)
+
+# The pollen season starts when this share of the annual load has been reached
+POLLEN_SEASON_SHARE = 0.05
+
+# Non-leap calendar the series are aligned on
+CALENDAR_YEAR = 2001
+DAYS = 365
+
+
+def calendar_doy(month, day):
+    """Day of the common (non-leap) calendar year; None for 29 February."""
+    if not calendar.isleap(CALENDAR_YEAR) and (month, day) == (2, 29):
+        return None
+    return date(CALENDAR_YEAR, month, day).timetuple().tm_yday
+
+
+def period_mid_doy(period):
+    """Middle of an NDVI chart period such as 'Mar 15-31' as a (fractional) calendar day."""
+    month_name, days = period.split()
+    month = list(calendar.month_abbr).index(month_name)
+    first, last = (int(day) for day in days.split('-'))
+    return calendar_doy(month, first) + (last - first) / 2
+
+
+# --- 1. ALIGNMENT ---
+
+def _daily(dates, values):
+    """Places (..., len(dates)) values of ISO dates on the calendar: a (..., DAYS) array, NaN on days without data."""
+    daily = np.full(values.shape[:-1] + (DAYS,), np.nan)
+    for i, text in enumerate(dates):
+        day = date.fromisoformat(text)
+        doy = calendar_doy(day.month, day.day)
+        if doy is not None:
+            daily[..., doy - 1] = values[..., i]
+    return daily
+
+
+def _interpolate_daily(mid_doy, values):
+    """Linear interpolation of (..., periods) values at `mid_doy` to a (..., DAYS) array, NaN outside the periods."""
+    days = np.arange(1, DAYS + 1, dtype=np.float64)
+    i = np.clip(np.searchsorted(mid_doy, days, side='right') - 1, 0, len(mid_doy) - 2)
+    weight = (days - mid_doy[i]) / (mid_doy[i + 1] - mid_doy[i])
+    daily = values[..., i] * (1 - weight) + values[..., i + 1] * weight
+    daily[..., (days < mid_doy[0]) | (days > mid_doy[-1])] = np.nan
+    return daily
+
+
+def data_version():
+    """Changes whenever one of the input CSV files or the set of parks changes."""
+    paths = [TEMPERATURE_CSV, POLLEN_CSV] + [area.chart_csv for area in _parks()]
+    parts = [green_areas.version] + [f"{path}={file_version(path)}" for path in paths]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def _parks():
+    return [area for area in green_areas.all('park') if area.chart_csv]
+
+
+def load_series():
+    """
+    Returns the aligned datasets as a dict:
+    `parks`, `years`, `taxa`, `ndvi` (parks, years, DAYS), `ndvi_periods` ((parks, years, periods) values
+    and the periods' calendar days), `temperature` (years, DAYS) and `pollen` (taxa, DAYS).
+    """
+    temp_df = load_csv(TEMPERATURE_CSV)
+    parks = _parks()
+    park_frames = [load_csv(area.chart_csv) for area in parks]
+
+    # Years present in the temperature data and in every park's NDVI data
+    years = sorted(int(column.split()[1]) for column in temp_df.columns if column.startswith('Rok '))
+    years = [year for year in years if all(f'Rok {year}' in df.columns for df in park_frames)]
+    columns = [f'Rok {year}' for year in years]
+
+    mid_doy = np.array([period_mid_doy(period) for period in park_frames[0]['Obdobie']]) if parks else np.zeros(0)
+    ndvi_periods = np.array([df[columns].to_numpy(dtype=np.float64).T for df in park_frames]).reshape(
+        len(parks), len(years), len(mid_doy))
+
+    pollen_df = load_csv(POLLEN_CSV)
+    taxa = list(pollen_df.columns[1:])
+    return {
+        'parks': parks,
+        'years': years,
+        'taxa': taxa,
+        'ndvi': _interpolate_daily(mid_doy, ndvi_periods) if len(mid_doy) > 1 else np.full(
+            (len(parks), len(years), DAYS), np.nan),
+        'ndvi_periods': (ndvi_periods, mid_doy),
+        'temperature': _daily(temp_df['date'], temp_df[columns].to_numpy(dtype=np.float64).T),
+        'pollen': _daily(pollen_df['date'], pollen_df[taxa].to_numpy(dtype=np.float64).T),
+    }
+
+
+# --- 2. ANALYSIS ---
+
+def _onsets(series):
+    """Temperature onset, green-up and pollen season start as calendar days (NaN where there is none)."""
+    ndvi_periods, mid_doy = series['ndvi_periods']
+    n_parks, n_years, n_periods = ndvi_periods.shape
+    if n_periods > 1 and n_parks and n_years:
+        green_up, _, _ = season_metrics(ndvi_periods.reshape(-1, n_periods).T, mid_doy)
+        green_up = green_up.reshape(n_parks, n_years)
+    else:
+        green_up = np.full((n_parks, n_years), np.nan)
+
+    onset_idx = find_onsets(series['temperature'], ONSET_THRESHOLD, ONSET_DAYS)
+    temperature = np.where(onset_idx >= 0, onset_idx + 1.0, np.nan)
+
+    pollen = np.nan_to_num(series['pollen'])
+    total = pollen.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reached = np.cumsum(pollen, axis=-1) / total >= POLLEN_SEASON_SHARE
+    pollen_start = np.where(total[..., 0] > 0, reached.argmax(axis=-1) + 1.0, np.nan)
+    return green_up, temperature, pollen_start
+
+
+def _best(curves, max_lag):
+    """(best lag, best r, r at lag 0) of (..., lags) correlation curves; NaN curves give NaN."""
+    finite = np.isfinite(curves).any(axis=-1)
+    best = np.argmax(np.where(np.isfinite(curves), curves, -np.inf), axis=-1)
+    best_r = np.take_along_axis(curves, best[..., None], axis=-1)[..., 0]
+    return np.where(finite, best - max_lag, np.nan), np.where(finite, best_r, np.nan), curves[..., max_lag]
+
+
+def _number(value, digits=3):
+    return None if not np.isfinite(value) else round(float(value), digits)
+
+
+def _pairs(curves, max_lag, keys):
+    """One record per series pair; `keys` is a list of (field, labels) for the leading axes of `curves`."""
+    best_lag, best_r, r0 = _best(curves, max_lag)
+    records = []
+    for index in np.ndindex(curves.shape[:-1]):
+        record = {field: labels[i] for (field, labels), i in zip(keys, index)}
+        record.update({
+            'best_lag': None if np.isnan(best_lag[index]) else int(best_lag[index]),
+            'best_r': _number(best_r[index]),
+            'r_at_0': _number(r0[index]),
+            'curve': [_number(r) for r in curves[index]],
+        })
+        records.append(record)
+    return records
+
+
+def compute_correlation(max_lag=CORRELATION_MAX_LAG):
+    """
+    Runs the whole analysis on the current data. Returns a dict with the calendar window,
+    the lagged correlations of each series pair (with the full curve per pair), the onsets
+    and the onset lags. Raises ValueError if the common window is too short for `max_lag`.
+    """
+    series = load_series()
+    parks = [area.id for area in series['parks']]
+    years, taxa = series['years'], series['taxa']
+    ndvi, temperature, pollen = series['ndvi'], series['temperature'], series['pollen']
+
+    # Days for which each dataset has data (pairs with gaps inside the window get no correlation)
+    covered = (np.isfinite(ndvi).any(axis=(0, 1)) & np.isfinite(temperature).any(axis=0)
+               & np.isfinite(pollen).any(axis=0))
+    window = np.flatnonzero(covered)
+    if len(window) == 0 or len(window) - 2 * max_lag < 2:
+        raise ValueError(f"The common calendar of the datasets is too short for lags up to {max_lag} days.")
+    days = slice(window[0], window[-1] + 1)
+
+    # Positive lag: the first series follows the second one
+    ndvi_temperature = lagged_correlation(ndvi[..., days], temperature[..., days], max_lag)
+    pollen_temperature = lagged_correlation(pollen[:, None, days], temperature[..., days], max_lag)
+    pollen_ndvi = lagged_correlation(pollen[:, None, None, days], ndvi[..., days], max_lag)
+
+    green_up, temperature_onset, pollen_start = _onsets(series)
+    green_up_lag = green_up - temperature_onset
+    pollen_lag = pollen_start[:, None] - temperature_onset
+
+    def to_date(doy):
+        return doy_to_date(CALENDAR_YEAR, doy) if np.isfinite(doy) else None
+
+    return {
+        'version': data_version(),
+        'parks': [{'id': area.id, 'name': area.name} for area in series['parks']],
+        'years': years,
+        'taxa': taxa,
+        'calendar': {'start': to_date(window[0] + 1), 'end': to_date(window[-1] + 1), 'days': len(window)},
+        'max_lag': max_lag,
+        'lags': list(range(-max_lag, max_lag + 1)),
+        'ndvi_temperature': _pairs(ndvi_temperature, max_lag, [('park', parks), ('year', years)]),
+        'pollen_temperature': _pairs(pollen_temperature, max_lag, [('taxon', taxa), ('year', years)]),
+        'pollen_ndvi': _pairs(pollen_ndvi, max_lag, [('taxon', taxa), ('park', parks), ('year', years)]),
+        'onsets': {
+            'temperature': {str(year): to_date(doy) for year, doy in zip(years, temperature_onset)},
+            'green_up': {park: {str(year): to_date(doy) for year, doy in zip(years, row)}
+                         for park, row in zip(parks, green_up)},
+            'pollen': {taxon: to_date(doy) for taxon, doy in zip(taxa, pollen_start)},
+        },
+        # Positive: the onset comes that many days after the temperature onset of the year
+        'onset_lags': {
+            'green_up': [{'park': park, 'year': year, 'days': _number(green_up_lag[i, j], 1)}
+                         for i, park in enumerate(parks) for j, year in enumerate(years)],
+            'pollen': [{'taxon': taxon, 'year': year, 'days': _number(pollen_lag[i, j], 1)}
+                       for i, taxon in enumerate(taxa) for j, year in enumerate(years)],
+        },
+    }
+
+
+def correlation(max_lag=CORRELATION_MAX_LAG):
+    """Cached `compute_correlation`; recomputed when the data version changes."""
+    return cache.get_or_compute(f"correlation:{max_lag}", lambda: compute_correlation(max_lag), data_version())
+
+
+# --- 3. COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cross-correlation of park NDVI, temperature and pollen loads.')
+    parser.add_argument('--max-lag', type=int, default=CORRELATION_MAX_LAG, help='Largest lag in days.')
+    args = parser.parse_args(argv)
+
+    try:
+        result = correlation(args.max_lag)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Common calendar: {result['calendar']['start']} to {result['calendar']['end']} "
+          f"({result['calendar']['days']} days), lags ±{result['max_lag']} days")
+    for record in result['ndvi_temperature']:
+        print(f"NDVI {record['park']} {record['year']} vs. temperature: best lag {record['best_lag']} days "
+              f"(r = {record['best_r']})")
+    for record in result['onset_lags']['green_up']:
+        print(f"Green-up {record['park']} {record['year']}: {record['days']} days after the temperature onset")
+    for record in result['onset_lags']['pollen']:
+        print(f"Pollen {record['taxon']} vs. temperature onset {record['year']}: {record['days']} days")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,52 @@
+"""
+Creates the GeoJSON files of the green areas in static/geojson.
+
+Two modes (run from the project root):
+
+    python -m source.createGeojson <fileName> [--longlat | --latlong]
+        Paste the coordinates of one polygon; writes static/geojson/<fileName>.geojson.
+
+    python -m source.createGeojson import <input>... [--tolerance 1.0] [--id-field id] [--name-field name]
+                                       [--kind park] [--layer LAYER] [--out static/geojson] [--replace]
+        Batch import of multi-feature GeoJSON, GeoPackage or Shapefile inputs. Features are read one at a
+        time, reprojected to WGS84, simplified within --tolerance metres and validated. Each polygon is
+        written as a compact <id>.geojson. Areas whose id already exists in the output directory are
+        skipped, or replaced with --replace. The combined _index.geojson is then rebuilt from every area
+        file of the directory. The registry skips files starting with '_', so the index is not loaded twice.
+
+GeoPackage and Shapefile inputs need the optional fiona package; GeoJSON is read without it.
+"""
+
+import argparse
+import glob
 import json
+import math
+import os
+import re
 import sys
+import unicodedata
+
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+from shapely.geometry import mapping, shape
+
+from source.green_areas import GEOJSON_DIR, METERS_PER_DEGREE, load_areas, polygon_error
+
+try:
+    import fiona
+except ImportError:  # optional dependency
+    fiona = None
+
+# Simplification tolerance in metres: 1 m keeps the shape of a park and drops most surveyed vertices
+DEFAULT_TOLERANCE = 1.0
+
+# Coordinates are rounded to 1e-7 degrees (about 1 cm)
+COORDINATE_GRID = 1e-7
+
+INDEX_FILE = '_index.geojson'
+
+WGS84 = CRS.from_epsg(4326)
 
 
 def main(fileName='output', longLat=True):
@@ -34,14 +81,229 @@ def main(fileName='output', longLat=True):
         json.dump(geojson_output, geojsonFile, indent=4)
 
 
+# --- BATCH IMPORT ---
+
+def read_features(path, layer=None):
+    """Returns (CRS, iterator of (properties, shapely geometry)); features are read one at a time with fiona."""
+    if fiona is not None:
+        source = fiona.open(path, layer=layer)
+        crs = CRS.from_user_input(source.crs_wkt) if source.crs_wkt else WGS84
+
+        def records():
+            with source:
+                for record in source:
+                    geometry = record['geometry']
+                    yield dict(record['properties'] or {}), shape(geometry) if geometry else None
+
+        return crs, records()
+
+    if not path.lower().endswith(('.geojson', '.json')):
+        raise ValueError(f"Reading {path} needs the fiona package (only GeoJSON is supported without it)")
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    # RFC 7946 GeoJSON is WGS84; older files may name another CRS
+    crs_name = ((data.get('crs') or {}).get('properties') or {}).get('name')
+    crs = CRS.from_user_input(crs_name) if crs_name else WGS84
+    features = data.get('features', []) if data.get('type') == 'FeatureCollection' else [data]
+    return crs, ((feature.get('properties') or {}, shape(feature['geometry']) if feature.get('geometry') else None)
+                 for feature in features)
+
+
+def to_wgs84(geometry, transformer):
+    if transformer is None:
+        return geometry
+    return shapely.transform(geometry, lambda coords: np.column_stack(transformer.transform(coords[:, 0],
+                                                                                           coords[:, 1])))
+
+
+def simplify(polygon, tolerance):
+    """Simplifies a WGS84 polygon within `tolerance` metres (local equirectangular projection)."""
+    scale = np.array([METERS_PER_DEGREE * math.cos(math.radians(polygon.centroid.y)), METERS_PER_DEGREE])
+    projected = shapely.transform(polygon, lambda coords: coords * scale)
+    simplified = shapely.simplify(projected, tolerance, preserve_topology=True)
+    return shapely.set_precision(shapely.transform(simplified, lambda coords: coords / scale), COORDINATE_GRID)
+
+
+def slugify(text):
+    """'Park Janka Kráľa' -> 'park-janka-krala'."""
+    ascii_text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', ascii_text.lower()).strip('-')
+
+
+def _compact(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _area_files(out_dir):
+    """GeoJSON files of the areas in `out_dir`, in the registry's order (files starting with '_' are skipped)."""
+    return [path for path in sorted(glob.glob(os.path.join(out_dir, '*.geojson')))
+            if not os.path.basename(path).startswith('_')]
+
+
+def _feature(area):
+    return {
+        'type': 'Feature',
+        'properties': {'id': area.id, 'name': area.name, 'kind': area.kind},
+        'geometry': mapping(area.polygon),
+    }
+
+
+def write_index(out_dir=GEOJSON_DIR):
+    """Rebuilds INDEX_FILE from every area file in `out_dir`; returns the number of areas in it."""
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    tmp_index = f"{index_path}.{os.getpid()}.tmp"
+    written = set()
+    try:
+        # The index is streamed file by file, so memory does not grow with the number of areas
+        with open(tmp_index, 'w', encoding='utf-8') as index:
+            index.write('{"type":"FeatureCollection","features":[')
+            for path in _area_files(out_dir):
+                for area in load_areas(path):
+                    # The registry keeps the first area of a duplicate id, so does the index
+                    if area.id in written:
+                        continue
+                    index.write((',' if written else '') + _compact(_feature(area)))
+                    written.add(area.id)
+            index.write(']}')
+        os.replace(tmp_index, index_path)
+    except BaseException:
+        if os.path.exists(tmp_index):
+            os.remove(tmp_index)
+        raise
+    return len(written)
+
+
+def import_areas(paths, out_dir=GEOJSON_DIR, tolerance=DEFAULT_TOLERANCE, id_field='id', name_field='name',
+                 kind='park', layer=None, replace=False):
+    """
+    Imports the polygons of all `paths` into `out_dir` (one compact file per area) and rebuilds INDEX_FILE.
+    An area whose id already exists in `out_dir` is skipped, or replaces the existing one if `replace` is set.
+    Returns counts of imported, replaced and skipped features and of vertices before and after simplification.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    result = {'imported': 0, 'replaced': 0, 'skipped': 0, 'vertices_in': 0, 'vertices_out': 0}
+
+    # Existing area id -> its file, and the file names in use (a file's stem need not be the id of its area)
+    existing = {}
+    files = {}
+    for path in _area_files(out_dir):
+        areas = load_areas(path)
+        files[os.path.splitext(os.path.basename(path))[0]] = path
+        for area in areas:
+            existing.setdefault(area.id, (path, len(areas)))
+    used_ids = set()
+
+    for path in paths:
+        crs, features = read_features(path, layer)
+        transformer = None if crs == WGS84 else Transformer.from_crs(crs, WGS84, always_xy=True)
+        stem = slugify(os.path.splitext(os.path.basename(path))[0])
+        for i, (properties, geometry) in enumerate(features):
+            label = f"{path} #{i}"
+            if geometry is None:
+                print(f"Skipping {label}: no geometry")
+                result['skipped'] += 1
+                continue
+            polygon = to_wgs84(shapely.force_2d(geometry), transformer)
+            if not polygon.is_valid:
+                polygon = shapely.make_valid(polygon)
+                if polygon.geom_type == 'GeometryCollection':
+                    polygon = shapely.union_all([part for part in polygon.geoms
+                                                 if part.geom_type in ('Polygon', 'MultiPolygon')])
+            simplified = simplify(polygon, tolerance)
+            error = polygon_error(simplified)
+            if error:
+                print(f"Skipping {label}: {error}")
+                result['skipped'] += 1
+                continue
+
+            name = properties.get(name_field) or properties.get(id_field) or f"{stem}-{i}"
+            area_id = slugify(properties.get(id_field) or name) or f"{stem}-{i}"
+            # Areas of this run with the same id are numbered, as they are different features
+            unique_id, n = area_id, 2
+            while unique_id in used_ids:
+                unique_id, n = f"{area_id}-{n}", n + 1
+            used_ids.add(unique_id)
+
+            old_path, old_count = existing.get(unique_id, (None, 0))
+            if old_path and not replace:
+                print(f"Skipping {label}: area {unique_id} already exists in {old_path} (use --replace)")
+                result['skipped'] += 1
+                continue
+            if old_path and old_count > 1:
+                print(f"Skipping {label}: area {unique_id} is one of {old_count} areas in {old_path}")
+                result['skipped'] += 1
+                continue
+            out_path = os.path.join(out_dir, f"{unique_id}.geojson")
+            if unique_id in files and files[unique_id] != old_path:
+                # The file name is taken by other areas (e.g. a multi-area file); never overwrite it
+                print(f"Skipping {label}: {files[unique_id]} holds other areas")
+                result['skipped'] += 1
+                continue
+
+            feature = {
+                'type': 'Feature',
+                'properties': {'id': unique_id, 'name': str(name), 'kind': properties.get('kind') or kind},
+                'geometry': mapping(simplified),
+            }
+            _write_atomic(out_path, _compact({'type': 'FeatureCollection', 'features': [feature]}))
+            if old_path:
+                # The replaced area may live in a file named differently from its id
+                if os.path.abspath(old_path) != os.path.abspath(out_path):
+                    os.remove(old_path)
+                result['replaced'] += 1
+
+            result['imported'] += 1
+            result['vertices_in'] += shapely.get_num_coordinates(polygon)
+            result['vertices_out'] += shapely.get_num_coordinates(simplified)
+    write_index(out_dir)
+    return result
+
+
+def import_main(argv):
+    parser = argparse.ArgumentParser(prog='python -m source.createGeojson import',
+                                     description='Import green areas from GeoJSON, GeoPackage or Shapefile files.')
+    parser.add_argument('inputs', nargs='+', help='Input files.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Simplification tolerance in metres (default {DEFAULT_TOLERANCE}, 0 = none).')
+    parser.add_argument('--id-field', default='id', help='Property with the area id (default: slug of the name).')
+    parser.add_argument('--name-field', default='name', help='Property with the area name.')
+    parser.add_argument('--kind', default='park', help="Kind of areas without a 'kind' property.")
+    parser.add_argument('--layer', help='Layer of a multi-layer input (GeoPackage).')
+    parser.add_argument('--out', default=GEOJSON_DIR, help=f'Output directory (default {GEOJSON_DIR}).')
+    parser.add_argument('--replace', action='store_true',
+                        help='Replace areas whose id already exists in the output directory (default: skip them).')
+    args = parser.parse_args(argv)
+
+    try:
+        result = import_areas(args.inputs, args.out, args.tolerance, args.id_field, args.name_field, args.kind,
+                              args.layer, args.replace)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"✅ {result['imported']} areas imported into {args.out} ({result['replaced']} replaced, "
+          f"{result['skipped']} skipped), "
+          f"{result['vertices_in']} -> {result['vertices_out']} vertices")
+    return 0
+
+
 if __name__ == '__main__':
     argv = sys.argv
+    if len(argv) > 1 and argv[1] == 'import':
+        sys.exit(import_main(argv[2:]))
     if len(argv) == 1:
         main()
         sys.exit()
     if argv[1] == '--help':
         print(
-            'Usage: python createGeojson.py <fileName> [--longlat | --latlong]\n'
+            'Usage: python -m source.createGeojson <fileName> [--longlat | --latlong]\n'
+            '       python -m source.createGeojson import <input>... [options]  (see import --help)\n'
             '--longlat: Enter coordinates in longitude, latitude order.\n'
             '--latlong: Enter coordinates in latitude, longitude order.'
         )
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent NDVI datacube (time x y x x) stored as compressed chunks on disk.
+
+Every downloaded raster becomes one time layer of a cube, so later analyses
+read it from disk instead of the network. Analyses read the cube lazily, one
+spatial chunk (all requested layers of a ``DATACUBE_CHUNK`` x ``DATACUBE_CHUNK``
+tile) at a time, so multi-year full-resolution work needs memory for a single
+tile only.
+
+The directory layout follows the Zarr v2 format, so a cube can be opened with
+``zarr.open(path)`` (or xarray) for ad-hoc inspection without this module:
+
+    <DATACUBE_DIR>/<name>/.zarray      shape, chunks (1, C, C), dtype <f4, shuffle filter, zlib compressor
+    <DATACUBE_DIR>/<name>/.zattrs      dimension names, time labels and fetch times
+    <DATACUBE_DIR>/<name>/<t>.<y>.<x>  byte-shuffled, zlib-compressed float32 chunks (missing chunk = NaN)
+
+Time labels are the requested intervals, e.g. ``2024-06-01/2024-08-31``.
+Appends are serialized with a file lock; chunks are written before the
+metadata that references them, so readers never see a partial layer.
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+from decouple import config
+
+from source.shared_cache import file_lock
+
+DATACUBE_DIR = config('DATACUBE_DIR', default='cache/datacube')
+
+# Edge length (pixels) of the spatial chunks; one chunk of each layer is read at a time
+DATACUBE_CHUNK = config('DATACUBE_CHUNK', default=128, cast=int)
+
+COMPRESSION_LEVEL = 5
+
+# Bytes of a float32 value; chunks are byte-shuffled before compression (numcodecs 'shuffle' filter)
+ITEMSIZE = 4
+
+
+def _encode(block):
+    shuffled = np.frombuffer(block.tobytes(), dtype=np.uint8).reshape(-1, ITEMSIZE).T
+    return zlib.compress(shuffled.tobytes(), COMPRESSION_LEVEL)
+
+
+def _decode(data, chunk):
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(ITEMSIZE, -1)
+    return np.frombuffer(shuffled.T.tobytes(), dtype='<f4').reshape(chunk, chunk)
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Datacube:
+    """A (time, height, width) float32 array on disk, addressed by time labels."""
+
+    def __init__(self, path, height, width, chunk=DATACUBE_CHUNK):
+        self.path = path
+        if not os.path.exists(os.path.join(path, '.zarray')):
+            with file_lock(os.path.join(path, 'append')):
+                if not os.path.exists(os.path.join(path, '.zarray')):
+                    self._create(height, width, chunk)
+        with open(os.path.join(path, '.zarray'), encoding='utf-8') as f:
+            meta = json.load(f)
+        _, self.height, self.width = meta['shape']
+        self.chunk = meta['chunks'][1]
+        if (self.height, self.width) != (height, width):
+            raise ValueError(f"Datacube {path} has shape {self.height}x{self.width}, not {height}x{width}")
+
+    def _create(self, height, width, chunk):
+        os.makedirs(self.path, exist_ok=True)
+        _write_json(os.path.join(self.path, '.zattrs'), {'_ARRAY_DIMENSIONS': ['time', 'y', 'x'], 'time': [],
+                                                         'fetched_at': {}})
+        _write_json(os.path.join(self.path, '.zarray'), {
+            'zarr_format': 2,
+            'shape': [0, height, width],
+            'chunks': [1, chunk, chunk],
+            'dtype': '<f4',
+            'compressor': {'id': 'zlib', 'level': COMPRESSION_LEVEL},
+            'fill_value': 'NaN',
+            'filters': [{'id': 'shuffle', 'elementsize': ITEMSIZE}],
+            'order': 'C',
+        })
+
+    # --- metadata ---
+
+    def attrs(self):
+        with open(os.path.join(self.path, '.zattrs'), encoding='utf-8') as f:
+            return json.load(f)
+
+    @property
+    def times(self):
+        return self.attrs()['time']
+
+    def fetched_at(self, label):
+        """Epoch seconds when the layer was stored, or None if the cube does not contain it."""
+        return self.attrs()['fetched_at'].get(label)
+
+    def __contains__(self, label):
+        return label in self.times
+
+    def _chunk_grid(self):
+        return range(0, self.height, self.chunk), range(0, self.width, self.chunk)
+
+    def _chunk_path(self, t, row, col):
+        return os.path.join(self.path, f"{t}.{row // self.chunk}.{col // self.chunk}")
+
+    # --- writing ---
+
+    def append(self, label, raster):
+        """Stores `raster` (height x width) as the layer `label`; an existing layer of that label is replaced."""
+        raster = np.asarray(raster, dtype='<f4')
+        if raster.shape != (self.height, self.width):
+            raise ValueError(f"Raster shape {raster.shape} does not match the datacube {self.height}x{self.width}")
+
+        with file_lock(os.path.join(self.path, 'append')):
+            attrs = self.attrs()
+            times = attrs['time']
+            t = times.index(label) if label in times else len(times)
+
+            rows, cols = self._chunk_grid()
+            for row in rows:
+                for col in cols:
+                    # Zarr stores edge chunks at full size, padded with the fill value
+                    block = np.full((self.chunk, self.chunk), np.nan, dtype='<f4')
+                    tile = raster[row:row + self.chunk, col:col + self.chunk]
+                    block[:tile.shape[0], :tile.shape[1]] = tile
+                    chunk_path = self._chunk_path(t, row, col)
+                    tmp_path = f"{chunk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, 'wb') as f:
+                        f.write(_encode(block))
+                    os.replace(tmp_path, chunk_path)
+
+            if t == len(times):
+                times.append(label)
+                with open(os.path.join(self.path, '.zarray'), encoding='utf-8') as f:
+                    meta = json.load(f)
+                meta['shape'][0] = len(times)
+                _write_json(os.path.join(self.path, '.zarray'), meta)
+            attrs['fetched_at'][label] = time.time()
+            _write_json(os.path.join(self.path, '.zattrs'), attrs)
+
+    # --- reading ---
+
+    def _read_chunk(self, t, row, col):
+        try:
+            with open(self._chunk_path(t, row, col), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.full((self.chunk, self.chunk), np.nan, dtype='<f4')
+        return _decode(data, self.chunk)
+
+    def _indices(self, labels):
+        times = self.times
+        missing = [label for label in labels if label not in times]
+        if missing:
+            raise KeyError(f"Datacube {self.path} has no layers {missing}")
+        return [times.index(label) for label in labels]
+
+    def read_block(self, labels, rows, cols):
+        """Returns the (len(labels), rows, cols) block of the given layers; `rows`/`cols` are slices."""
+        indices = self._indices(labels)
+        row_start, row_stop, _ = rows.indices(self.height)
+        col_start, col_stop, _ = cols.indices(self.width)
+        block = np.empty((len(indices), row_stop - row_start, col_stop - col_start), dtype=np.float32)
+        first_row = row_start // self.chunk * self.chunk
+        first_col = col_start // self.chunk * self.chunk
+        for i, t in enumerate(indices):
+            for row in range(first_row, row_stop, self.chunk):
+                for col in range(first_col, col_stop, self.chunk):
+                    chunk = self._read_chunk(t, row, col)
+                    r0, r1 = max(row, row_start), min(row + self.chunk, row_stop)
+                    c0, c1 = max(col, col_start), min(col + self.chunk, col_stop)
+                    block[i, r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = \
+                        chunk[r0 - row:r1 - row, c0 - col:c1 - col]
+        return block
+
+    def read_layer(self, label):
+        """Returns one whole layer as a (height, width) float32 array."""
+        return self.read_block([label], slice(None), slice(None))[0]
+
+    def iter_blocks(self, labels):
+        """Yields (rows, cols, block) for each spatial chunk; `block` has shape (len(labels), rows, cols)."""
+        rows, cols = self._chunk_grid()
+        for row in rows:
+            for col in cols:
+                row_slice = slice(row, min(row + self.chunk, self.height))
+                col_slice = slice(col, min(col + self.chunk, self.width))
+                yield row_slice, col_slice, self.read_block(labels, row_slice, col_slice)
+
+    def map_blocks(self, labels, func, dtype=np.float32):
+        """Applies `func` to each (layers, rows, cols) block and assembles the (height, width) results."""
+        result = np.full((self.height, self.width), np.nan, dtype=dtype)
+        for rows, cols, block in self.iter_blocks(labels):
+            result[rows, cols] = func(block)
+        return result
+
+
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+
+def open_cube(name, size):
+    """Returns the datacube `name` of raster size [width, height], creating it if needed."""
+    path = os.path.join(DATACUBE_DIR, name)
+    with _cubes_lock:
+        cube = _cubes.get(path)
+        if cube is None:
+            cube = Datacube(path, height=size[1], width=size[0])
+            _cubes[path] = cube
+        return cube
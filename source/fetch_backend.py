@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable fetch backend for the external data sources (Sentinel Hub, Open-Meteo).
+
+The backend is selected with the ``FETCH_BACKEND`` setting (.env or environment):
+
+- ``sentinelhub`` (default): live requests to Sentinel Hub and Open-Meteo.
+- ``record``: live requests, every response is also written to ``REPLAY_DIR``.
+- ``replay``: no network access; responses are served from the fixtures in
+  ``REPLAY_DIR``. Missing fixtures are generated synthetically (seeded by the
+  request) unless ``REPLAY_SYNTHETIC=False``. ``REPLAY_LATENCY`` (seconds) and
+  ``REPLAY_ERROR_RATE`` (0-1) inject delay and failures deterministically
+  (``REPLAY_SEED``), so throughput and retry behaviour can be measured offline.
+
+Rasters are stored as ``.npy`` files (the decoded TIFF/PNG arrays) and daily
+weather series as ``.csv`` files, named by a hash of the request.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from decouple import config
+from sentinelhub import DataCollection, MimeType, MosaickingOrder, SentinelHubRequest
+
+from source import pu_budget
+from source.synthetic import seasonal_ndvi_offset, synthetic_ndvi_raster, synthetic_rgb_image, synthetic_temperature
+
+logger = logging.getLogger(__name__)
+
+FETCH_BACKEND = config('FETCH_BACKEND', default='sentinelhub')
+FETCH_RETRIES = config('FETCH_RETRIES', default=2, cast=int)
+FETCH_RETRY_BACKOFF = config('FETCH_RETRY_BACKOFF', default=0.5, cast=float)
+
+REPLAY_DIR = config('REPLAY_DIR', default='fixtures/replay')
+REPLAY_LATENCY = config('REPLAY_LATENCY', default=0.0, cast=float)
+REPLAY_ERROR_RATE = config('REPLAY_ERROR_RATE', default=0.0, cast=float)
+REPLAY_SEED = config('REPLAY_SEED', default=0, cast=int)
+REPLAY_SYNTHETIC = config('REPLAY_SYNTHETIC', default=True, cast=bool)
+
+OPEN_METEO_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+
+class FetchError(Exception):
+    """Raised when an external data source cannot deliver a response."""
+
+
+class RasterRequest:
+    """Description of one Sentinel-2 L2A process API request (least cloudy mosaic)."""
+
+    def __init__(self, evalscript, time_interval, geometry, size, mime_type=MimeType.TIFF, config=None,
+                 label='raster'):
+        self.evalscript = evalscript
+        self.time_interval = tuple(time_interval)
+        self.geometry = geometry
+        self.size = list(size)
+        self.mime_type = mime_type
+        self.config = config
+        self.label = label
+        self.processing_units = None
+
+    def key(self):
+        """Stable identifier of the request, used as the fixture file name."""
+        payload = json.dumps({
+            'evalscript': self.evalscript,
+            'time_interval': self.time_interval,
+            'geometry': self.geometry.geojson,
+            'size': self.size,
+            'mime_type': self.mime_type.extension,
+        }, sort_keys=True)
+        digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+        return f"{self.label}_{self.time_interval[0]}_{self.time_interval[1]}_{digest}"
+
+
+# --- 1. BACKENDS ---
+
+class SentinelHubBackend:
+    """Live backend: Sentinel Hub process API and the Open-Meteo archive API."""
+
+    name = 'sentinelhub'
+    requires_credentials = True
+
+    def fetch_raster(self, raster_request):
+        request = SentinelHubRequest(
+            evalscript=raster_request.evalscript,
+            input_data=[
+                SentinelHubRequest.input_data(
+                    data_collection=DataCollection.SENTINEL2_L2A,
+                    time_interval=raster_request.time_interval,
+                    mosaicking_order=MosaickingOrder.LEAST_CC,
+                )
+            ],
+            responses=[SentinelHubRequest.output_response('default', raster_request.mime_type)],
+            geometry=raster_request.geometry,
+            size=raster_request.size,
+            config=raster_request.config
+        )
+        responses = request.get_data(save_data=False, decode_data=False)
+        if not responses:
+            return None
+        # Processing units actually charged by Sentinel Hub, recorded by source/pu_budget.py
+        headers = {name.lower(): value for name, value in responses[0].headers.items()}
+        if 'x-processingunits-spent' in headers:
+            raster_request.processing_units = float(headers['x-processingunits-spent'])
+        return responses[0].decode()
+
+    def fetch_daily_temperature(self, latitude, longitude, start_date, end_date):
+        # Imported lazily so that the Flask app does not need the Open-Meteo client
+        import openmeteo_requests
+        import requests_cache
+        from retry_requests import retry
+
+        cache_session = requests_cache.CachedSession('.cache', expire_after=-1)
+        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+        client = openmeteo_requests.Client(session=retry_session)
+        params = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "start_date": start_date,
+            "end_date": end_date,
+            "daily": "temperature_2m_mean",
+        }
+        response = client.weather_api(OPEN_METEO_URL, params=params)[0]
+        daily = response.Daily()
+        dates = pd.date_range(
+            start=pd.to_datetime(daily.Time(), unit="s", utc=True),
+            end=pd.to_datetime(daily.TimeEnd(), unit="s", utc=True),
+            freq=pd.Timedelta(seconds=daily.Interval()),
+            inclusive="left"
+        )
+        return pd.DataFrame({"date": dates, "temperature_2m_mean": daily.Variables(0).ValuesAsNumpy()})
+
+
+class ReplayBackend:
+    """Offline backend serving recorded (or synthetic) responses from fixture files."""
+
+    name = 'replay'
+    requires_credentials = False
+
+    def __init__(self, directory=REPLAY_DIR, latency=REPLAY_LATENCY, error_rate=REPLAY_ERROR_RATE,
+                 seed=REPLAY_SEED, synthetic=REPLAY_SYNTHETIC):
+        self.directory = directory
+        self.latency = latency
+        self.error_rate = error_rate
+        self.synthetic = synthetic
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _simulate_network(self, key):
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise FetchError(f"Injected replay failure for {key}")
+
+    def fetch_raster(self, raster_request):
+        key = raster_request.key()
+        self._simulate_network(key)
+
+        path = os.path.join(self.directory, f"{key}.npy")
+        if os.path.exists(path):
+            return np.load(path)
+        if not self.synthetic:
+            raise FetchError(f"No replay fixture for {key}")
+
+        # Seed from the request so that the same request always returns the same raster
+        seed = int(key.rsplit('_', 1)[1][:8], 16)
+        height, width = raster_request.size[1], raster_request.size[0]
+        if raster_request.mime_type == MimeType.PNG:
+            return synthetic_rgb_image(height, width, seed=seed)
+        # Yearly trend plus the seasonal cycle at the middle of the requested interval
+        start, end = (datetime.date.fromisoformat(day[:10]) for day in raster_request.time_interval)
+        middle = start + (end - start) / 2
+        offset = 0.01 * (start.year - 2017) + float(seasonal_ndvi_offset(middle.timetuple().tm_yday))
+        return synthetic_ndvi_raster(height, width, nan_fraction=0.05, seed=seed, offset=offset)
+
+    def fetch_daily_temperature(self, latitude, longitude, start_date, end_date):
+        key = _meteo_key(latitude, longitude, start_date, end_date)
+        self._simulate_network(key)
+
+        path = os.path.join(self.directory, f"{key}.csv")
+        if os.path.exists(path):
+            return pd.read_csv(path, parse_dates=['date'])
+        if not self.synthetic:
+            raise FetchError(f"No replay fixture for {key}")
+
+        dates = pd.date_range(start=start_date, end=end_date, freq='D', tz='UTC')
+        # Repeat a seasonal cycle for every year in the range
+        temperatures = np.concatenate([
+            synthetic_temperature(366, seed=year)[:len(group)]
+            for year, group in pd.Series(dates).groupby(dates.year)
+        ])
+        return pd.DataFrame({"date": dates, "temperature_2m_mean": temperatures.astype(np.float32)})
+
+
+class RecordingBackend(SentinelHubBackend):
+    """Live backend that also stores every response as a replay fixture."""
+
+    name = 'record'
+
+    def __init__(self, directory=REPLAY_DIR):
+        self.directory = directory
+
+    def fetch_raster(self, raster_request):
+        data = super().fetch_raster(raster_request)
+        if data is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            np.save(os.path.join(self.directory, f"{raster_request.key()}.npy"), data)
+        return data
+
+    def fetch_daily_temperature(self, latitude, longitude, start_date, end_date):
+        df = super().fetch_daily_temperature(latitude, longitude, start_date, end_date)
+        os.makedirs(self.directory, exist_ok=True)
+        df.to_csv(os.path.join(self.directory, f"{_meteo_key(latitude, longitude, start_date, end_date)}.csv"),
+                  index=False)
+        return df
+
+
+def _meteo_key(latitude, longitude, start_date, end_date):
+    return f"meteo_{latitude:.4f}_{longitude:.4f}_{start_date}_{end_date}"
+
+
+BACKENDS = {
+    'sentinelhub': SentinelHubBackend,
+    'record': RecordingBackend,
+    'replay': ReplayBackend,
+}
+
+_backend = None
+_stats_lock = threading.Lock()
+stats = {'requests': 0, 'failures': 0, 'retries': 0, 'seconds': 0.0}
+
+
+def get_backend():
+    """Returns the configured backend (created on first use)."""
+    global _backend
+    if _backend is None:
+        if FETCH_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown FETCH_BACKEND '{FETCH_BACKEND}'. Options: {', '.join(BACKENDS)}")
+        _backend = BACKENDS[FETCH_BACKEND]()
+        logger.info(f"Using fetch backend: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend):
+    """Replaces the active backend (e.g. a ReplayBackend with custom latency)."""
+    global _backend
+    _backend = backend
+
+
+# --- 2. FETCH FUNCTIONS (with retries) ---
+
+def _with_retries(description, func, *args):
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        with _stats_lock:
+            stats['requests'] += 1
+        try:
+            result = func(*args)
+            with _stats_lock:
+                stats['seconds'] += time.perf_counter() - started
+            return result
+        except Exception as e:
+            with _stats_lock:
+                stats['failures'] += 1
+                stats['seconds'] += time.perf_counter() - started
+            if attempt >= FETCH_RETRIES:
+                raise
+            attempt += 1
+            with _stats_lock:
+                stats['retries'] += 1
+            logger.warning(f"{description} failed ({e}), retry {attempt}/{FETCH_RETRIES}")
+            time.sleep(FETCH_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+
+def fetch_raster(raster_request):
+    """
+    Downloads one raster through the active backend; returns a numpy array or None.
+    Raises pu_budget.BudgetExceeded (without sending the request) if it would exceed a processing unit budget.
+    """
+    backend = get_backend()
+    reservation = pu_budget.reserve(raster_request, backend)
+    try:
+        data = _with_retries(f"Raster request {raster_request.key()}", backend.fetch_raster, raster_request)
+    except Exception:
+        pu_budget.release(reservation)
+        raise
+    pu_budget.settle(reservation, raster_request)
+    return data
+
+
+def fetch_daily_temperature(latitude, longitude, start_date, end_date):
+    """Downloads daily mean temperatures; returns a DataFrame with 'date' and 'temperature_2m_mean'."""
+    return _with_retries(f"Temperature request {start_date}..{end_date}", get_backend().fetch_daily_temperature,
+                         latitude, longitude, start_date, end_date)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the green areas (parks) defined in ``static/geojson/*.geojson``.
+
+Every Polygon feature of every GeoJSON file in ``GEOJSON_DIR`` becomes a
+``GreenArea``; files whose name starts with ``_`` are skipped. A feature is
+identified by its ``id`` property (default: the file name) and may carry a
+``name`` and a ``kind`` (``park`` by default, ``city`` for the AOI boundary).
+Invalid polygons are logged and skipped.
+
+For each area the bounding box, area (m²) and centroid are computed once at
+load time; rasterized masks are computed per analysis grid and cached. The
+registry notices added, changed and removed files (checked at most every
+``GREEN_AREAS_RELOAD_INTERVAL`` seconds) and reloads itself, so areas created
+with ``createGeojson.py`` appear without a restart.
+
+    from source.green_areas import registry
+
+    area = registry.get('strky')
+    area.geometry()                       # sentinelhub Geometry for requests
+    area.mask(bbox, [500, 500])           # boolean pixel mask on a grid
+    registry.at(17.57, 48.40)             # areas containing a point
+    registry.in_bbox((17.55, 48.36, 17.60, 48.38))   # areas intersecting a map view
+
+Point and bbox queries use an STRtree that is rebuilt with every reload.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from decouple import config
+from sentinelhub import CRS, Geometry
+from shapely import STRtree
+from shapely.geometry import Point, box, mapping, shape
+
+logger = logging.getLogger(__name__)
+
+GEOJSON_DIR = config('GEOJSON_DIR', default='static/geojson')
+
+# Minimum number of seconds between two checks of the GeoJSON files for changes
+GREEN_AREAS_RELOAD_INTERVAL = config('GREEN_AREAS_RELOAD_INTERVAL', default=2.0, cast=float)
+
+# Folder with the interpolated NDVI series shown in the /api/plot chart, one CSV per area id
+CHART_CSV_DIR = 'static/csv_interpol_lin'
+
+# Metres per degree of latitude; a degree of longitude is shorter by cos(latitude)
+METERS_PER_DEGREE = 111320.0
+
+
+class GreenArea:
+    """One polygon from the GeoJSON files with its precomputed metadata."""
+
+    def __init__(self, area_id, name, kind, polygon, path):
+        self.id = area_id
+        self.name = name
+        self.kind = kind
+        self.polygon = polygon
+        self.path = path
+        self.bbox = polygon.bounds  # (min_lon, min_lat, max_lon, max_lat)
+        self.centroid = (polygon.centroid.x, polygon.centroid.y)
+        self.area_m2 = _area_m2(polygon)
+        shapely.prepare(self.polygon)
+
+    @property
+    def chart_csv(self):
+        """Path of the area's NDVI chart data, or None if it has none."""
+        path = os.path.join(CHART_CSV_DIR, f"{self.id}.csv")
+        return path if os.path.exists(path) else None
+
+    def geometry(self):
+        """The polygon as a sentinelhub Geometry (WGS84) for Sentinel Hub requests."""
+        return Geometry(geometry=mapping(self.polygon), crs=CRS.WGS84)
+
+    def mask(self, bbox, size):
+        """
+        Boolean (height, width) mask of the pixels whose centres lie in the area, on a grid of
+        `size` [width, height] pixels covering `bbox` (min_lon, min_lat, max_lon, max_lat); row 0 is north.
+        Masks are cached per area and grid.
+        """
+        return _mask(self, tuple(bbox), tuple(size))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'kind': self.kind,
+            'bbox': list(self.bbox),
+            'centroid': list(self.centroid),
+            'area_m2': round(self.area_m2, 1),
+            'has_chart': self.chart_csv is not None,
+        }
+
+
+def _area_m2(polygon):
+    """Approximate area in m² (local equirectangular projection; accurate for city-sized polygons)."""
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(polygon.centroid.y))
+    projected = shapely.transform(polygon, lambda coords: coords * [scale_x, METERS_PER_DEGREE])
+    return projected.area
+
+
+@lru_cache(maxsize=256)
+def _mask(area, bbox, size):
+    width, height = size
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon = min_lon + (np.arange(width) + 0.5) * (max_lon - min_lon) / width
+    lat = max_lat - (np.arange(height) + 0.5) * (max_lat - min_lat) / height
+    mask = shapely.contains_xy(area.polygon, *np.meshgrid(lon, lat))
+    mask.setflags(write=False)
+    return mask
+
+
+@lru_cache(maxsize=32)
+def _label_image(registry, version, bbox, size, kind):
+    areas = registry.all(kind)
+    labels = np.zeros((size[1], size[0]), dtype=np.int32)
+    # Larger areas first, so smaller (nested) areas overwrite them
+    for i in sorted(range(len(areas)), key=lambda i: -areas[i].area_m2):
+        labels[areas[i].mask(bbox, size)] = i + 1
+    labels.setflags(write=False)
+    return labels, areas
+
+
+def polygon_error(polygon):
+    """Why a shapely geometry cannot be used as an area (None if it can)."""
+    if polygon.geom_type not in ('Polygon', 'MultiPolygon') or polygon.is_empty:
+        return f"{polygon.geom_type} is not a polygon"
+    if not polygon.is_valid:
+        return shapely.is_valid_reason(polygon)
+    min_lon, min_lat, max_lon, max_lat = polygon.bounds
+    if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        return "coordinates are not WGS84 longitude/latitude"
+    return None
+
+
+def parse_polygon(geojson):
+    """
+    Shapely polygon of a GeoJSON Polygon/MultiPolygon geometry, a Feature or a FeatureCollection with
+    one feature (WGS84). Raises ValueError if it is not a valid polygon.
+    """
+    if not isinstance(geojson, dict):
+        raise ValueError("GeoJSON must be an object")
+    if geojson.get('type') == 'FeatureCollection':
+        features = geojson.get('features') or []
+        if len(features) != 1:
+            raise ValueError("FeatureCollection must contain exactly one feature")
+        geojson = features[0]
+    if geojson.get('type') == 'Feature':
+        geojson = geojson.get('geometry') or {}
+    try:
+        polygon = shape(geojson)
+    except Exception as e:
+        raise ValueError(f"invalid geometry ({e})")
+    error = polygon_error(polygon)
+    if error:
+        raise ValueError(error)
+    return polygon
+
+
+def load_areas(path):
+    """Returns the valid GreenAreas of one GeoJSON file; problems are logged."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping {path}: {e}")
+        return []
+
+    features = data.get('features', []) if data.get('type') == 'FeatureCollection' else [data]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    areas = []
+    for i, feature in enumerate(features):
+        properties = feature.get('properties') or {}
+        area_id = properties.get('id') or (stem if len(features) == 1 else f"{stem}-{i}")
+        try:
+            polygon = shape(feature['geometry'])
+        except Exception as e:
+            logger.warning(f"Skipping area {area_id} in {path}: invalid geometry ({e})")
+            continue
+        error = polygon_error(polygon)
+        if error:
+            logger.warning(f"Skipping area {area_id} in {path}: {error}")
+            continue
+        areas.append(GreenArea(area_id, properties.get('name') or area_id, properties.get('kind') or 'park',
+                               polygon, path))
+    return areas
+
+
+class GreenAreaRegistry:
+    """All green areas by id; reloads itself when the GeoJSON files change."""
+
+    def __init__(self, directory=GEOJSON_DIR, reload_interval=GREEN_AREAS_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._areas = {}
+        # Spatial index: (STRtree, areas in the order of the tree's geometries), replaced as a whole on reload
+        self._index = (None, [])
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _files(self):
+        snapshot = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.geojson'))):
+            if os.path.basename(path).startswith('_'):
+                continue
+            try:
+                snapshot[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return snapshot
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if self._snapshot is not None and now - self._checked_at < self.reload_interval:
+                return
+            snapshot = self._files()
+            if snapshot != self._snapshot:
+                areas = {}
+                for path in snapshot:
+                    for area in load_areas(path):
+                        if area.id in areas:
+                            logger.warning(f"Duplicate area id {area.id} in {path}; keeping {areas[area.id].path}")
+                            continue
+                        areas[area.id] = area
+                indexed = list(areas.values())
+                self._index = (STRtree([area.polygon for area in indexed]), indexed)
+                self._areas = areas
+                if self._snapshot is not None:
+                    logger.info(f"Reloaded {len(areas)} green areas from {self.directory}")
+                self._snapshot = snapshot
+            self._checked_at = now
+
+    def get(self, area_id):
+        """Returns the area with the given id, or None."""
+        self._refresh()
+        return self._areas.get(area_id)
+
+    def __contains__(self, area_id):
+        return self.get(area_id) is not None
+
+    def all(self, kind=None):
+        """All areas (optionally only of one kind), in file name order."""
+        self._refresh()
+        return [area for area in self._areas.values() if kind is None or area.kind == kind]
+
+    @property
+    def version(self):
+        """Changes whenever the set of GeoJSON files or one of them changes."""
+        self._refresh()
+        return hashlib.sha1(repr(sorted(self._snapshot.items())).encode('utf-8')).hexdigest()[:12]
+
+    def label_image(self, bbox, size, kind='park'):
+        """
+        Returns (labels, areas) for a grid of `size` [width, height] pixels covering `bbox`:
+        `labels` is an int32 (height, width) image where 0 is no area and i is areas[i - 1].
+        Where areas overlap, the smaller one wins. Cached per registry version and grid.
+        """
+        self._refresh()
+        return _label_image(self, self.version, tuple(bbox), tuple(size), kind)
+
+    def _query(self, geometry, predicate, kind):
+        self._refresh()
+        tree, indexed = self._index
+        if not indexed:
+            return []
+        areas = [indexed[i] for i in sorted(tree.query(geometry, predicate=predicate))]
+        return [area for area in areas if kind is None or area.kind == kind]
+
+    def in_bbox(self, bbox, kind=None):
+        """Areas intersecting the box (min_lon, min_lat, max_lon, max_lat)."""
+        return self._query(box(*bbox), 'intersects', kind)
+
+    def at(self, lon, lat, kind=None):
+        """Areas containing the point (boundary included), smallest first."""
+        return sorted(self._query(Point(lon, lat), 'intersects', kind), key=lambda area: area.area_m2)
+
+
+registry = GreenAreaRegistry()
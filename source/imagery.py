@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Store of the true-color (RGB) satellite images of the parks, with WebP size pyramids.
+
+Each downloaded image is a *scene* stored once under the hash of its pixels, so
+identical mosaics (e.g. the same cloud-free acquisition returned for two periods)
+share one set of files. The WebP levels of a scene are generated in a background
+thread, so the download loop (or a request) does not wait for the encoding:
+
+    <IMAGERY_DIR>/scenes/<hash[:2]>/<hash>/thumb.webp      longest side THUMB px
+    <IMAGERY_DIR>/scenes/<hash[:2]>/<hash>/medium.webp     longest side MEDIUM px
+    <IMAGERY_DIR>/scenes/<hash[:2]>/<hash>/full.webp       original size
+    <IMAGERY_DIR>/index.json                               image (area, year, period) -> scene, scene -> levels
+
+Scene files never change, so they are served as immutable (see ``source/assets.py``).
+An image of a finished period is never downloaded again; an image of a period that
+was still running when it was fetched expires after ``TREND_CACHE_TTL``.
+
+    from source import imagery
+
+    if not imagery.is_fresh('strky', 2024, 'Mar 1-14', size):
+        imagery.store_image('strky', 2024, 'Mar 1-14', ('2024-03-01', '2024-03-14'), size, rgb)
+    imagery.gallery(area_id='strky', level='thumb')
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import numpy as np
+from PIL import Image
+from decouple import config
+
+from source.long_term_analysis_trnava import TREND_CACHE_TTL
+from source.shared_cache import file_lock
+
+logger = logging.getLogger(__name__)
+
+IMAGERY_DIR = config('IMAGERY_DIR', default='static/output/imagery')
+
+# Threads that encode the WebP levels
+IMAGERY_WORKERS = config('IMAGERY_WORKERS', default=2, cast=int)
+
+# Pyramid levels: name -> longest side in pixels (None = original size)
+LEVELS = {'thumb': 160, 'medium': 480, 'full': None}
+
+WEBP_QUALITY = 80
+
+
+def scene_hash(rgb):
+    """Hash of the image pixels (and shape), identical for identical downloads."""
+    rgb = np.ascontiguousarray(rgb)
+    digest = hashlib.sha256(f"{rgb.shape}{rgb.dtype}".encode('ascii'))
+    digest.update(rgb.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def scene_dir(scene, directory=IMAGERY_DIR):
+    return os.path.join(directory, 'scenes', scene[:2], scene)
+
+
+def level_path(scene, level, directory=IMAGERY_DIR):
+    return os.path.join(scene_dir(scene, directory), f"{level}.webp")
+
+
+def image_key(area_id, year, period, size):
+    return f"{area_id}/{year}/{period}/{size[0]}x{size[1]}"
+
+
+# --- 1. INDEX ---
+
+def _index_path(directory):
+    return os.path.join(directory, 'index.json')
+
+
+def load_index(directory=IMAGERY_DIR):
+    """Returns {'images': {key: entry}, 'scenes': {hash: {'width', 'height', 'levels'}}}."""
+    try:
+        with open(_index_path(directory), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'images': {}, 'scenes': {}}
+
+
+def _update_index(directory, update):
+    """Applies `update(index)` under the index lock and writes the index atomically."""
+    path = _index_path(directory)
+    with file_lock(path):
+        index = load_index(directory)
+        update(index)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def is_fresh(area_id, year, period, size, directory=IMAGERY_DIR):
+    """True if the image is stored and does not need to be downloaded again."""
+    entry = load_index(directory)['images'].get(image_key(area_id, year, period, size))
+    if entry is None:
+        return False
+    interval_end = date.fromisoformat(entry['interval'][1][:10])
+    if date.fromtimestamp(entry['fetched_at']) > interval_end:
+        return True
+    return time.time() - entry['fetched_at'] < TREND_CACHE_TTL
+
+
+# --- 2. PYRAMIDS ---
+
+def _write_levels(scene, rgb, directory):
+    image = Image.fromarray(np.asarray(rgb, dtype=np.uint8))
+    os.makedirs(scene_dir(scene, directory), exist_ok=True)
+    for level, max_side in LEVELS.items():
+        path = level_path(scene, level, directory)
+        if os.path.exists(path):
+            continue
+        resized = image.copy()
+        if max_side is not None:
+            resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        resized.save(tmp_path, format='WEBP', quality=WEBP_QUALITY, method=4)
+        os.replace(tmp_path, path)
+
+    def mark_ready(index):
+        index['scenes'].setdefault(scene, {'width': image.width, 'height': image.height})['levels'] = list(LEVELS)
+
+    _update_index(directory, mark_ready)
+
+
+_background = ThreadPoolExecutor(max_workers=IMAGERY_WORKERS, thread_name_prefix='imagery')
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def _schedule_levels(scene, rgb, directory):
+    with _pending_lock:
+        future = _pending.get(scene)
+        if future is None:
+            future = _background.submit(_write_levels, scene, rgb, directory)
+            _pending[scene] = future
+            future.add_done_callback(lambda f: _forget_pending(scene, f))
+        return future
+
+
+def _forget_pending(scene, future):
+    with _pending_lock:
+        _pending.pop(scene, None)
+    if future.exception() is not None:
+        logger.error(f"Generating the WebP levels of scene {scene} failed: {future.exception()}")
+
+
+# --- 3. STORING AND BROWSING ---
+
+def store_image(area_id, year, period, interval, size, rgb, directory=IMAGERY_DIR):
+    """
+    Records the RGB image (height x width x 3 uint8) of an area and period and returns its scene hash.
+    A scene that is already stored is not written again; new scenes get their WebP levels in the background.
+    """
+    scene = scene_hash(rgb)
+    stored = load_index(directory)['scenes'].get(scene, {}).get('levels') == list(LEVELS)
+    if not stored:
+        _schedule_levels(scene, rgb, directory)
+
+    def record(index):
+        index['scenes'].setdefault(scene, {'width': int(rgb.shape[1]), 'height': int(rgb.shape[0]), 'levels': []})
+        index['images'][image_key(area_id, year, period, size)] = {
+            'area': area_id,
+            'year': year,
+            'period': period,
+            'interval': list(interval),
+            'size': list(size),
+            'scene': scene,
+            'fetched_at': time.time(),
+        }
+
+    _update_index(directory, record)
+    if stored:
+        logger.info(f"Image {area_id} {year} {period} is identical to stored scene {scene}")
+    return scene
+
+
+def wait_for_pending():
+    """Blocks until all scheduled WebP levels are written (for command-line runs and tests)."""
+    with _pending_lock:
+        futures = list(_pending.values())
+    for future in futures:
+        future.exception()
+
+
+def gallery(area_id=None, year=None, level='thumb', offset=0, limit=60, directory=IMAGERY_DIR):
+    """
+    Returns (total, entries) of the stored images, optionally of one area and/or year, ordered by area,
+    year and date. Each entry has the scene's `levels` that are ready and the path of the requested level.
+    """
+    index = load_index(directory)
+    images = [entry for entry in index['images'].values()
+              if (area_id is None or entry['area'] == area_id) and (year is None or entry['year'] == year)]
+    images.sort(key=lambda entry: (entry['area'], entry['year'], entry['interval'][0], entry['size']))
+
+    entries = []
+    for entry in images[offset:offset + limit]:
+        scene = index['scenes'].get(entry['scene'], {})
+        ready = scene.get('levels', [])
+        entries.append(dict(entry, width=scene.get('width'), height=scene.get('height'), levels=ready,
+                            paths={name: level_path(entry['scene'], name, directory) for name in ready},
+                            path=level_path(entry['scene'], level, directory) if level in ready else None))
+    return len(images), entries
@@ -3,55 +3,9 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
-matplotlib.use("TkAgg")
-
-
-def non_zero_value(arr, idx):
-    if idx == 0:
-        i = 0
-        while arr[idx + i] == 0.0:
-            i += 1
-        return arr[idx + i]
-    elif idx == len(arr) - 1:
-        i = 0
-        while arr[idx - i] == 0.0:
-            i += 1
-        return arr[idx - i]
-    else:
-        # right
-        i = 0
-        while arr[idx + i] == 0.0:
-            i += 1
-        right_val = arr[idx + i]
-
-        # left
-        i = 0
-        while arr[idx - i] == 0.0:
-            i += 1
-        left_val = arr[idx - i]
-
-        # linear interpolation
-        difference = np.abs(left_val - right_val)
-        if left_val < right_val:
-            return left_val + (difference / 2)
-        else:
-            return right_val + (difference / 2)
-
-
-def value_at_x(x, x_array, y_array, count):
-    s = 0
-    for i in range(count):
-        p = 1
-        for j in range(count):
-            if i != j:
-                p *= (x - x_array[j]) / (x_array[i] - x_array[j])
-        if y_array[i] == 0.0:
-            p *= non_zero_value(y_array, i)
-        else:
-            p *= y_array[i]
-        s += p
-    return s
+from source.kernels import lagrange_fill
 
+matplotlib.use("TkAgg")
 
 with open('static/csv_raw_linear/ndvi_yearly_comparison_2020_2025_Nemocnicny_Park.csv', newline="") as csvfile:
     reader = csv.reader(csvfile)
@@ -61,20 +15,10 @@ print(data)
 num_x = 12
 num_years = 6
 cutoff = 0.4
-x_values = np.arange(0, num_x)
 
-yearly_data = [[0.0 for _ in range(num_x)] for _ in range(num_years)]
-
-for i in range(1, num_years + 1):
-    for j in range(1, num_x + 1):
-        if float(data[j][i]) > cutoff:
-            yearly_data[i - 1][j - 1] = float(data[j][i])
-print(yearly_data)
-
-for i in range(num_years):
-    for j in range(num_x):
-        if yearly_data[i][j] == 0.0:
-            yearly_data[i][j] = float(value_at_x(j, x_values, yearly_data[i], num_x))
+# Hodnoty pod cutoff sa považujú za chýbajúce a doplnia sa Lagrangeovou interpoláciou
+yearly_data = [lagrange_fill([float(data[j][i]) for j in range(1, num_x + 1)], cutoff)
+               for i in range(1, num_years + 1)]
 print(yearly_data)
 
 header = ["Period", "Year 2020", "Year 2021", "Year 2022", "Year 2023", "Year 2024", "Year 2025"]
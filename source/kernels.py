@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Numeric kernels shared by the analysis scripts and the Flask API.
+
+The functions here are pure (no I/O, no Sentinel Hub access), so they can be
+benchmarked on synthetic data (see ``benchmarks/bench_kernels.py``).
+"""
+
+import numpy as np
+
+# NDVI threshold below which pixels are not considered vegetation
+NDVI_CUTOFF = 0.4
+
+
+def trend_slope(stack):
+    """
+    Calculates the per-pixel linear regression slope over the first axis.
+
+    `stack` has shape (years, height, width) and may contain NaN for pixels
+    without data. Years are assumed to be equidistant (x = 0, 1, 2, ...).
+    """
+    n_years = stack.shape[0]
+    x = np.arange(n_years)
+    x_reshaped = x.reshape(n_years, 1, 1)
+
+    # Use nanmean to ignore pixels without data
+    mean_x = np.mean(x)
+    mean_y = np.nanmean(stack, axis=0)
+
+    # Calculate numerator and denominator, ignoring NaN values
+    numerator = np.nansum((x_reshaped - mean_x) * (stack - mean_y), axis=0)
+    denominator = np.sum((x - mean_x) ** 2)
+
+    trend_map = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+    # Masking areas with no valid data
+    trend_map[np.isnan(mean_y)] = np.nan
+    return trend_map
+
+
+def mean_ndvi(ndvi_array, cutoff=NDVI_CUTOFF):
+    """
+    Returns (mean, pixel_count, used_fallback) of the vegetation pixels in the raster.
+
+    Zero values are no-data. Only pixels >= `cutoff` are averaged; if there are
+    none, all non-zero pixels are used instead (`used_fallback` is True).
+    Returns None if the raster has no data at all.
+    """
+    filtered_values = ndvi_array[(ndvi_array != 0) & (ndvi_array >= cutoff)]
+    used_fallback = False
+    if len(filtered_values) == 0:
+        filtered_values = ndvi_array[ndvi_array != 0]
+        used_fallback = True
+        if len(filtered_values) == 0:
+            return None
+    return np.mean(filtered_values), len(filtered_values), used_fallback
+
+
+def non_zero_value(arr, idx):
+    """Returns the value at `idx`, or a substitute from its nearest non-zero neighbours."""
+    if idx == 0:
+        i = 0
+        while arr[idx + i] == 0.0:
+            i += 1
+        return arr[idx + i]
+    elif idx == len(arr) - 1:
+        i = 0
+        while arr[idx - i] == 0.0:
+            i += 1
+        return arr[idx - i]
+    else:
+        # right
+        i = 0
+        while arr[idx + i] == 0.0:
+            i += 1
+        right_val = arr[idx + i]
+
+        # left
+        i = 0
+        while arr[idx - i] == 0.0:
+            i += 1
+        left_val = arr[idx - i]
+
+        # linear interpolation
+        difference = np.abs(left_val - right_val)
+        if left_val < right_val:
+            return left_val + (difference / 2)
+        else:
+            return right_val + (difference / 2)
+
+
+def value_at_x(x, x_array, y_array, count):
+    """Evaluates the Lagrange polynomial through (x_array, y_array) at `x`."""
+    s = 0
+    for i in range(count):
+        p = 1
+        for j in range(count):
+            if i != j:
+                p *= (x - x_array[j]) / (x_array[i] - x_array[j])
+        if y_array[i] == 0.0:
+            p *= non_zero_value(y_array, i)
+        else:
+            p *= y_array[i]
+        s += p
+    return s
+
+
+def lagrange_fill(values, cutoff=NDVI_CUTOFF):
+    """
+    Replaces values below `cutoff` with a Lagrange interpolation of the series.
+
+    Works on a copy of `values` (a list of floats); gaps are filled from left to
+    right, so later gaps already see the earlier filled values.
+    """
+    count = len(values)
+    x_values = np.arange(0, count)
+    filled = [v if v > cutoff else 0.0 for v in values]
+    for j in range(count):
+        if filled[j] == 0.0:
+            filled[j] = float(value_at_x(j, x_values, filled, count))
+    return filled
+
+
+def find_onset(temperatures, threshold=5, days=5):
+    """
+    Returns the index of the first run of `days` consecutive values >= `threshold`.
+
+    Returns None if there is no such run. Missing (NaN) days are skipped like in the former
+    pandas rolling minimum: they do not break a run, but a window without any measured day
+    does not count.
+    """
+    values = np.asarray(temperatures, dtype=float)
+    if len(values) < days:
+        return None
+    above = values >= threshold
+    missing = np.isnan(values)
+    gaps = missing.any()
+    if gaps:
+        above |= missing
+    ones = np.ones(days, dtype=np.int64)
+    # Windows of length `days` whose days all qualify (and, with gaps, that hold a measured day)
+    runs = np.convolve(above.astype(np.int64), ones, mode='valid') == days
+    if gaps:
+        runs &= np.convolve((~missing).astype(np.int64), ones, mode='valid') > 0
+    hits = np.flatnonzero(runs)
+    return int(hits[0]) if len(hits) else None
+
+
+# Minimum seasonal amplitude (max - min NDVI) of a pixel to have a growing season at all
+MIN_SEASON_AMPLITUDE = 0.1
+
+
+def fill_time_gaps(values, t):
+    """
+    Linearly interpolates NaN values along the first axis of `values` (shape (time, pixels)).
+
+    `t` are the times of the layers (e.g. day of year). Gaps at the start or end are
+    filled with the nearest valid value; pixels without any valid value stay NaN.
+    Returns a new float64 array.
+    """
+    values = np.array(values, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    n_times = values.shape[0]
+    valid = np.isfinite(values)
+    idx = np.arange(n_times).reshape(-1, 1)
+
+    # Index of the last valid layer at or before / first valid layer at or after each layer
+    prev_idx = np.maximum.accumulate(np.where(valid, idx, -1), axis=0)
+    next_idx = np.minimum.accumulate(np.where(valid, idx, n_times)[::-1], axis=0)[::-1]
+    prev_idx = np.where(prev_idx < 0, next_idx, prev_idx)
+    next_idx = np.where(next_idx >= n_times, prev_idx, next_idx)
+
+    empty = next_idx >= n_times
+    prev_idx = np.clip(prev_idx, 0, n_times - 1)
+    next_idx = np.clip(next_idx, 0, n_times - 1)
+    prev_val = np.take_along_axis(values, prev_idx, axis=0)
+    next_val = np.take_along_axis(values, next_idx, axis=0)
+    span = t[next_idx] - t[prev_idx]
+    weight = np.divide(t.reshape(-1, 1) - t[prev_idx], span, out=np.zeros_like(span), where=span != 0)
+
+    filled = prev_val + weight * (next_val - prev_val)
+    filled[empty] = np.nan
+    return filled
+
+
+def season_metrics(values, doy, method='threshold', amplitude_fraction=0.5):
+    """
+    Returns per-pixel (start, peak, end) of the growing season as day-of-year arrays.
+
+    `values` has shape (time, pixels) without gaps (see `fill_time_gaps`), `doy` are the
+    days of year of the layers. Methods:
+
+    - 'threshold': start/end is where NDVI crosses `amplitude_fraction` of the seasonal
+      amplitude on the rising/falling side of the peak (linear interpolation between layers),
+    - 'derivative': start/end is the steepest increase/decrease before/after the peak.
+
+    Pixels with an amplitude below MIN_SEASON_AMPLITUDE (or without data) are NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    doy = np.asarray(doy, dtype=np.float64)
+    n_times, n_pixels = values.shape
+    idx = np.arange(n_times).reshape(-1, 1)
+    cols = np.arange(n_pixels)
+
+    no_data = np.isnan(values).any(axis=0)
+    safe = np.where(np.isnan(values), -np.inf, values)
+    peak_idx = np.argmax(safe, axis=0)
+    peak_val = safe[peak_idx, cols]
+    before = idx <= peak_idx
+    after = idx >= peak_idx
+    base_left = np.where(before, safe, np.inf).min(axis=0)
+    base_right = np.where(after, safe, np.inf).min(axis=0)
+    seasonal = ~no_data & (peak_val - np.minimum(base_left, base_right) >= MIN_SEASON_AMPLITUDE)
+
+    if method == 'threshold':
+        thr_left = base_left + amplitude_fraction * (peak_val - base_left)
+        thr_right = base_right + amplitude_fraction * (peak_val - base_right)
+
+        # First layer on the rising side that reaches the threshold, interpolated from the previous one
+        first = np.argmax(before & (safe >= thr_left), axis=0)
+        prev = np.maximum(first - 1, 0)
+        v0, v1 = safe[prev, cols], safe[first, cols]
+        frac = np.divide(thr_left - v0, v1 - v0, out=np.zeros(n_pixels), where=(v1 != v0) & (first > 0))
+        start = doy[prev] + np.clip(frac, 0, 1) * (doy[first] - doy[prev])
+
+        # Last layer on the falling side above the threshold, interpolated towards the next one
+        last = n_times - 1 - np.argmax((after & (safe >= thr_right))[::-1], axis=0)
+        nxt = np.minimum(last + 1, n_times - 1)
+        v0, v1 = safe[last, cols], safe[nxt, cols]
+        frac = np.divide(v0 - thr_right, v0 - v1, out=np.zeros(n_pixels), where=(v1 != v0) & (last < n_times - 1))
+        end = doy[last] + np.clip(frac, 0, 1) * (doy[nxt] - doy[last])
+    elif method == 'derivative':
+        # Slopes between neighbouring layers, located at the midpoints
+        slope = np.diff(safe, axis=0) / np.diff(doy).reshape(-1, 1)
+        mid = (doy[:-1] + doy[1:]) / 2
+        rising = idx[:-1] < peak_idx
+        falling = idx[:-1] >= peak_idx
+        up = np.argmax(np.where(rising, slope, -np.inf), axis=0)
+        down = np.argmin(np.where(falling, slope, np.inf), axis=0)
+        start = np.where(rising.any(axis=0), mid[up], np.nan)
+        end = np.where(falling.any(axis=0), mid[down], np.nan)
+    else:
+        raise ValueError(f"Unknown phenology method: {method}")
+
+    peak = doy[peak_idx]
+    start, peak, end = (np.where(seasonal, metric, np.nan) for metric in (start, peak, end))
+    return start, peak, end
+
+
+def zonal_stats(values, labels, n_zones, stable=0.0):
+    """
+    Per-zone statistics of a raster in one pass over a label image.
+
+    `labels` has the shape of `values`; 0 is background and zones are 1..n_zones.
+    NaN values are ignored. Returns a dict of arrays of length n_zones + 1 (index = zone):
+    `count` (valid pixels), `mean`, `median`, `above` and `below` (share of valid pixels
+    with a value > `stable` / < -`stable`). Zones without valid pixels have NaN statistics.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    labels = np.asarray(labels).ravel()
+    valid = np.isfinite(values) & (labels > 0)
+    v = values[valid]
+    lab = labels[valid].astype(np.intp)
+    size = n_zones + 1
+
+    count = np.bincount(lab, minlength=size)
+    total = np.bincount(lab, weights=v, minlength=size)
+    above = np.bincount(lab, weights=v > stable, minlength=size)
+    below = np.bincount(lab, weights=v < -stable, minlength=size)
+
+    # Median: sort by zone, then by value; the middle element(s) of each zone's run
+    order = np.lexsort((v, lab))
+    v_sorted = v[order]
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    has_data = count > 0
+    lo = starts + (count - 1) // 2
+    hi = starts + count // 2
+    median = np.full(size, np.nan)
+    median[has_data] = (v_sorted[lo[has_data]] + v_sorted[hi[has_data]]) / 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'count': count,
+            'mean': np.where(has_data, total / count, np.nan),
+            'median': median,
+            'above': np.where(has_data, above / count, np.nan),
+            'below': np.where(has_data, below / count, np.nan),
+        }
+
+
+def find_onsets(series, threshold=5, days=5):
+    """
+    Batched ``find_onset``: index of the first run of `days` consecutive values >= `threshold`
+    along the last axis of `series` (shape (..., time)). Series without such a run get -1.
+    Missing (NaN) days are treated as in ``find_onset``.
+    """
+    values = np.asarray(series, dtype=float)
+    if values.shape[-1] < days:
+        return np.full(values.shape[:-1], -1, dtype=np.intp)
+    missing = np.isnan(values)
+    windows = np.lib.stride_tricks.sliding_window_view
+    runs = (windows((values >= threshold) | missing, days, axis=-1).all(axis=-1)
+            & windows(~missing, days, axis=-1).any(axis=-1))
+    return np.where(runs.any(axis=-1), runs.argmax(axis=-1), -1)
+
+
+def lagged_correlation(x, y, max_lag):
+    """
+    Pearson correlation of x[t] with y[t - lag] for every lag in -max_lag..max_lag.
+
+    `x` and `y` have shape (..., time) and are broadcast against each other, so many
+    series pairs are correlated at all lags in one pass. Every lag uses the same
+    samples of `x` (t = max_lag .. time - max_lag - 1), so the correlations are
+    comparable. Returns an array of shape (..., 2 * max_lag + 1) ordered by lag;
+    a positive lag means `x` follows `y`. Pairs with NaN or a constant window are NaN.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.shape[-1] - 2 * max_lag
+    if n < 2:
+        raise ValueError(f"Series of length {x.shape[-1]} are too short for lags up to {max_lag}")
+
+    def standardize(values):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            centered = values - values.mean(axis=-1, keepdims=True)
+            return centered / np.sqrt((centered ** 2).sum(axis=-1, keepdims=True))
+
+    xs = standardize(x[..., max_lag:max_lag + n])
+    # Window k starts at sample k, i.e. it is y shifted by lag = max_lag - k
+    ys = standardize(np.lib.stride_tricks.sliding_window_view(y, n, axis=-1))
+    corr = np.einsum('...n,...kn->...k', xs, ys)
+    return corr[..., ::-1]
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: indices of `n_out` points of the series (x, y)
+    that keep its visual shape. The first and last points are always kept.
+
+    `x` must be increasing and `y` must not contain NaN; `n_out` must be at least 3.
+    Returns all indices if the series has at most `n_out` points.
+    """
+    if n_out < 3:
+        raise ValueError(f"LTTB needs at least 3 output points, got {n_out}")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+
+    # Bucket edges of the inner points (the first and last point have their own buckets)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    # Averages of every bucket plus the last point, computed at once; bucket i uses the average of bucket i + 1
+    starts = np.append(edges[:-1], n - 1)
+    widths = np.diff(np.append(starts, n))
+    avg_x = np.add.reduceat(x, starts) / widths
+    avg_y = np.add.reduceat(y, starts) / widths
+
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the triangle area (a, candidate, next bucket average); the constant factor does not matter
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
@@ -12,45 +12,39 @@ Tento skript vykonáva nasledujúce kroky:
 """
 
 import csv
-import json
-import os
 
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
 from decouple import config
 from sentinelhub import (
-    SentinelHubRequest,
-    DataCollection,
     MimeType,
     CRS,
     Geometry,
-    SHConfig,
-    MosaickingOrder
+    SHConfig
 )
 
-
-class park:
-    def __init__(self, nazov, suradnice):
-        self.nazov = nazov
-        self.suradnice = suradnice
+from source import imagery
+from source.fetch_backend import RasterRequest, fetch_raster, get_backend
+from source.green_areas import registry as green_areas
+from source.kernels import mean_ndvi
 
 
 # --- 1. ZÁKLADNÁ KONFIGURÁCIA ---
 
 # Načítanie prihlasovacích údajov z .env súboru
+CLIENT_ID = CLIENT_SECRET = None
 try:
     CLIENT_ID = config('CLIENT_ID')
     CLIENT_SECRET = config('CLIENT_SECRET')
 except Exception as e:
     print(
         f"Chyba: Nepodarilo sa načítať CLIENT_ID alebo CLIENT_SECRET z .env súboru. Uistite sa, že súbor existuje a premenné sú nastavené. Detaily: {e}")
-    exit()
 
 # Konfigurácia Sentinel Hub API
 sh_config = SHConfig()
-sh_config.sh_client_id = CLIENT_ID
-sh_config.sh_client_secret = CLIENT_SECRET
+if CLIENT_ID and CLIENT_SECRET:
+    sh_config.sh_client_id = CLIENT_ID
+    sh_config.sh_client_secret = CLIENT_SECRET
 
 # Definovanie časového rozsahu analýzy
 YEARS_TO_ANALYZE = [2020, 2021, 2022, 2023, 2024, 2025]
@@ -80,44 +74,8 @@ POLYGON_COORDINATES = [
 ]
 AOI_GEOMETRY = Geometry(geometry={"type": "Polygon", "coordinates": POLYGON_COORDINATES}, crs=CRS.WGS84)
 
-with open('static/geojson/parkJankaKrala.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    parkJankaKrala = park("Park Janka Kráľa", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/bernolakovPark.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    bernolakovPark = park("Bernolákov Park", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/ruzovyPark.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    ruzovyPark = park("Ružový Park", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/strky.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    strky = park("Park Strky", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/kamenac.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    kamenac = park("Park Kamenný mlyn", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/parkZaDruzbou.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    parkZaDruzbou = park("Park Za družbou", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/zahradkarskaOblast.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    zahradkarskaOblast = park("Záhradkárska Oblasť", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/nemocnicnyPark.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    nemocnicnyPark = park("Nemocnicny Park", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-with open('static/geojson/rybniky.geojson', 'r') as geojsonFile:
-    geojsonData = json.load(geojsonFile)
-    rybniky = park("Rybníky", geojsonData['features'][0]['geometry']['coordinates'][0])
-
-zelenePlochy = [parkJankaKrala, bernolakovPark, ruzovyPark, strky, kamenac, parkZaDruzbou, zahradkarskaOblast,
-                nemocnicnyPark, rybniky]
+# Analyzovaná zelená plocha (id z static/geojson, pozri source/green_areas.py)
+SELECTED_AREA = 'rybniky'
 
 # Výstupné parametre
 OUTPUT_SIZE = [1000, 1000]
@@ -157,8 +115,14 @@ function evaluatePixel(sample) {
 # --- 2. FUNKCIE PRE ANALÝZU ---
 
 def save_satellite_image(year, start_month, start_day, end_month, end_day, period_name, config, geometry, size,
-                         park_name):
-    """Stiahne a uloží RGB satelitný snímok s viditeľnými oblakmi."""
+                         area_id):
+    """
+    Stiahne a uloží RGB satelitný snímok s viditeľnými oblakmi do úložiska snímok (source/imagery.py).
+    Snímky, ktoré už sú uložené, sa znova nesťahujú.
+    """
+    if imagery.is_fresh(area_id, year, period_name, size):
+        print(f"RGB snímok pre {year} {period_name} je už uložený, preskakujem sťahovanie.")
+        return True
     print(f"Sťahujem RGB snímok pre {year} {period_name}...")
 
     # Upravíme konečný deň pre priestupné roky
@@ -168,45 +132,18 @@ def save_satellite_image(year, start_month, start_day, end_month, end_day, perio
 
     time_interval = (f'{year}-{start_month:02d}-{start_day:02d}', f'{year}-{end_month:02d}-{end_day:02d}')
 
-    request = SentinelHubRequest(
-        evalscript=EVALSCRIPT_TRUE_COLOR,
-        input_data=[
-            SentinelHubRequest.input_data(
-                data_collection=DataCollection.SENTINEL2_L2A,
-                time_interval=time_interval,
-                mosaicking_order=MosaickingOrder.LEAST_CC,
-            )
-        ],
-        responses=[
-            SentinelHubRequest.output_response('default', MimeType.PNG)
-        ],
-        geometry=geometry,
-        size=size,
-        config=config
-    )
+    request = RasterRequest(EVALSCRIPT_TRUE_COLOR, time_interval, geometry, size, MimeType.PNG, config,
+                            label='true_color')
 
     try:
-        data = request.get_data(save_data=False)
-        if not data:
+        data = fetch_raster(request)
+        if data is None:
             print(f"Varovanie: Pre {year} {period_name} neboli vrátené žiadne RGB dáta.")
             return False
 
-        # Vytvoríme výstupný adresár ak neexistuje
-        output_dir = 'static/output/satelite'
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Uložíme obrázok
-        rgb_image = data[0]
-        safe_park_name = park_name.replace(' ', '_').replace('á', 'a').replace('ô', 'o').replace('ý', 'y').replace('ž',
-                                                                                                                   'z')
-        safe_period_name = period_name.replace(' ', '_').replace('-', '_')
-        filename = f"{output_dir}/{safe_park_name}_{year}_{safe_period_name}.png"
-
-        # Konvertujeme numpy array na PIL Image a uložíme
-        img = Image.fromarray(rgb_image)
-        img.save(filename)
-
-        print(f"✅ RGB snímok uložený: {filename}")
+        # Rovnaký snímok sa uloží iba raz; WebP zmenšeniny sa generujú na pozadí
+        scene = imagery.store_image(area_id, year, period_name, time_interval, size, data)
+        print(f"✅ RGB snímok uložený: scéna {scene}")
         return True
     except Exception as e:
         print(f"Chyba pri sťahovaní RGB snímku za {year} {period_name}: {e}")
@@ -224,42 +161,27 @@ def get_ndvi_for_period(year, start_month, start_day, end_month, end_day, period
 
     time_interval = (f'{year}-{start_month:02d}-{start_day:02d}', f'{year}-{end_month:02d}-{end_day:02d}')
 
-    request = SentinelHubRequest(
-        evalscript=EVALSCRIPT_NDVI,
-        input_data=[
-            SentinelHubRequest.input_data(
-                data_collection=DataCollection.SENTINEL2_L2A,
-                time_interval=time_interval,
-                mosaicking_order=MosaickingOrder.LEAST_CC,
-            )
-        ],
-        responses=[SentinelHubRequest.output_response('default', OUTPUT_FORMAT)],
-        geometry=geometry,
-        size=size,
-        config=config
-    )
+    request = RasterRequest(EVALSCRIPT_NDVI, time_interval, geometry, size, OUTPUT_FORMAT, config, label='ndvi')
     try:
-        data = request.get_data(save_data=False)
-        if not data:
+        data = fetch_raster(request)
+        if data is None:
             print(f"Varovanie: Pre {year} {period_name} neboli vrátené žiadne dáta.")
             return None
-        ndvi_array = data[0]
-        # Vypočítame priemernú hodnotu NDVI pre celú oblasť
-        # filter out hodnoty >0,35
-        filtered_values = ndvi_array[(ndvi_array != 0) & (ndvi_array >= 0.4)]
+        ndvi_array = data
+        # Vypočítame priemernú hodnotu NDVI pre celú oblasť (iba pixely s NDVI >= 0.4)
+        result = mean_ndvi(ndvi_array)
+        if result is None:
+            print(f"Varovanie: Pre {year} {period_name} neboli nájdené žiadne nenulové hodnoty")
+            return None
 
-        if len(filtered_values) == 0:
+        mean_value, pixel_count, used_fallback = result
+        if used_fallback:
             print(f"Varovanie: Pre {year} {period_name} neboli nájdené žiadne hodnoty >= 0.4")
             print(f"  Rozsah hodnôt v poli: {np.min(ndvi_array):.4f} až {np.max(ndvi_array):.4f}")
-            print(f"  Počet nenulových hodnôt: {np.count_nonzero(ndvi_array)}")
-            # Použijeme všetky nenulové hodnoty
-            filtered_values = ndvi_array[ndvi_array != 0]
-            if len(filtered_values) == 0:
-                return None
-
-        mean_ndvi = np.mean(filtered_values)
-        print(f"DEBUG [{year} {period_name}]: Priemerná NDVI: {mean_ndvi:.4f} (z {len(filtered_values)} pixelov)")
-        return mean_ndvi
+            print(f"  Počet nenulových hodnôt: {pixel_count}")
+
+        print(f"DEBUG [{year} {period_name}]: Priemerná NDVI: {mean_value:.4f} (z {pixel_count} pixelov)")
+        return mean_value
     except Exception as e:
         print(f"Chyba pri sťahovaní dát za {year} {period_name}: {e}")
         return None
@@ -271,21 +193,24 @@ def main():
     """Hlavná funkcia, ktorá orchesteruje celý proces analýzy."""
     print("--- Spúšťam dlhodobú analýzu priemernej NDVI ---")
 
+    if get_backend().requires_credentials and not sh_config.sh_client_id:
+        print("Chyba: CLIENT_ID nie je nastavené. Nastavte ho v .env súbore alebo použite FETCH_BACKEND=replay.")
+        return
+
     # Vytvorenie grafu
     print("\n--- Vytváram graf priemernej NDVI ---")
     plt.figure(figsize=(14, 8))
 
     all_values = []  # Pre výpočet správnych limitov grafu
 
-    # Vyberieme prvý park pre porovnanie rokov
-    selected_park = zelenePlochy[8]  # Defaultne prvý park, môžete zmeniť index
-
-    aoi_geometry = Geometry(
-        geometry={"type": "Polygon", "coordinates": [selected_park.suradnice]},
-        crs=CRS.WGS84
-    )
+    # Vyberieme park pre porovnanie rokov
+    selected_park = green_areas.get(SELECTED_AREA)
+    if selected_park is None:
+        print(f"Chyba: Zelená plocha '{SELECTED_AREA}' neexistuje. Dostupné: {[a.id for a in green_areas.all()]}")
+        return
+    aoi_geometry = selected_park.geometry()
 
-    print(f"\n--- Analyzujem park: {selected_park.nazov} ---")
+    print(f"\n--- Analyzujem park: {selected_park.name} ---")
     print(f"--- Porovnávam jednotlivé roky (2-týždňové obdobia) ---")
 
     # Slovník na uloženie dát pre každý rok: {rok: [hodnoty pre každé 2-týždňové obdobie]}
@@ -306,7 +231,7 @@ def main():
 
             # Stiahnutie a uloženie RGB satelitného snímku
             save_satellite_image(year, start_month, start_day, end_month, end_day, period_name,
-                                 sh_config, aoi_geometry, OUTPUT_SIZE, selected_park.nazov)
+                                 sh_config, aoi_geometry, OUTPUT_SIZE, selected_park.id)
 
     # Vytvorenie kriviek pre každý rok
     colors = ['red', 'blue', 'green', 'orange', 'purple', 'brown', 'pink', 'gray', 'olive', 'cyan']
@@ -339,7 +264,7 @@ def main():
 
     plt.xlabel('2-týždňové obdobie', fontsize=12, fontweight='bold')
     plt.ylabel('Priemerná NDVI', fontsize=12, fontweight='bold')
-    plt.title(f'Porovnanie NDVI naprieč rokmi (2-týždňové obdobia) - {selected_park.nazov}',
+    plt.title(f'Porovnanie NDVI naprieč rokmi (2-týždňové obdobia) - {selected_park.name}',
               fontsize=14, fontweight='bold')
     plt.xticks(rotation=45, ha='right', fontsize=9)
     plt.grid(True, alpha=0.3, linestyle='--')
@@ -347,12 +272,13 @@ def main():
     plt.tight_layout()
 
     # Uloženie grafu
-    output_filename = f"ndvi_yearly_comparison_{YEARS_TO_ANALYZE[0]}_{YEARS_TO_ANALYZE[-1]}_{selected_park.nazov.replace(' ', '_')}.png"
+    # Názvy súborov podľa id oblasti, aby zostali ASCII a nemenili sa pri premenovaní parku
+    output_filename = f"ndvi_yearly_comparison_{YEARS_TO_ANALYZE[0]}_{YEARS_TO_ANALYZE[-1]}_{selected_park.id}.png"
     plt.savefig(output_filename, dpi=300, bbox_inches='tight')
     print(f"\n✅ Graf úspešne uložený ako: {output_filename}")
 
     # Uloženie dát do CSV súboru
-    csv_filename = f"ndvi_yearly_comparison_{YEARS_TO_ANALYZE[0]}_{YEARS_TO_ANALYZE[-1]}_{selected_park.nazov.replace(' ', '_')}.csv"
+    csv_filename = f"ndvi_yearly_comparison_{YEARS_TO_ANALYZE[0]}_{YEARS_TO_ANALYZE[-1]}_{selected_park.id}.csv"
     with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
         csv_writer = csv.writer(csvfile)
 
@@ -11,27 +11,42 @@ This script performs the following steps:
    (improvement, deterioration, stable).
 """
 
+import contextvars
+import hashlib
+import json
+import math
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
 import matplotlib
 import numpy as np
 from decouple import config
 
-matplotlib.use('Agg')  # Must be before importing pyplot to prevent crash on macOS
-import matplotlib.pyplot as plt
+matplotlib.use('Agg')  # Non-interactive backend, prevents crash on macOS
 from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.figure import Figure
 from sentinelhub import (
-    SentinelHubRequest,
-    DataCollection,
     MimeType,
     CRS,
     Geometry,
-    SHConfig,
-    MosaickingOrder
+    SHConfig
 )
+from shapely.geometry import mapping
+
+from source import pu_budget
+from source.datacube import open_cube
+from source.fetch_backend import RasterRequest, fetch_raster, get_backend
+from source.green_areas import METERS_PER_DEGREE, registry as green_areas
+from source.kernels import trend_slope, zonal_stats
+from source.shared_cache import cache
 
 # --- 1. BASIC CONFIGURATION ---
 
 # Loading credentials from .env file
+CLIENT_ID = CLIENT_SECRET = None
 try:
     CLIENT_ID = config('CLIENT_ID')
     CLIENT_SECRET = config('CLIENT_SECRET')
@@ -57,10 +72,42 @@ POLYGON_COORDINATES = [
 ]
 AOI_GEOMETRY = Geometry(geometry={"type": "Polygon", "coordinates": POLYGON_COORDINATES}, crs=CRS.WGS84)
 
+# Analysed seasons (pollen seasons) mapped to their month and day ranges
+POLLEN_TO_MONTHS = {
+    "early_spring": ("02-01", "03-31"),
+    "mid_spring": ("04-01", "05-31"),
+    "late_spring": ("06-01", "08-31"),
+    "year": ("01-01", "12-31"),
+}
+
 # Output parameters
 OUTPUT_SIZE = [500, 500]  # Reduced size for faster testing
 OUTPUT_FORMAT = MimeType.TIFF
 
+# Resolution levels of the trend map pyramid: a coarse preview is returned first,
+# the full-resolution map is computed afterwards and replaces it
+PYRAMID_LEVELS = {
+    'preview': [100, 100],
+    'full': OUTPUT_SIZE,
+}
+
+# Lifetime (seconds) of cached trend results that include the current year
+TREND_CACHE_TTL = config('TREND_CACHE_TTL', default=24 * 3600, cast=int)
+
+# Slopes (NDVI change per year) within ±TREND_STABLE_SLOPE count as stable in the per-park statistics
+TREND_STABLE_SLOPE = config('TREND_STABLE_SLOPE', default=0.005, cast=float)
+
+# Number of threads computing full-resolution maps in the background (progressive mode)
+TREND_BACKGROUND_WORKERS = config('TREND_BACKGROUND_WORKERS', default=2, cast=int)
+
+# Seconds a background computation counts as pending for all worker processes (if its process dies, it stops
+# counting after that time)
+TREND_PENDING_TTL = config('TREND_PENDING_TTL', default=1800, cast=int)
+
+# Raster sides of custom areas: Sentinel Hub accepts at most 2500 px, tiny parks still get a readable map
+MAX_REQUEST_SIZE = 2500
+MIN_REQUEST_SIZE = 16
+
 # Evalscript for NDVI calculation
 EVALSCRIPT_NDVI = """
 //VERSION=3
@@ -71,6 +118,7 @@ function setup() {
   };
 }
 function evaluatePixel(sample) {
+  // dataMask is also 0 outside the request polygon, so only pixels of the analysed area carry values
   if (sample.dataMask === 0) { return [NaN]; } // Use NaN for no data
   let ndvi = (sample.B08 - sample.B04) / (sample.B08 + sample.B04);
   return [ndvi];
@@ -80,120 +128,430 @@ function evaluatePixel(sample) {
 
 # --- 2. ANALYSIS FUNCTIONS ---
 
+def geometry_digest(geometry):
+    """Short hash of a sentinelhub Geometry, naming its datacubes, cache entries and maps."""
+    return hashlib.sha1(
+        json.dumps([geometry.geojson, str(geometry.crs)], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def ndvi_cube(geometry, size):
+    """Datacube of the NDVI rasters downloaded for the given geometry and raster size."""
+    return open_cube(f"ndvi_{geometry_digest(geometry)}_{size[0]}x{size[1]}", size)
+
+
+def custom_geometry(polygon):
+    """sentinelhub Geometry of a shapely polygon (WGS84), remembered in the shared cache under its digest."""
+    geometry = Geometry(geometry=mapping(polygon), crs=CRS.WGS84)
+    cache.set(f"geometry:{geometry_digest(geometry)}", geometry.geojson)
+    return geometry
+
+
+def stored_geometry(digest):
+    """Geometry registered with custom_geometry, or None."""
+    geojson = cache.get(f"geometry:{digest}")
+    return None if geojson is None else Geometry(geometry=geojson, crs=CRS.WGS84)
+
+
+def _extent_m(geometry):
+    bbox = geometry.bbox
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians((bbox.min_y + bbox.max_y) / 2))
+    return (bbox.max_x - bbox.min_x) * scale_x, (bbox.max_y - bbox.min_y) * METERS_PER_DEGREE
+
+
+def level_size(level='full', geometry=None):
+    """
+    Raster size of a pyramid level. The city AOI (geometry None) uses PYRAMID_LEVELS; a custom geometry is
+    requested on its own bounding box with the same pixel size in metres, so a park costs a fraction of the city.
+    Raises ValueError if the geometry is too large for one request.
+    """
+    if geometry is None:
+        return PYRAMID_LEVELS[level]
+    city_width, city_height = _extent_m(AOI_GEOMETRY)
+    width, height = _extent_m(geometry)
+    level_width, level_height = PYRAMID_LEVELS[level]
+    size = [max(MIN_REQUEST_SIZE, math.ceil(width / (city_width / level_width))),
+            max(MIN_REQUEST_SIZE, math.ceil(height / (city_height / level_height)))]
+    if max(size) > MAX_REQUEST_SIZE:
+        raise ValueError(f"The area needs a {size[0]}x{size[1]} px raster, at most {MAX_REQUEST_SIZE} px are allowed")
+    return size
+
+
+def interval_label(year, target_month_start, target_month_end):
+    return f"{year}-{target_month_start}/{year}-{target_month_end}"
+
+
+def _layer_is_fresh(cube, label):
+    """Stored layers are final once their interval has ended; layers of a running interval expire."""
+    fetched_at = cube.fetched_at(label)
+    if fetched_at is None:
+        return False
+    interval_end = date.fromisoformat(label.split('/')[1])
+    if date.fromtimestamp(fetched_at) > interval_end:
+        return True
+    return time.time() - fetched_at < TREND_CACHE_TTL
+
+
 def get_ndvi_for_year(year, target_month_start, target_month_end, config, geometry, size):
-    """Downloads NDVI data for the specified year and month range."""
+    """
+    Returns NDVI data for the specified year and month range.
+    Rasters are read from the datacube if they were downloaded before; new downloads are added to it.
+    """
+    cube = ndvi_cube(geometry, size)
+    label = interval_label(year, target_month_start, target_month_end)
+    if _layer_is_fresh(cube, label):
+        return cube.read_layer(label)
+    # With little of the processing unit budget left, a stored layer of a running interval is not refreshed
+    if cube.fetched_at(label) is not None and pu_budget.is_low():
+        print(f"Processing unit budget is low, using the stored layer {label}")
+        return cube.read_layer(label)
+
     print(f"Downloading data for year {year} (period {target_month_start} to {target_month_end})...")
     time_interval = (f'{year}-{target_month_start}', f'{year}-{target_month_end}')
-    request = SentinelHubRequest(
-        evalscript=EVALSCRIPT_NDVI,
-        input_data=[
-            SentinelHubRequest.input_data(
-                data_collection=DataCollection.SENTINEL2_L2A,
-                time_interval=time_interval,
-                mosaicking_order=MosaickingOrder.LEAST_CC,
-            )
-        ],
-        responses=[SentinelHubRequest.output_response('default', OUTPUT_FORMAT)],
-        geometry=geometry,
-        size=size,
-        config=config
-    )
+    request = RasterRequest(EVALSCRIPT_NDVI, time_interval, geometry, size, OUTPUT_FORMAT, config, label='ndvi')
     try:
-        data = request.get_data(save_data=False)
-        if not data:
+        data = fetch_raster(request)
+        if data is None:
             print(f"Warning: No data returned for year {year}.")
             return None
-        ndvi_array = data[0]
+        ndvi_array = data
         # Replace zeros (usually no-data) with NaN to not affect calculations
         ndvi_array[ndvi_array == 0] = np.nan
         print(
             f"DEBUG [{year}]: Data shape: {ndvi_array.shape}, Min: {np.nanmin(ndvi_array):.4f}, Max: {np.nanmax(ndvi_array):.4f}, Mean: {np.nanmean(ndvi_array):.4f}")
+        cube.append(label, ndvi_array)
         return ndvi_array
+    except pu_budget.BudgetExceeded:
+        # Not a missing year: the caller must not continue with the other years
+        raise
     except Exception as e:
         print(f"Error downloading data for year {year}: {e}")
         return None
 
 
-def generate_trend_map(years_to_analyze, target_month_start, target_month_end):
+def compute_trend(years_to_analyze, target_month_start, target_month_end, geometry=AOI_GEOMETRY, size=OUTPUT_SIZE,
+                  job=None):
     """
-    Main function that orchestrates the entire analysis process and returns the path to the generated image.
+    Downloads NDVI for each year and calculates the per-pixel trend.
+    Returns (valid_years, trend_map), or None if fewer than two years have data.
+
+    If `job` (source.progress.AnalysisJob) is given, progress is reported after each
+    download and the job's cancellation is checked before each one.
     """
+    if get_backend().requires_credentials and not sh_config.sh_client_id:
+        raise Exception("Configuration error: Sentinel Hub Client ID is not set.")
+
+    # Downloaded rasters go to the datacube; only the list of years with data is kept in memory
+    valid_years = []
+    for i, year in enumerate(years_to_analyze):
+        if job:
+            job.check_cancelled()
+        data = get_ndvi_for_year(year, target_month_start, target_month_end, sh_config, geometry, size)
+        # Filter out years for which data download failed
+        if data is not None and not np.isnan(data).all():
+            valid_years.append(year)
+        if job:
+            job.emit('download', year=year, done=i + 1, total=len(years_to_analyze), ok=data is not None)
+        del data
+
+    if len(valid_years) < 2:
+        print("Error: Trend analysis requires data from at least two valid years. Exiting.")
+        return None
+
+    if job:
+        job.check_cancelled()
+        job.emit('trend')
+    print("Calculating trend for each pixel...")
+    # The (years, height, width) stack is read from the datacube one spatial chunk at a time
+    cube = ndvi_cube(geometry, size)
+    labels = [interval_label(year, target_month_start, target_month_end) for year in valid_years]
+    trend_map = cube.map_blocks(labels, trend_slope, dtype=np.float64)
+
+    print("Trend calculation finished.")
     print(
-        f"--- Starting long-term NDVI trend analysis for years {years_to_analyze} and period {target_month_start}-{target_month_end} ---")
+        f"DEBUG: Trend map statistics - Min: {np.nanmin(trend_map):.4f}, Max: {np.nanmax(trend_map):.4f}, Mean: {np.nanmean(trend_map):.4f}")
+    return valid_years, trend_map
 
-    if not sh_config.sh_client_id:
-        raise Exception("Configuration error: Sentinel Hub Client ID is not set.")
 
-    yearly_ndvi_data = [
-        get_ndvi_for_year(year, target_month_start, target_month_end, sh_config, AOI_GEOMETRY, OUTPUT_SIZE) for year in
-        years_to_analyze]
+def save_map_image(raster, filename, cmap, vlim, colorbar_label, title):
+    """
+    Saves a raster as a color-coded PNG in static/output and returns its path.
+    `vlim` is the symmetric color range (-vlim..vlim) or a (vmin, vmax) tuple.
+    """
+    vmin, vmax = vlim if isinstance(vlim, tuple) else (-vlim, vlim)
+    # Object-oriented Figure API instead of pyplot: pyplot keeps global state and is not
+    # safe when several requests render maps at the same time in a threaded server
+    fig = Figure(figsize=(12, 10))
+    ax = fig.subplots()
+
+    img = ax.imshow(raster, cmap=cmap, vmin=vmin, vmax=vmax)
+    fig.colorbar(img, ax=ax, label=colorbar_label)
+    ax.set_title(title)
+    ax.set_xlabel("Pixel X")
+    ax.set_ylabel("Pixel Y")
+
+    # Saving to static folder
+    output_dir = "static/output"
+    os.makedirs(output_dir, exist_ok=True)
+    output_filepath = os.path.join(output_dir, filename)
+
+    # Write to a temporary file first so that a concurrent request never serves a half-written image
+    tmp_filepath = f"{output_filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fig.savefig(tmp_filepath, dpi=150, format='png')  # Reduced DPI for faster generation
+    os.replace(tmp_filepath, output_filepath)
+    return output_filepath
 
-    # Filter out years for which data download failed
-    valid_years_data = [(year, data) for year, data in zip(years_to_analyze, yearly_ndvi_data) if
-                        data is not None and not np.isnan(data).all()]
 
-    if len(valid_years_data) < 2:
-        print("Error: Trend analysis requires data from at least two valid years. Exiting.")
-        return None
+def render_trend_map(trend_map, valid_years, target_month_start, target_month_end, level='full', geometry=None,
+                     name='Trnava'):
+    """Renders the trend map into a PNG in static/output and returns its path."""
+    print("Creating and saving trend map...")
 
-    # Unpack valid data
-    valid_years, yearly_ndvi_data = zip(*valid_years_data)
+    cmap_trend = LinearSegmentedColormap.from_list("trend_map", [(0, "red"), (0.5, "white"), (1, "green")])
 
-    # Stack data into a single 3D numpy array (years, height, width)
-    y = np.stack(yearly_ndvi_data, axis=0)
-    print(f"DEBUG: Shape of stacked array (y): {y.shape}")
+    # Ignore NaN when calculating percentile
+    vlim = np.nanpercentile(np.abs(trend_map), 98)
+    if vlim == 0: vlim = 1.0
 
-    print("Calculating trend for each pixel...")
-    n_years = y.shape[0]
-    x = np.arange(n_years)
-    x_reshaped = x.reshape(n_years, 1, 1)
+    # The full year list is part of the name unless it is a contiguous range
+    if list(valid_years) == list(range(valid_years[0], valid_years[-1] + 1)):
+        years_label = f"{valid_years[0]}-{valid_years[-1]}"
+    else:
+        years_label = '_'.join(str(year) for year in valid_years)
+    level_suffix = '' if level == 'full' else f"_{level}"
+    geometry_suffix = '' if geometry is None else f"_{geometry_digest(geometry)}"
+    filename = f"trend_map_{years_label}_{target_month_start.replace('-','')}_{target_month_end.replace('-','')}{geometry_suffix}{level_suffix}.png"
+
+    output_filepath = save_map_image(trend_map, filename, cmap_trend, vlim, "NDVI Trend Slope (change per year)",
+                                     f"Vegetation Development Trend in {name} ({valid_years[0]}-{valid_years[-1]})")
+
+    print(f"✅ Trend map successfully saved as: {output_filepath}")
+    return output_filepath
 
-    # Use nanmean to ignore pixels without data
-    mean_x = np.mean(x)
-    mean_y = np.nanmean(y, axis=0)
 
-    # Calculate numerator and denominator, ignoring NaN values
-    numerator = np.nansum((x_reshaped - mean_x) * (y - mean_y), axis=0)
-    denominator = np.sum((x - mean_x) ** 2)
+def compute_trend_zones(trend_map, size, geometry=AOI_GEOMETRY):
+    """
+    Per-park statistics of a trend raster: mean and median slope, share of improving and
+    declining pixels and the number of valid pixels. Uses one label image of all parks
+    (cached per grid) and a single bincount pass.
+    """
+    bbox = geometry.bbox
+    labels, areas = green_areas.label_image((bbox.min_x, bbox.min_y, bbox.max_x, bbox.max_y), size)
+    stats = zonal_stats(trend_map, labels, len(areas), TREND_STABLE_SLOPE)
+    pixels = np.bincount(labels.ravel(), minlength=len(areas) + 1)
+
+    def number(value, digits=5):
+        return None if np.isnan(value) else round(float(value), digits)
+
+    zones = []
+    for i, area in enumerate(areas, start=1):
+        # Maps of a single park or district do not cover the other parks
+        if pixels[i] == 0:
+            continue
+        zones.append({
+            'id': area.id,
+            'name': area.name,
+            'pixels': int(pixels[i]),
+            'valid_pixels': int(stats['count'][i]),
+            'mean_slope': number(stats['mean'][i]),
+            'median_slope': number(stats['median'][i]),
+            'improving_pct': number(stats['above'][i] * 100, 2),
+            'declining_pct': number(stats['below'][i] * 100, 2),
+        })
+    return {'areas_version': green_areas.version, 'stable_slope': TREND_STABLE_SLOPE, 'zones': zones}
+
+
+def zones_path(image_path):
+    """The per-park statistics are stored next to the trend map: map.png -> map.json."""
+    return os.path.splitext(image_path)[0] + '.json'
+
+
+def save_trend_zones(image_path, trend_map, size, valid_years, geometry=None, period=None):
+    """
+    Computes and stores the per-park statistics next to the map. With `period` (month_start, month_end),
+    they also become the latest trend of every park they cover (see latest_area_trend).
+    """
+    zones = compute_trend_zones(trend_map, size, geometry or AOI_GEOMETRY)
+    zones['years'] = list(valid_years)
+    path = zones_path(image_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(zones, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
-    trend_map = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+    if period is not None:
+        for zone in zones['zones']:
+            if zone['valid_pixels']:
+                cache.set(_area_trend_key(zone['id']), {
+                    **{key: value for key, value in zone.items() if key not in ('id', 'name')},
+                    'years': list(valid_years),
+                    'months': list(period),
+                    'image_path': image_path,
+                    'computed_at': time.time(),
+                })
+    return zones
 
-    # Masking areas with no valid data
-    trend_map[np.isnan(mean_y)] = np.nan
 
-    print("Trend calculation finished.")
+def _area_trend_key(area_id):
+    return f"area_trend:{area_id}"
+
+
+def latest_area_trend(area_id):
+    """Statistics of the park from the most recently computed trend map that covers it, or None."""
+    return cache.get(_area_trend_key(area_id))
+
+
+def trend_zones(years_to_analyze, target_month_start, target_month_end, level='full', geometry=None):
+    """
+    Returns the per-park statistics of an already generated trend map, or None if the map does not exist.
+    They are recomputed from the cached raster when the green areas have changed since.
+    """
+    size = level_size(level, geometry)
+    key = trend_cache_key(years_to_analyze, target_month_start, target_month_end, size, geometry)
+    cached = cache.get(key)
+    if cached is None or not os.path.exists(cached['image_path']):
+        return None
+    try:
+        with open(zones_path(cached['image_path']), encoding='utf-8') as f:
+            zones = json.load(f)
+        if zones.get('areas_version') == green_areas.version:
+            return zones
+    except (OSError, ValueError):
+        pass
+    return save_trend_zones(cached['image_path'], cached['trend_map'], size, cached['years'], geometry,
+                            (target_month_start, target_month_end))
+
+
+def trend_cache_key(years_to_analyze, target_month_start, target_month_end, size=OUTPUT_SIZE, geometry=None):
+    years = ','.join(str(year) for year in years_to_analyze)
+    key = f"trend:{years}:{target_month_start}:{target_month_end}:{size[0]}x{size[1]}"
+    return key if geometry is None else f"{key}:{geometry_digest(geometry)}"
+
+
+def generate_trend_map(years_to_analyze, target_month_start, target_month_end, job=None, level='full', geometry=None,
+                       name='Trnava'):
+    """
+    Main function that orchestrates the entire analysis process and returns the path to the generated image.
+    Results are kept in the shared cache, so every worker process can reuse them.
+    `job` is an optional source.progress.AnalysisJob that receives progress events,
+    `level` selects the resolution from PYRAMID_LEVELS. `geometry` (sentinelhub Geometry) analyses another area
+    than the city AOI, at the same resolution (see level_size); `name` is the area name shown in the title.
+    """
     print(
-        f"DEBUG: Trend map statistics - Min: {np.nanmin(trend_map):.4f}, Max: {np.nanmax(trend_map):.4f}, Mean: {np.nanmean(trend_map):.4f}")
+        f"--- Starting long-term NDVI trend analysis for years {years_to_analyze} and period {target_month_start}-{target_month_end} ({level}) ---")
 
-    print("Creating and saving trend map...")
-    with plt.style.context('default'):
-        cmap_trend = LinearSegmentedColormap.from_list("trend_map", [(0, "red"), (0.5, "white"), (1, "green")])
-        plt.figure(figsize=(12, 10))
-
-        # Ignore NaN when calculating percentile
-        vlim = np.nanpercentile(np.abs(trend_map), 98)
-        if vlim == 0: vlim = 1.0
-
-        img = plt.imshow(trend_map, cmap=cmap_trend, vmin=-vlim, vmax=vlim)
-        plt.colorbar(img, label="NDVI Trend Slope (change per year)")
-        plt.title(f"Vegetation Development Trend in Trnava ({valid_years[0]}-{valid_years[-1]})")
-        plt.xlabel("Pixel X")
-        plt.ylabel("Pixel Y")
-
-        # Saving to static folder
-        output_dir = "static/output"
-        os.makedirs(output_dir, exist_ok=True)
-
-        filename = f"trend_map_{valid_years[0]}-{valid_years[-1]}_{target_month_start.replace('-','')}_{target_month_end.replace('-','')}.png"
-        output_filepath = os.path.join(output_dir, filename)
-        
-        plt.savefig(output_filepath, dpi=150)  # Reduced DPI for faster generation
-        plt.close()  # Freeing memory
+    size = level_size(level, geometry)
+    cached = cached_trend_map(years_to_analyze, target_month_start, target_month_end, level, geometry)
+    if cached is not None:
+        print(f"Using cached trend map: {cached}")
+        return cached
 
-    print(f"✅ Trend map successfully saved as: {output_filepath}")
+    result = compute_trend(years_to_analyze, target_month_start, target_month_end, geometry=geometry or AOI_GEOMETRY,
+                           size=size, job=job)
+    if result is None:
+        return None
+    valid_years, trend_map = result
+
+    if job:
+        job.check_cancelled()
+        job.emit('render')
+    output_filepath = render_trend_map(trend_map, valid_years, target_month_start, target_month_end, level, geometry,
+                                       name)
+    save_trend_zones(output_filepath, trend_map, size, valid_years, geometry, (target_month_start, target_month_end))
+
+    # Data of the current year still change, so such results expire
+    ttl = TREND_CACHE_TTL if max(years_to_analyze) >= date.today().year else None
+    cache.set(trend_cache_key(years_to_analyze, target_month_start, target_month_end, size, geometry),
+              {'image_path': output_filepath, 'years': valid_years, 'trend_map': trend_map.astype(np.float32)},
+              ttl=ttl)
     return output_filepath
 
 
+def cached_trend_map(years_to_analyze, target_month_start, target_month_end, level='full', geometry=None):
+    """Returns the path of an already generated trend map of the given pyramid level, or None."""
+    key = trend_cache_key(years_to_analyze, target_month_start, target_month_end, level_size(level, geometry),
+                          geometry)
+    cached = cache.get(key)
+    if cached is not None and os.path.exists(cached['image_path']):
+        return cached['image_path']
+    return None
+
+
+def estimate_trend_map(years_to_analyze, target_month_start, target_month_end, level='full', geometry=None):
+    """
+    Processing units that generating a trend map would cost: one NDVI request per year whose layer is not in
+    the datacube yet (0 for a cached map).
+    """
+    if cached_trend_map(years_to_analyze, target_month_start, target_month_end, level, geometry):
+        return 0.0
+    size = level_size(level, geometry)
+    cube = ndvi_cube(geometry or AOI_GEOMETRY, size)
+    # As in get_ndvi_for_year, stored layers of a running interval are not refreshed while the budget is low
+    reuse_stored = pu_budget.is_low()
+    missing = 0
+    for year in years_to_analyze:
+        label = interval_label(year, target_month_start, target_month_end)
+        if not (_layer_is_fresh(cube, label) or reuse_stored and cube.fetched_at(label) is not None):
+            missing += 1
+    return pu_budget.estimate_job(EVALSCRIPT_NDVI, size, missing)
+
+
+def can_afford_trend_map(years_to_analyze, target_month_start, target_month_end, level='full', geometry=None):
+    """True if the whole trend map fits into the processing unit budgets, checked before its first download."""
+    estimated = estimate_trend_map(years_to_analyze, target_month_start, target_month_end, level, geometry)
+    return pu_budget.can_afford(estimated, get_backend())
+
+
+# Full-resolution maps requested progressively are computed in the background
+_background = ThreadPoolExecutor(max_workers=TREND_BACKGROUND_WORKERS, thread_name_prefix='trend-full')
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def schedule_trend_map(years_to_analyze, target_month_start, target_month_end, level='full', geometry=None,
+                       name='Trnava'):
+    """
+    Starts generating the given level in the background; returns the Future, or None if another worker
+    process is already generating it.
+    """
+    key = trend_cache_key(years_to_analyze, target_month_start, target_month_end, level_size(level, geometry),
+                          geometry)
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            if cache.get(_pending_key(key)) is not None:
+                return None
+            # The marker in the shared cache lets every worker process report the map as pending
+            cache.set(_pending_key(key), os.getpid(), ttl=TREND_PENDING_TTL)
+            # The copied context keeps the requesting client, who is charged the processing units
+            future = _background.submit(contextvars.copy_context().run, generate_trend_map, years_to_analyze,
+                                        target_month_start, target_month_end, level=level, geometry=geometry,
+                                        name=name)
+            _pending[key] = future
+            future.add_done_callback(lambda f: _forget_pending(key, f))
+        return future
+
+
+def _pending_key(key):
+    return f"pending:{key}"
+
+
+def _forget_pending(key, future):
+    with _pending_lock:
+        _pending.pop(key, None)
+        cache.delete(_pending_key(key))
+    if future.exception() is not None:
+        print(f"Error: Background generation of {key} failed: {future.exception()}")
+
+
+def is_trend_map_pending(years_to_analyze, target_month_start, target_month_end, level='full', geometry=None):
+    key = trend_cache_key(years_to_analyze, target_month_start, target_month_end, level_size(level, geometry),
+                          geometry)
+    with _pending_lock:
+        if key in _pending:
+            return True
+    return cache.get(_pending_key(key)) is not None
+
+
 # --- 3. MAIN PROCESSING (for direct execution) ---
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Per-pixel vegetation phenology (start, peak and end of the growing season) for Trnava.
+
+Instead of collapsing each bi-weekly raster to one park mean, the engine keeps
+the full stack of half-month NDVI composites (February to November) for the
+AOI and derives the season per pixel:
+
+1. ``fetch_composites`` makes sure the composites of a year are in the NDVI
+   datacube (``source/datacube.py``); composites stored before are not downloaded again,
+2. ``compute_phenology`` reads the cube one spatial chunk at a time, so memory
+   stays bounded for any raster size: gaps are interpolated in time and the season
+   is found with the threshold or derivative method (``source.kernels.season_metrics``),
+3. ``phenology_map`` renders the green-up (start of season) map and compares its
+   median with the temperature onset used by the ``/api/plot`` chart
+   (first 5 consecutive days with a mean temperature >= 5°C).
+
+Usage (from the project root):
+
+    python -m source.phenology 2024
+    python -m source.phenology 2024 --method derivative
+"""
+
+import argparse
+import calendar
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+from matplotlib.colors import LinearSegmentedColormap
+
+from source.fetch_backend import get_backend
+from source.kernels import fill_time_gaps, find_onset, season_metrics
+from source.long_term_analysis_trnava import (
+    AOI_GEOMETRY,
+    OUTPUT_SIZE,
+    TREND_CACHE_TTL,
+    get_ndvi_for_year,
+    interval_label,
+    ndvi_cube,
+    save_map_image,
+    sh_config
+)
+from source.shared_cache import cache, load_csv
+
+PHENOLOGY_METHODS = ('threshold', 'derivative')
+
+# Temperature onset as in /api/plot: first run of 5 days with a mean temperature >= 5°C
+TEMPERATURE_CSV = 'static/temperature_comparison.csv'
+ONSET_THRESHOLD = 5
+ONSET_DAYS = 5
+
+
+def _half_month_periods(first_month, last_month):
+    """Half-month composites in the format of BI_WEEKLY_PERIODS: (start_month, start_day, end_month, end_day, name)."""
+    periods = []
+    for month in range(first_month, last_month + 1):
+        # February is the shortest month in any year; 28 keeps the periods identical across years
+        last_day = 28 if month == 2 else calendar.monthrange(2001, month)[1]
+        name = calendar.month_abbr[month]
+        periods.append((month, 1, month, 14, f'{name} 1-14'))
+        periods.append((month, 15, month, last_day, f'{name} 15-{last_day}'))
+    return periods
+
+
+COMPOSITE_PERIODS = _half_month_periods(2, 11)
+
+
+def period_doy(year):
+    """Day of year of the middle of each composite period."""
+    doy = []
+    for start_month, start_day, end_month, end_day, _ in COMPOSITE_PERIODS:
+        start = date(year, start_month, start_day)
+        end = date(year, end_month, end_day)
+        doy.append((start + (end - start) / 2).timetuple().tm_yday)
+    return np.array(doy, dtype=np.float64)
+
+
+def doy_to_date(year, doy):
+    """Day of year (may be fractional) -> 'MM-DD'."""
+    return (date(year, 1, 1) + timedelta(days=int(round(doy)) - 1)).strftime('%m-%d')
+
+
+# --- 1. NDVI COMPOSITES ---
+
+def composite_labels(year):
+    """Datacube time labels of the composites of `year`, in COMPOSITE_PERIODS order."""
+    return [interval_label(year, f"{start_month:02d}-{start_day:02d}", f"{end_month:02d}-{end_day:02d}")
+            for start_month, start_day, end_month, end_day, _ in COMPOSITE_PERIODS]
+
+
+def fetch_composites(year, size=OUTPUT_SIZE, job=None):
+    """
+    Makes sure the composites of `year` are in the NDVI datacube (stored ones are not downloaded again).
+    Returns (labels of the composites with data, complete) where `complete` is False if a download failed.
+    """
+    if get_backend().requires_credentials and not sh_config.sh_client_id:
+        raise Exception("Configuration error: Sentinel Hub Client ID is not set.")
+
+    labels = []
+    for i, (start_month, start_day, end_month, end_day, period_name) in enumerate(COMPOSITE_PERIODS):
+        if job:
+            job.check_cancelled()
+        ndvi = get_ndvi_for_year(year, f"{start_month:02d}-{start_day:02d}", f"{end_month:02d}-{end_day:02d}",
+                                 sh_config, AOI_GEOMETRY, size)
+        if job:
+            job.emit('download', period=period_name, done=i + 1, total=len(COMPOSITE_PERIODS), ok=ndvi is not None)
+        if ndvi is not None:
+            labels.append(composite_labels(year)[i])
+    return labels, len(labels) == len(COMPOSITE_PERIODS)
+
+
+# --- 2. PHENOLOGY ---
+
+def compute_phenology(cube, labels, doy, method='threshold'):
+    """
+    Returns (start, peak, end) day-of-year rasters (float32) from the given datacube layers.
+    The cube is processed one spatial chunk at a time, so memory does not grow with the raster size.
+    """
+    metrics = [np.full((cube.height, cube.width), np.nan, dtype=np.float32) for _ in range(3)]
+    for rows, cols, block in cube.iter_blocks(labels):
+        n_layers, height, width = block.shape
+        filled = fill_time_gaps(block.reshape(n_layers, -1), doy)
+        for raster, values in zip(metrics, season_metrics(filled, doy, method)):
+            raster[rows, cols] = values.reshape(height, width)
+    return tuple(metrics)
+
+
+def temperature_onset(year):
+    """Returns (date 'MM-DD', day of year) of the temperature onset of `year`, or None."""
+    temp_df = load_csv(TEMPERATURE_CSV)
+    column = f'Rok {year}'
+    if column not in temp_df.columns:
+        return None
+    # The chart uses one calendar (the dates of a leap year) for all year columns; 29 February is dropped
+    # for other years, so every onset is a real day of `year`
+    days = [day[5:] for day in temp_df['date']]
+    keep = [calendar.isleap(year) or day != '02-29' for day in days]
+    temperatures = temp_df[column].to_numpy()[keep]
+    days = [day for day, kept in zip(days, keep) if kept]
+    i = find_onset(temperatures, ONSET_THRESHOLD, ONSET_DAYS)
+    if i is None:
+        return None
+    month, day = (int(part) for part in days[i].split('-'))
+    onset = date(year, month, day)
+    return onset.strftime('%m-%d'), onset.timetuple().tm_yday
+
+
+def phenology_cache_key(year, method, size=OUTPUT_SIZE):
+    return f"phenology:{year}:{method}:{size[0]}x{size[1]}"
+
+
+def phenology_map(year, method='threshold', size=OUTPUT_SIZE, job=None):
+    """
+    Computes the season of every pixel in `year` and renders the green-up map.
+    Returns a dict with the image path, median start/peak/end of season (day of year and 'MM-DD'),
+    the temperature onset and the lag of the green-up behind it (days), or None without data.
+    """
+    if method not in PHENOLOGY_METHODS:
+        raise ValueError(f"Unknown phenology method: {method}")
+
+    key = phenology_cache_key(year, method, size)
+    cached = cache.get(key)
+    if cached is not None and os.path.exists(cached['image_path']):
+        return cached
+
+    labels, complete = fetch_composites(year, size, job=job)
+    if len(labels) < 3:
+        return None
+
+    print(f"Calculating phenology of {year} ({method})...")
+    if job:
+        job.check_cancelled()
+        job.emit('phenology')
+    # Failed composites are left out; the time axis keeps the real dates of the others
+    doy = period_doy(year)[[composite_labels(year).index(label) for label in labels]]
+    start, peak, end = compute_phenology(ndvi_cube(AOI_GEOMETRY, size), labels, doy, method)
+
+    valid = np.isfinite(start)
+    if not valid.any():
+        return None
+    medians = {name: float(np.nanmedian(raster)) for name, raster in (('start', start), ('peak', peak), ('end', end))}
+
+    if job:
+        job.emit('render')
+    print("Creating and saving green-up map...")
+    cmap_green_up = LinearSegmentedColormap.from_list("green_up_map", [(0, "darkgreen"), (0.5, "yellowgreen"),
+                                                                       (1, "khaki")])
+    lo, hi = np.nanpercentile(start, [2, 98])
+    if hi <= lo:
+        hi = lo + 1
+    image_path = save_map_image(start, f"green_up_map_{year}_{method}.png", cmap_green_up, (lo, hi),
+                                "Start of season (day of year)", f"Vegetation Green-up in Trnava {year} ({method})")
+    print(f"✅ Green-up map successfully saved as: {image_path}")
+
+    result = {
+        'image_path': image_path,
+        'year': year,
+        'method': method,
+        'valid_share': float(valid.mean()),
+        'complete': complete,
+    }
+    for name, value in medians.items():
+        result[f'{name}_doy'] = value
+        result[f'{name}_date'] = doy_to_date(year, value)
+
+    onset = temperature_onset(year)
+    result['temperature_onset_date'] = onset[0] if onset else None
+    result['temperature_onset_doy'] = onset[1] if onset else None
+    # Positive: vegetation greens up that many days after the temperature onset
+    result['lag_days'] = medians['start'] - onset[1] if onset else None
+
+    # Incomplete stacks (e.g. the current year) are recomputed once the cache entry expires
+    result['rasters'] = {'start': start, 'peak': peak, 'end': end}
+    cache.set(key, result, ttl=None if complete and year < date.today().year else TREND_CACHE_TTL)
+    return result
+
+
+# --- 3. COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-pixel start, peak and end of the growing season.')
+    parser.add_argument('year', type=int)
+    parser.add_argument('--method', choices=PHENOLOGY_METHODS, default='threshold')
+    args = parser.parse_args(argv)
+
+    result = phenology_map(args.year, args.method)
+    if result is None:
+        print(f"No data for year {args.year}.")
+        return 1
+    print(f"Start of season: {result['start_date']}, peak: {result['peak_date']}, end: {result['end_date']} "
+          f"(medians of {result['valid_share']:.0%} of pixels)")
+    if result['temperature_onset_date']:
+        print(f"Temperature onset: {result['temperature_onset_date']}, green-up lag: {result['lag_days']:+.0f} days")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
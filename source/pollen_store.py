@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Time-series store of daily pollen loads, keyed by (station, taxon, date).
+
+Pollen tables are ingested chunk by chunk (``POLLEN_CHUNK_ROWS`` rows at a time),
+so memory stays bounded however many years and stations a file holds. Three
+layouts are recognised (``--layout`` or detected from the header):
+
+    wide    date,Lieska,Jaseň,Breza          one row per day, one column per taxon (static/pollenAverageLoads.csv)
+    rows    taxon,2025-01-01,2025-01-02,...  one row per taxon, one column per day (the transposed table)
+    long    [station,]date,taxon,value       one row per measurement
+
+Every value is validated: dates must parse (``POLLEN_DATE_FORMAT``, ISO 8601 by
+default), taxa must be non-empty names (and in ``POLLEN_TAXA`` if that is set),
+loads must be non-negative numbers. Rejected rows are counted per reason and
+skipped; empty cells are missing values and are not stored. A file is ingested
+in one transaction, so readers never see half of it, and re-ingesting a file
+replaces the values it contains. Every value records the file it came from.
+
+``sync()`` of the bundled CSV (``static/pollenAverageLoads.csv``, called by the
+API) re-ingests it whenever it changes, so the API always serves the file's
+content without reading it on every request. It only replaces the values that
+came from that file, so values ingested from other files into the same station
+are kept.
+
+Usage (from the project root):
+
+    python -m source.pollen_store ingest data/pollen_2010_2025.csv --station Trnava
+    python -m source.pollen_store ingest measurements.csv --layout long
+    python -m source.pollen_store info
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+from decouple import Csv, config
+
+from source.shared_cache import file_lock, file_version
+
+logger = logging.getLogger(__name__)
+
+POLLEN_DB = config('POLLEN_DB', default='cache/pollen.sqlite3')
+
+# Rows read from a file at a time
+POLLEN_CHUNK_ROWS = config('POLLEN_CHUNK_ROWS', default=50000, cast=int)
+
+# Accepted taxa (empty = any name)
+POLLEN_TAXA = config('POLLEN_TAXA', default='', cast=Csv())
+
+POLLEN_DATE_FORMAT = config('POLLEN_DATE_FORMAT', default='ISO8601')
+
+# Station of files without a station column
+DEFAULT_STATION = 'default'
+
+LAYOUTS = ('wide', 'rows', 'long')
+
+# Rejected rows that are logged individually per file
+MAX_LOGGED_REJECTS = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pollen (
+    station TEXT NOT NULL,
+    taxon TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (station, taxon, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS taxa (
+    taxon TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    station TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+"""
+
+_NUMBER = re.compile(r'^[\d.,\s-]+$')
+
+
+class PollenFormatError(ValueError):
+    """Raised when the layout of a pollen table cannot be recognised."""
+
+
+# --- 1. READING AND VALIDATION ---
+
+def detect_layout(columns):
+    """Layout of a table from its header: 'long', 'wide' or 'rows'."""
+    names = [str(column).strip().lower() for column in columns]
+    if 'taxon' in names and 'value' in names and 'date' in names:
+        return 'long'
+    if names and names[0] == 'date':
+        return 'wide'
+    # Most columns after the first are dates (single malformed ones are rejected while validating)
+    if len(columns) > 1 and pd.to_datetime(pd.Series(columns[1:]), format=POLLEN_DATE_FORMAT,
+                                           errors='coerce').notna().mean() > 0.5:
+        return 'rows'
+    raise PollenFormatError("Unknown layout: expected a 'date' column, date columns or date/taxon/value columns")
+
+
+def _to_long(chunk, layout, station):
+    """Reshapes one chunk to string columns station, taxon, date, value (raw, not validated yet)."""
+    if layout == 'long':
+        chunk = chunk.rename(columns=lambda column: str(column).strip().lower())
+        long = chunk[['date', 'taxon', 'value']].copy()
+        long['station'] = chunk['station'] if 'station' in chunk.columns else station
+    elif layout == 'wide':
+        long = chunk.melt(id_vars=[chunk.columns[0]], var_name='taxon', value_name='value')
+        long = long.rename(columns={chunk.columns[0]: 'date'})
+        long['station'] = station
+    else:
+        long = chunk.melt(id_vars=[chunk.columns[0]], var_name='date', value_name='value')
+        long = long.rename(columns={chunk.columns[0]: 'taxon'})
+        long['station'] = station
+    return long
+
+
+def validate(long, taxa=POLLEN_TAXA):
+    """
+    Splits a reshaped chunk into valid rows (station, taxon, ISO date, float value) and a dict
+    {reason: rejected rows}. Empty values are dropped without being counted as rejected.
+    """
+    long = long.astype({'station': str, 'taxon': str})
+    long['station'] = long['station'].str.strip()
+    long['taxon'] = long['taxon'].str.strip()
+    raw_value = long['value']
+    long = long[raw_value.notna() & (raw_value.astype(str).str.strip() != '')]
+
+    dates = pd.to_datetime(long['date'], format=POLLEN_DATE_FORMAT, errors='coerce')
+    values = pd.to_numeric(long['value'], errors='coerce')
+    rejected = {
+        'invalid date': dates.isna(),
+        'invalid taxon': (long['taxon'] == '') | long['taxon'].str.match(_NUMBER) | (long['station'] == '')
+                         | (~long['taxon'].isin(taxa) if taxa else False),
+        'invalid value': values.isna() | (values < 0),
+    }
+    bad = pd.Series(False, index=long.index)
+    rejects = {}
+    for reason, mask in rejected.items():
+        mask = mask & ~bad
+        if mask.any():
+            rejects[reason] = long[mask]
+        bad |= mask
+
+    valid = pd.DataFrame({
+        'station': long['station'][~bad],
+        'taxon': long['taxon'][~bad],
+        'date': dates[~bad].dt.strftime('%Y-%m-%d'),
+        'value': values[~bad].astype(float),
+    })
+    return valid, rejects
+
+
+def read_chunks(path, layout=None, station=DEFAULT_STATION, chunk_rows=POLLEN_CHUNK_ROWS):
+    """Yields (valid rows, rejects) per chunk of the file, see validate()."""
+    header = pd.read_csv(path, nrows=0).columns
+    layout = layout or detect_layout(header)
+    # Everything is read as text and validated explicitly
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+        yield validate(_to_long(chunk, layout, station))
+
+
+# --- 2. STORE ---
+
+class PollenStore:
+    """SQLite store of daily pollen loads, shared by all processes through one database file."""
+
+    def __init__(self, path=POLLEN_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and process, as in source/shared_cache.py
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS pollen_source ON pollen (source)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(pollen)")]
+        if 'source' not in columns:
+            # Stores created before values recorded their file: older values belong to no file,
+            # and every file is ingested again on its next sync
+            conn.execute("ALTER TABLE pollen ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+            conn.execute("DELETE FROM sources")
+
+    def ingest(self, path, layout=None, station=DEFAULT_STATION, replace_station=False, replace_source=False):
+        """
+        Ingests a pollen table in one transaction. With `replace_station`, all values of `station` are deleted
+        first; with `replace_source`, only the values previously ingested from `path`.
+        Returns {'rows': stored values, 'rejected': {reason: count}}.
+        """
+        conn = self._connection()
+        source = os.path.abspath(path)
+        result = {'rows': 0, 'rejected': {}}
+        logged = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if replace_station:
+                conn.execute("DELETE FROM pollen WHERE station = ?", (station,))
+            if replace_source:
+                conn.execute("DELETE FROM pollen WHERE source = ?", (source,))
+            for valid, rejects in read_chunks(path, layout, station):
+                for reason, rows in rejects.items():
+                    result['rejected'][reason] = result['rejected'].get(reason, 0) + len(rows)
+                    for row in rows.head(MAX_LOGGED_REJECTS - logged).itertuples(index=False):
+                        logger.warning(f"{path}: {reason}: {row.date}, {row.taxon}, {row.value}")
+                        logged += 1
+                conn.executemany("INSERT OR IGNORE INTO taxa (taxon, position) "
+                                 "VALUES (?, (SELECT COUNT(*) FROM taxa))",
+                                 [(taxon,) for taxon in valid['taxon'].unique()])
+                conn.executemany("INSERT OR REPLACE INTO pollen (station, taxon, date, value, source) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 ((*row, source) for row in valid.itertuples(index=False, name=None)))
+                result['rows'] += len(valid)
+            conn.execute("INSERT OR REPLACE INTO sources (path, version, station, rows, ingested_at) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (source, file_version(path), station, result['rows'], time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def sync(self, path, station=DEFAULT_STATION):
+        """Ingests `path` (replacing the values it added before) unless this version of the file is already stored."""
+        if self._source_version(path) == file_version(path):
+            return False
+        with file_lock(self.path):
+            # Another process may have ingested it while this one waited for the lock
+            if self._source_version(path) == file_version(path):
+                return False
+            result = self.ingest(path, station=station, replace_source=True)
+        logger.info(f"Ingested {result['rows']} pollen values from {path}")
+        return True
+
+    def _source_version(self, path):
+        row = self._connection().execute("SELECT version FROM sources WHERE path = ?",
+                                         (os.path.abspath(path),)).fetchone()
+        return row[0] if row else None
+
+    def stations(self):
+        return [row[0] for row in self._connection().execute("SELECT DISTINCT station FROM pollen ORDER BY station")]
+
+    def taxa(self, station=DEFAULT_STATION):
+        """Taxa of a station, in the order they were first ingested."""
+        return [row[0] for row in self._connection().execute(
+            "SELECT taxa.taxon FROM taxa WHERE EXISTS "
+            "(SELECT 1 FROM pollen WHERE pollen.station = ? AND pollen.taxon = taxa.taxon) ORDER BY position",
+            (station,))]
+
+    def query(self, start=None, end=None, taxa=None, station=DEFAULT_STATION):
+        """
+        Daily values of a station between `start` and `end` (ISO dates, inclusive) as a DataFrame with a
+        'date' column and one column per taxon (NaN where a taxon has no value that day).
+        """
+        taxa = list(taxa) if taxa else self.taxa(station)
+        sql = "SELECT date, taxon, value FROM pollen WHERE station = ?"
+        args = [station]
+        if start:
+            sql += " AND date >= ?"
+            args.append(start)
+        if end:
+            sql += " AND date <= ?"
+            args.append(end)
+        if taxa:
+            sql += f" AND taxon IN ({','.join('?' * len(taxa))})"
+            args.extend(taxa)
+        rows = pd.DataFrame(self._connection().execute(sql + " ORDER BY date", args).fetchall(),
+                            columns=['date', 'taxon', 'value'])
+        wide = rows.pivot(index='date', columns='taxon', values='value').reindex(columns=taxa)
+        wide.columns.name = None
+        return wide.reset_index()
+
+
+store = PollenStore()
+
+
+# --- 3. COMMAND LINE ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest pollen tables into the pollen time-series store.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help='Ingest CSV files.')
+    ingest_parser.add_argument('paths', nargs='+', help='CSV files.')
+    ingest_parser.add_argument('--layout', choices=LAYOUTS, help='Table layout (default: detected).')
+    ingest_parser.add_argument('--station', default=DEFAULT_STATION,
+                               help=f'Station of files without a station column (default {DEFAULT_STATION}).')
+    ingest_parser.add_argument('--replace', action='store_true',
+                               help='Delete all stored values of the station before ingesting.')
+    subparsers.add_parser('info', help='Print the stations and taxa in the store.')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'info':
+        for station in store.stations():
+            print(f"{station}: {', '.join(store.taxa(station))}")
+        return 0
+
+    failed = False
+    for path in args.paths:
+        try:
+            result = store.ingest(path, args.layout, args.station, args.replace)
+        except (OSError, ValueError) as e:
+            print(f"Error: {path}: {e}")
+            failed = True
+            continue
+        rejected = ', '.join(f"{count} {reason}" for reason, count in result['rejected'].items())
+        print(f"✅ {path}: {result['rows']} values stored" + (f", rejected: {rejected}" if rejected else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
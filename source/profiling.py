@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+On-demand profiling of single Flask requests.
+
+A request is profiled only when it asks for it (``X-Profile`` header or the
+``profile`` query parameter) and carries a valid admin token in the
+``X-Admin-Token`` header. Two modes are available:
+
+- ``sample``: a background thread samples the request thread's stack every few
+  milliseconds and stores the result in the collapsed ("folded") format that
+  flamegraph.pl, speedscope or inferno read directly.
+- ``trace``: deterministic profiling with ``cProfile``; the stored ``.prof``
+  file opens in snakeviz, flameprof or ``python -m pstats``.
+
+Profiles are written to ``PROFILE_DIR`` keyed by the request id, which is
+returned in the ``X-Profile-Id`` response header. When profiling is not
+requested, the only cost per request is one header lookup.
+"""
+
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from decouple import config
+from flask import abort, g, request, send_from_directory
+
+PROFILE_TOKEN = config('PROFILE_TOKEN', default='')
+PROFILE_DIR = config('PROFILE_DIR', default='profiles')
+PROFILE_SAMPLE_INTERVAL = config('PROFILE_SAMPLE_INTERVAL', default=0.005, cast=float)
+
+PROFILE_MODES = ('sample', 'trace')
+PROFILE_EXTENSIONS = {'sample': 'folded', 'trace': 'prof'}
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class StackSampler:
+    """Periodically samples the stack of one thread and aggregates folded stacks."""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _requested_mode():
+    """Returns the requested profiling mode, or None when profiling was not asked for."""
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode:
+        return None
+    mode = mode.lower()
+    # '1' / 'true' are accepted as a shortcut for the default sampling mode
+    return mode if mode in PROFILE_MODES else 'sample'
+
+
+def _is_admin():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def _request_id():
+    request_id = request.headers.get('X-Request-Id', '')
+    if not _REQUEST_ID_RE.match(request_id):
+        return uuid.uuid4().hex
+    # A server-generated suffix keeps repeated client ids from overwriting earlier profiles
+    return f"{request_id[:55]}-{uuid.uuid4().hex[:8]}"
+
+
+def init_profiling(app):
+    """Registers the profiling hooks and the admin download endpoint on the Flask app."""
+
+    @app.before_request
+    def _start_profiling():
+        mode = _requested_mode()
+        if mode is None:
+            return
+        if not _is_admin():
+            app.logger.warning("Profiling requested without a valid admin token, ignoring.")
+            return
+
+        if mode == 'trace':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another deterministic profiler is already active in this process
+                app.logger.warning("Deterministic profiler is busy, request will not be profiled.")
+                return
+        else:
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+
+        g.profile = (mode, profiler, _request_id(), time.perf_counter())
+
+    @app.after_request
+    def _stop_profiling(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+
+        mode, profiler, request_id, started = profile
+        if mode == 'trace':
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        filename = f"{request_id}.{PROFILE_EXTENSIONS[mode]}"
+        path = os.path.join(PROFILE_DIR, filename)
+        if mode == 'trace':
+            profiler.dump_stats(path)
+        else:
+            profiler.dump(path)
+
+        elapsed = time.perf_counter() - started
+        app.logger.info(f"Profil požiadavky {request.path} ({mode}, {elapsed:.3f} s) uložený do {path}")
+        response.headers['X-Profile-Id'] = request_id
+        response.headers['X-Profile-File'] = filename
+        return response
+
+    @app.teardown_request
+    def _discard_profiling(exc):
+        # after_request is skipped for unhandled exceptions; do not leave a profiler running
+        profile = g.pop('profile', None)
+        if profile is not None:
+            mode, profiler = profile[0], profile[1]
+            if mode == 'trace':
+                profiler.disable()
+            else:
+                profiler.stop()
+
+    @app.route('/api/profiles/<filename>', methods=['GET'])
+    def download_profile(filename):
+        """Vráti uložený profil požiadavky (iba pre administrátorov)."""
+        if not _is_admin():
+            abort(403)
+        request_id, _, extension = filename.rpartition('.')
+        if not _REQUEST_ID_RE.match(request_id) or extension not in PROFILE_EXTENSIONS.values():
+            abort(404)
+        return send_from_directory(os.path.abspath(PROFILE_DIR), filename, as_attachment=True)
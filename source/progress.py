@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Background analysis jobs that report their progress as Server-Sent Events.
+
+A job runs its function in a separate thread, in a copy of the context variables
+of the code that created it (e.g. the client charged by source/pu_budget.py).
+The function reports stages via ``job.emit(event, **data)`` and should call
+``job.check_cancelled()`` between expensive steps (e.g. before each Sentinel Hub
+download). ``job.events()`` is a generator of SSE messages for a streaming Flask
+response; when the client disconnects, the generator is closed and the job is
+cancelled, so abandoned analyses stop consuming processing units and CPU.
+"""
+
+import contextvars
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Interval (seconds) of keep-alive comments; writing them also detects disconnected clients
+HEARTBEAT_INTERVAL = 15
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside a job when its client has gone away."""
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class AnalysisJob:
+    """Runs `func(job)` in a background thread and streams its progress events."""
+
+    def __init__(self, func, name='analysis'):
+        self.func = func
+        self.name = name
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self._events = queue.Queue()
+        # The copied context keeps the requesting client, who is charged the processing units
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._run,), name=f"job-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def emit(self, event, **data):
+        self._events.put((event, data))
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise AnalysisCancelled()
+
+    def cancel(self):
+        logger.info(f"Job {self.name} cancelled by the client")
+        self.cancelled.set()
+
+    def _run(self):
+        try:
+            self.func(self)
+        except AnalysisCancelled:
+            self.emit('cancelled')
+        except Exception as e:
+            logger.error(f"Job {self.name} failed: {e}", exc_info=True)
+            self.emit('error', error=str(e))
+        finally:
+            self.finished.set()
+            # End of stream
+            self._events.put(None)
+
+    def events(self):
+        """Yields SSE messages until the job finishes; cancels the job if the consumer stops early."""
+        try:
+            while True:
+                try:
+                    item = self._events.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    return
+                event, data = item
+                yield format_sse(event, data)
+        finally:
+            # GeneratorExit when the client disconnects before the job has finished
+            if not self.finished.is_set():
+                self.cancel()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Sentinel Hub processing unit (PU) accounting with per-client and global budgets.
+
+Every raster request is priced before it is sent, using the Sentinel Hub rules:
+
+    PU = max(width * height / 512², 0.01) * input bands / 3 * (2 for FLOAT32 output) * samples, at least 0.005
+
+(the ``dataMask`` band is free). The estimate is reserved in a SQLite table before
+the request is sent and replaced by the PUs reported by Sentinel Hub (header
+``x-processingunits-spent``) once it succeeds; failed requests release their
+reservation. A request that would exceed the monthly global budget
+(``PU_BUDGET_MONTHLY``) or the daily budget of the requesting client
+(``PU_BUDGET_CLIENT_DAILY``) is refused with ``BudgetExceeded`` without being sent.
+
+A job of several requests (e.g. one raster per year of a trend map) is priced as
+a whole with ``estimate_job()`` before its first request, and ``can_afford()``
+tells whether it fits into what is left, so callers choose a cheaper result up
+front instead of spending part of the budget on a job that cannot finish.
+
+When less than ``PU_LOW_SHARE`` of a budget is left, ``is_low()`` is true and the
+callers degrade: ``/api/analyze`` serves the cached or the low-resolution map
+instead of computing a new full-resolution one, and stored NDVI layers of a
+running interval are reused instead of being refreshed.
+
+The client is the remote address of the Flask request (``init_budget``); work
+outside of a request is only charged to the global budget. Replayed requests are
+free unless ``PU_BUDGET_REPLAY`` is set (to test the budgets offline).
+"""
+
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from decouple import config
+
+PU_BUDGET_DB = config('PU_BUDGET_DB', default='cache/pu_usage.sqlite3')
+
+# Processing units per calendar month (all clients together) and per client and day, both in UTC
+PU_BUDGET_MONTHLY = config('PU_BUDGET_MONTHLY', default=10000.0, cast=float)
+PU_BUDGET_CLIENT_DAILY = config('PU_BUDGET_CLIENT_DAILY', default=200.0, cast=float)
+
+# Below this share of a remaining budget, results are degraded to save processing units
+PU_LOW_SHARE = config('PU_LOW_SHARE', default=0.1, cast=float)
+
+# Charge the offline replay backend too
+PU_BUDGET_REPLAY = config('PU_BUDGET_REPLAY', default=False, cast=bool)
+
+# Pricing rules of the Sentinel Hub process API
+PU_BASE_PIXELS = 512 * 512
+PU_MIN_AREA_FACTOR = 0.01
+PU_MIN_REQUEST = 0.005
+PU_FREE_BANDS = ('dataMask',)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    client TEXT,
+    label TEXT,
+    estimated REAL NOT NULL,
+    spent REAL
+)
+"""
+
+_client = contextvars.ContextVar('pu_client', default=None)
+
+
+class BudgetExceeded(Exception):
+    """Raised instead of sending a request that would exceed a processing unit budget."""
+
+
+# --- 1. ESTIMATION ---
+
+def _input_bands(evalscript):
+    match = re.search(r'input\s*:\s*\[\s*\{\s*bands\s*:\s*\[([^\]]*)\]', evalscript)
+    if not match:
+        return 3
+    bands = re.findall(r'["\'](\w+)["\']', match.group(1))
+    return len([band for band in bands if band not in PU_FREE_BANDS])
+
+
+def estimate_pu(evalscript, size, samples=1):
+    """Processing units of one process API request of `size` [width, height] pixels."""
+    area_factor = max(size[0] * size[1] / PU_BASE_PIXELS, PU_MIN_AREA_FACTOR)
+    band_factor = _input_bands(evalscript) / 3
+    format_factor = 2 if re.search(r'sampleType\s*:\s*["\']FLOAT32["\']', evalscript) else 1
+    return max(area_factor * band_factor * format_factor * samples, PU_MIN_REQUEST)
+
+
+def estimate_request(raster_request):
+    # Least-cloudy mosaics read one sample per pixel, however long the interval is
+    return estimate_pu(raster_request.evalscript, raster_request.size)
+
+
+def estimate_job(evalscript, size, requests):
+    """Processing units of `requests` process API requests with the same evalscript and raster size."""
+    return requests * estimate_pu(evalscript, size) if requests else 0.0
+
+
+# --- 2. USAGE RECORDS ---
+
+class UsageStore:
+    """Reservations and spent processing units, shared by all processes through one SQLite file."""
+
+    def __init__(self, path=PU_BUDGET_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and process, as in source/shared_cache.py
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_client ON usage (client, created_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _spent(self, conn, since, client=None):
+        query = "SELECT COALESCE(SUM(COALESCE(spent, estimated)), 0) FROM usage WHERE created_at >= ?"
+        args = [since]
+        if client is not None:
+            query += " AND client = ?"
+            args.append(client)
+        return conn.execute(query, args).fetchone()[0]
+
+    def spent(self, since, client=None):
+        """Processing units spent (or reserved) since `since` (epoch seconds), optionally by one client."""
+        return self._spent(self._connection(), since, client)
+
+    def reserve(self, client, label, estimated, limits):
+        """
+        Inserts a reservation unless it would exceed a budget; the check and the insert are one transaction.
+        `limits` is a list of (since, client or None, limit, description). Returns the reservation id.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for since, limit_client, limit, description in limits:
+                spent = self._spent(conn, since, limit_client)
+                if spent + estimated > limit:
+                    raise BudgetExceeded(f"The {description} processing unit budget is exhausted "
+                                         f"({spent:.1f} of {limit:.0f} PU used, request needs {estimated:.2f} PU)")
+            cursor = conn.execute("INSERT INTO usage (created_at, client, label, estimated) VALUES (?, ?, ?, ?)",
+                                  (time.time(), client, label, estimated))
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def settle(self, reservation, spent):
+        self._connection().execute("UPDATE usage SET spent = ? WHERE id = ?", (spent, reservation))
+
+    def release(self, reservation):
+        self._connection().execute("DELETE FROM usage WHERE id = ?", (reservation,))
+
+
+usage = UsageStore()
+
+
+# --- 3. BUDGETS ---
+
+def current_client():
+    return _client.get()
+
+
+def set_client(client):
+    """Sets the client charged for requests in the current context; returns a token for `_client.reset`."""
+    return _client.set(client)
+
+
+# Both windows roll over in UTC, as the Sentinel Hub accounting does
+def _month_start(now=None):
+    day = datetime.fromtimestamp(now or time.time(), timezone.utc)
+    return day.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def _day_start(now=None):
+    day = datetime.fromtimestamp(now or time.time(), timezone.utc)
+    return day.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def _limits(client):
+    limits = [(_month_start(), None, PU_BUDGET_MONTHLY, 'monthly')]
+    if client is not None:
+        limits.append((_day_start(), client, PU_BUDGET_CLIENT_DAILY, 'daily client'))
+    return limits
+
+
+def is_charged(backend):
+    return backend.name != 'replay' or PU_BUDGET_REPLAY
+
+
+def reserve(raster_request, backend):
+    """Reserves the estimated PUs of the request; returns the reservation id (None if the backend is free)."""
+    if not is_charged(backend):
+        return None
+    return usage.reserve(current_client(), raster_request.label, estimate_request(raster_request),
+                         _limits(current_client()))
+
+
+def settle(reservation, raster_request):
+    """Records the PUs reported by Sentinel Hub (the estimate stays if none were reported)."""
+    if reservation is None:
+        return
+    spent = getattr(raster_request, 'processing_units', None)
+    if spent is not None:
+        usage.settle(reservation, spent)
+
+
+def release(reservation):
+    if reservation is not None:
+        usage.release(reservation)
+
+
+def can_afford(estimated, backend, client=None):
+    """True if `estimated` more PUs fit into the global and the client's budget (always for a free backend)."""
+    if not estimated or not is_charged(backend):
+        return True
+    client = client if client is not None else current_client()
+    return all(usage.spent(since, limit_client) + estimated <= limit
+               for since, limit_client, limit, description in _limits(client))
+
+
+def status(client=None):
+    """Spent, limit and remaining PUs of the global and the client's budget, and whether one runs low."""
+    client = client if client is not None else current_client()
+    result = {}
+    for since, limit_client, limit, description in _limits(client):
+        spent = usage.spent(since, limit_client)
+        name = 'client' if limit_client is not None else 'global'
+        result[name] = {'period': 'day' if limit_client is not None else 'month', 'spent': round(spent, 3),
+                        'limit': limit, 'remaining': round(max(limit - spent, 0.0), 3)}
+    result['low'] = any(budget['remaining'] < PU_LOW_SHARE * budget['limit']
+                        for name, budget in result.items() if name in ('global', 'client'))
+    return result
+
+
+def is_low(client=None):
+    """True when the global or the client's budget has less than PU_LOW_SHARE left."""
+    return status(client)['low']
+
+
+def init_budget(app):
+    """Charges the processing units spent while handling a request to the requesting client."""
+    from flask import g, request
+
+    @app.before_request
+    def _set_client():
+        g.pu_client_token = set_client(request.remote_addr)
+
+    @app.teardown_request
+    def _reset_client(exc=None):
+        token = g.pop('pu_client_token', None)
+        if token is not None:
+            _client.reset(token)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-process cache backed by a single SQLite file.
+
+Every worker process (see ``serve.py``) opens its own connection to the same
+database, so a value stored by one worker is a cache hit for all others.
+Values are pickled; each entry can carry a ``version`` (e.g. the mtime of the
+source file) and an expiry time. SQLite runs in WAL mode, so readers do not
+block the writer.
+"""
+
+import fcntl
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = config('CACHE_PATH', default='cache/shared_cache.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    version TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL
+)
+"""
+
+
+class SharedCache:
+    """Key/value cache shared by all processes that use the same database file."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and process; connections must not cross a fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, version=None, default=None):
+        """Returns the cached value, or `default` if it is missing, expired or of another version."""
+        row = self._connection().execute(
+            "SELECT value, version, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        value, stored_version, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return default
+        if version is not None and stored_version != str(version):
+            return default
+        return pickle.loads(value)
+
+    def set(self, key, value, version=None, ttl=None):
+        """Stores `value` under `key`; `ttl` in seconds (None = no expiry)."""
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, version, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+             None if version is None else str(version), now, None if ttl is None else now + ttl))
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def created_at(self, key):
+        """Returns the time the entry was stored (epoch seconds), or None if there is no valid entry."""
+        row = self._connection().execute(
+            "SELECT created_at, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def get_or_compute(self, key, compute, version=None, ttl=None):
+        """Returns the cached value or computes, stores and returns it. None results are not cached."""
+        value = self.get(key, version)
+        if value is not None:
+            return value
+        value = compute()
+        if value is not None:
+            self.set(key, value, version, ttl)
+        return value
+
+    def purge_expired(self):
+        self._connection().execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+                                   (time.time(),))
+
+
+cache = SharedCache()
+
+
+def file_version(path):
+    """Version string of a file (modification time and size); changes whenever the file is rewritten."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock across processes and threads, held on `path`.lock while the block runs."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# Parsed datasets are also memoized per process, so repeated requests skip unpickling
+_frames = {}
+_frames_lock = threading.Lock()
+
+
+def load_csv(path, **kwargs):
+    """Returns the parsed CSV as a DataFrame, shared across processes and re-read when the file changes."""
+    version = file_version(path)
+    memo_key = (path, tuple(sorted(kwargs.items())))
+    with _frames_lock:
+        memo = _frames.get(memo_key)
+    if memo is not None and memo[0] == version:
+        return memo[1]
+
+    df = cache.get_or_compute(f"csv:{path}:{sorted(kwargs.items())}", lambda: pd.read_csv(path, **kwargs), version)
+    with _frames_lock:
+        _frames[memo_key] = (version, df)
+    return df
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic data for offline benchmarks and replay runs.
+
+Everything is generated from a seed, so the same parameters always produce the
+same arrays; no network access or Sentinel Hub credentials are needed.
+"""
+
+import numpy as np
+
+
+def synthetic_ndvi_raster(height, width, nan_fraction=0.0, seed=0, offset=0.0):
+    """Returns a (height, width) float32 NDVI raster with smooth structure, noise and NaN gaps."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    # Smooth "parks and streets" pattern plus pixel noise
+    base = 0.45 + 0.25 * np.sin(xx / max(width, 1) * 6.0) * np.cos(yy / max(height, 1) * 4.0)
+    raster = base + offset + rng.normal(0.0, 0.05, size=(height, width))
+    raster = np.clip(raster, -1.0, 1.0).astype(np.float32)
+    if nan_fraction > 0:
+        raster[rng.random((height, width)) < nan_fraction] = np.nan
+    return raster
+
+
+def synthetic_ndvi_cube(n_years, height, width, nan_fraction=0.0, seed=0, yearly_change=0.01):
+    """Returns a (n_years, height, width) NDVI cube with a small linear trend per year."""
+    return np.stack([
+        synthetic_ndvi_raster(height, width, nan_fraction, seed=seed + i, offset=yearly_change * i)
+        for i in range(n_years)
+    ], axis=0)
+
+
+def seasonal_ndvi_offset(doy, green_up=110.0, senescence=270.0, amplitude=0.35):
+    """NDVI offset over the year: low in winter, rising around `green_up`, falling around `senescence` (days of year)."""
+    doy = np.asarray(doy, dtype=np.float64)
+    rise = 1.0 / (1.0 + np.exp(-(doy - green_up) / 10.0))
+    fall = 1.0 / (1.0 + np.exp((doy - senescence) / 12.0))
+    return amplitude * (rise * fall - 0.5)
+
+
+def synthetic_ndvi_season_cube(doy, height, width, nan_fraction=0.0, seed=0):
+    """
+    Returns a (len(doy), height, width) NDVI cube of one growing season.
+    The green-up day varies smoothly across the raster (±15 days), so phenology maps have structure.
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    green_up = 110.0 + 15.0 * np.sin(xx / max(width, 1) * 3.0) * np.cos(yy / max(height, 1) * 2.0)
+    base = synthetic_ndvi_raster(height, width, seed=seed)
+    cube = np.stack([base + seasonal_ndvi_offset(day, green_up=green_up) for day in doy], axis=0)
+    cube = np.clip(cube + rng.normal(0.0, 0.02, size=cube.shape), -1.0, 1.0).astype(np.float32)
+    if nan_fraction > 0:
+        cube[rng.random(cube.shape) < nan_fraction] = np.nan
+    return cube
+
+
+def synthetic_ndvi_series(length, gap_fraction=0.0, seed=0, cutoff=0.4):
+    """
+    Returns a seasonal NDVI series (list of floats) where a fraction of values
+    falls below `cutoff` (gaps, e.g. clouds). The first and last values are kept valid.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, np.pi, length)
+    series = 0.5 + 0.3 * np.sin(t) + rng.normal(0.0, 0.02, size=length)
+    gaps = rng.random(length) < gap_fraction
+    gaps[0] = gaps[-1] = False
+    series[gaps] = rng.uniform(0.0, cutoff * 0.9, size=int(gaps.sum()))
+    return [float(v) for v in series]
+
+
+def synthetic_temperature(n_days, seed=0, start_temperature=-2.0, end_temperature=22.0):
+    """Returns daily mean temperatures (float array) warming from winter to summer with noise."""
+    rng = np.random.default_rng(seed)
+    trend = np.linspace(start_temperature, end_temperature, n_days)
+    return trend + rng.normal(0.0, 3.0, size=n_days)
+
+
+def synthetic_rgb_image(height, width, seed=0):
+    """Returns a (height, width, 3) uint8 true-color-like image."""
+    rng = np.random.default_rng(seed)
+    green = np.nan_to_num(synthetic_ndvi_raster(height, width, seed=seed))
+    rgb = np.stack([
+        0.35 - 0.2 * green,
+        0.25 + 0.4 * green,
+        0.30 - 0.1 * green,
+    ], axis=-1) + rng.normal(0.0, 0.02, size=(height, width, 3))
+    return (np.clip(rgb, 0.0, 1.0) * 255).astype(np.uint8)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Prefix-sum index of the daily time series for constant-time date-window queries.
+
+For every variable and series the index keeps the cumulative sum of the values
+and the cumulative number of valid (non-NaN) values. The sum, count and mean over
+any date window are then two lookups per series instead of a scan of the CSV:
+
+    sum(start..end) = csum[end + 1] - csum[start]
+
+Variables:
+
+- ``temperature``: daily mean temperature per year (``static/temperature_comparison.csv``),
+- ``gdd``: growing degree days per year, ``max(temperature - GDD_BASE, 0)`` (its sum over a window
+  is the GDD total),
+- ``pollen``: average daily pollen load per taxon (``static/pollenAverageLoads.csv``).
+
+Windows are given by month and day ('MM-DD'), because each CSV puts all of its
+series on one calendar; the year is chosen with the series. A window whose start
+is after its end wraps around New Year and is answered as two segments. For the
+yearly series (temperature, gdd), the part before New Year comes from the
+previous year's series, so ``12-01``..``02-28`` of 2024 is December 2023 to
+February 2024. An index is rebuilt in each process when its CSV changes.
+
+    from source.timeseries_index import get_index
+
+    get_index('gdd').query('03-01', '04-30')             # {'2020': {'sum': ..., 'mean': ..., 'count': ...}, ...}
+    get_index('pollen').query('02-01', '03-15', ['Breza'])
+    get_index('temperature').query('12-01', '02-28')     # winters
+"""
+
+import threading
+from datetime import date
+
+import numpy as np
+from decouple import config
+
+from source.correlation import POLLEN_CSV
+from source.phenology import TEMPERATURE_CSV
+from source.shared_cache import file_version, load_csv
+
+# Base temperature (°C) of the growing degree days
+GDD_BASE = config('GDD_BASE', default=5.0, cast=float)
+
+
+def _temperature(df):
+    columns = [column for column in df.columns if column.startswith('Rok ')]
+    return [column.split()[1] for column in columns], df[columns].to_numpy(dtype=np.float64).T
+
+
+def _gdd(df):
+    labels, values = _temperature(df)
+    # NaN stays NaN, so missing days are not counted as days without growth
+    return labels, np.where(np.isnan(values), np.nan, np.maximum(values - GDD_BASE, 0.0))
+
+
+def _pollen(df):
+    columns = list(df.columns[1:])
+    return columns, df[columns].to_numpy(dtype=np.float64).T
+
+
+# Variable -> (CSV file, function returning (series labels, (series, days) values) from the DataFrame,
+#              whether the series are years)
+VARIABLES = {
+    'temperature': (TEMPERATURE_CSV, _temperature, True),
+    'gdd': (TEMPERATURE_CSV, _gdd, True),
+    'pollen': (POLLEN_CSV, _pollen, False),
+}
+
+
+def day_key(text):
+    """'MM-DD' or 'YYYY-MM-DD' -> sortable month/day key (MMDD as an int); raises ValueError if invalid."""
+    parts = text.split('-')
+    if len(parts) == 2:
+        parts = ['2000'] + parts
+    day = date.fromisoformat('-'.join(parts))
+    return day.month * 100 + day.day
+
+
+def window_key(text):
+    """Key of a window edge, which must be 'MM-DD' (the year is chosen with the series); raises ValueError."""
+    if len(text.split('-')) != 2:
+        raise ValueError(f"Window edges are 'MM-DD' days, not {text!r}")
+    return day_key(text)
+
+
+class TimeSeriesIndex:
+    """Cumulative sums and counts of (series, days) values over one calendar."""
+
+    def __init__(self, dates, labels, values, yearly=False):
+        self.yearly = yearly
+        self.dates = list(dates)
+        self.keys = np.array([day_key(text) for text in self.dates])
+        order = np.argsort(self.keys, kind='stable')
+        self.dates = [self.dates[i] for i in order]
+        self.keys = self.keys[order]
+        values = np.asarray(values, dtype=np.float64)[:, order]
+
+        self.labels = list(labels)
+        valid = np.isfinite(values)
+        n_series = len(self.labels)
+        self.csum = np.zeros((n_series, len(self.dates) + 1))
+        self.count = np.zeros((n_series, len(self.dates) + 1), dtype=np.int64)
+        np.cumsum(np.where(valid, values, 0.0), axis=1, out=self.csum[:, 1:])
+        np.cumsum(valid, axis=1, out=self.count[:, 1:])
+
+    def window(self, start, end):
+        """
+        Position ranges [lo, hi) of the days from `start` to `end` (inclusive, 'MM-DD'): one range, or two
+        (before and after New Year) when `start` is after `end`.
+        """
+        start_key, end_key = window_key(start), window_key(end)
+        lo = int(np.searchsorted(self.keys, start_key, side='left'))
+        hi = int(np.searchsorted(self.keys, end_key, side='right'))
+        if start_key > end_key:
+            return [(lo, len(self.keys)), (0, hi)]
+        return [(lo, max(lo, hi))]
+
+    def _previous_row(self, row):
+        """Row of the previous year's series (None if there is none)."""
+        previous = str(int(self.labels[row]) - 1)
+        return self.labels.index(previous) if previous in self.labels else None
+
+    def query(self, start, end, series=None):
+        """
+        Returns {label: {'sum', 'mean', 'count'}} over the days from `start` to `end` (inclusive)
+        for the given series labels (default: all). Unknown labels raise KeyError.
+        The mean is None for series without valid values in the window.
+        """
+        segments = self.window(start, end)
+        rows = [self.labels.index(label) for label in series] if series else range(len(self.labels))
+        result = {}
+        for row in rows:
+            total, count = 0.0, 0
+            for i, (lo, hi) in enumerate(segments):
+                # Before New Year, a yearly series continues the previous year
+                source = self._previous_row(row) if self.yearly and len(segments) == 2 and i == 0 else row
+                if source is None:
+                    continue
+                total += float(self.csum[source, hi] - self.csum[source, lo])
+                count += int(self.count[source, hi] - self.count[source, lo])
+            result[self.labels[row]] = {
+                'sum': total,
+                'mean': total / count if count else None,
+                'count': count,
+            }
+        return result
+
+    def span(self, start, end):
+        """
+        (first date, last date, number of days) of the calendar rows inside the window ('MM-DD' dates, as the
+        year depends on the series); dates are None if it is empty.
+        """
+        segments = [(lo, hi) for lo, hi in self.window(start, end) if hi > lo]
+        if not segments:
+            return None, None, 0
+        return (self.dates[segments[0][0]][5:], self.dates[segments[-1][1] - 1][5:],
+                sum(hi - lo for lo, hi in segments))
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(variable):
+    """Returns the index of a variable from VARIABLES, rebuilt whenever its CSV file changes."""
+    path, extract, yearly = VARIABLES[variable]
+    version = file_version(path)
+    with _indexes_lock:
+        memo = _indexes.get(variable)
+    if memo is not None and memo[0] == version:
+        return memo[1]
+
+    df = load_csv(path)
+    labels, values = extract(df)
+    index = TimeSeriesIndex(df.iloc[:, 0], labels, values, yearly)
+    with _indexes_lock:
+        _indexes[variable] = (version, index)
+    return index
@@ -78,14 +78,14 @@ async function loadCurrentPollen(contentDiv) {
 
     // Load the Austria pollen graph
     try{
-        const response = await fetch('/api/current_pollen');
+        const response = await fetch(`/api/current_pollen?format=columns&encoding=f32&max_points=${CHART_MAX_POINTS}`);
         const data = await response.json();
         if (!response.ok) {
             throw new Error(data.error || `HTTP error! Status: ${response.status}`);
         }
         const resultsSection = document.getElementById('results austria-graph');
         if (resultsSection) {
-            const pollenGraphs = JSON.parse(data.pollen_data);
+            const pollenGraphs = columnsToTraces(data.pollen);
             renderPollenPlots(pollenGraphs);
 
         }
@@ -97,6 +97,33 @@ async function loadCurrentPollen(contentDiv) {
 
 const content = document.querySelector('.content-div');
 
+// Najviac bodov na jeden rad grafu; dlhšie rady server zredukuje (LTTB)
+const CHART_MAX_POINTS = 400;
+
+// Stĺpec kompaktných grafových dát (format=columns) -> pole čísel
+function decodeColumn(column, encoding) {
+    if (encoding !== 'f32') {
+        return column;
+    }
+    // base64 little-endian float32; chýbajúce hodnoty sú NaN
+    const bytes = Uint8Array.from(atob(column), char => char.charCodeAt(0));
+    return Array.from(new Float32Array(bytes.buffer));
+}
+
+// Kompaktné grafové dáta -> Plotly traces; štýl čiar sa dopĺňa tu, nie na serveri
+function columnsToTraces(payload) {
+    return payload.series.map(series => ({
+        x: series.index ? series.index.map(i => payload.x[i]) : payload.x,
+        y: decodeColumn(series.y, payload.encoding),
+        name: series.name,
+        type: 'scatter',
+        mode: 'lines+markers',
+        opacity: 0.7,
+        line: {width: 2.5},
+        marker: {size: 6}
+    }));
+}
+
 // Define pollenInfo at the top before any functions use it
 const pollenInfo = {
     early_spring: "Hlavné alergény: Lieska, Jelša, Tis.",
@@ -105,6 +132,16 @@ const pollenInfo = {
     year: "Analýza pre celý kalendárny rok."
 };
 
+// Práve bežiaca streamovaná analýza (EventSource); zatvorením spojenia server analýzu zruší
+let activeAnalysis = null;
+
+function cancelActiveAnalysis() {
+    if (activeAnalysis) {
+        activeAnalysis.close();
+        activeAnalysis = null;
+    }
+}
+
 // Function to switch methodology visibility
 function updateMethodology(activeId) {
     const methodologies = document.querySelectorAll('.metodika-content');
@@ -127,6 +164,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const vegBtn = document.querySelector('.load-veg-btn');
     vegBtn.addEventListener('click', () => {
+        cancelActiveAnalysis();
         loadVegetaciu(content);
         yearContainer = document.getElementById('year-checkbox-container');
         populateYearCheckboxes(yearContainer);
@@ -136,6 +174,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const pollenBtn = document.querySelector('.load-pollen-btn');
     pollenBtn.addEventListener('click', () => {
+        cancelActiveAnalysis();
         loadPollenSeason(content);
         attachPollenListeners();
         updateMethodology('metodika-sezona');
@@ -143,6 +182,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const currPollenBtn = document.querySelector('.load-curr-poll-btn');
     currPollenBtn.addEventListener('click', () => {
+        cancelActiveAnalysis();
         loadCurrentPollen(content);
         updateMethodology('metodika-pollen');
     });
@@ -223,6 +263,9 @@ async function handlePollenAnalysis() {
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({
                 location: selectedLocation,
+                format: 'columns',
+                encoding: 'f32',
+                max_points: CHART_MAX_POINTS,
             }),
         });
         const data = await response.json();
@@ -231,9 +274,9 @@ async function handlePollenAnalysis() {
         }
 
         // Parse the plot data and render it
-        const ndviData = JSON.parse(data.ndvi_data);
-        const tempData = JSON.parse(data.temp_data);
-        const thresholdDates = JSON.parse(data.threshold_dates);
+        const ndviData = columnsToTraces(data.ndvi);
+        const tempData = columnsToTraces(data.temperature);
+        const thresholdDates = data.threshold_dates;
         renderPlots(ndviData, tempData, thresholdDates);
 
     } catch (error) {
@@ -260,7 +303,8 @@ function renderPollenPlots(pollenGraphs){
         title: 'Aktuálna peľová situácia v tomto roku',
         xaxis: {
             title: 'Dátum',
-            type: 'category',
+            type: 'date',
+            tickformat: '%Y-%m-%d',
             tickangle: -45,
             nticks: 15
         },
@@ -336,7 +380,8 @@ function renderPlots(ndviGraphs, tempGraphs, thresholdDates) {
         title: 'Teplota - Porovnanie rokov',
         xaxis: {
             title: 'Dátum',
-            type: 'category',
+            type: 'date',
+            tickformat: '%Y-%m-%d',
             tickangle: -45,
             nticks: 15
         },
@@ -373,17 +418,11 @@ function renderPlots(ndviGraphs, tempGraphs, thresholdDates) {
         if (lineIndex === -1) return;
 
         const lineColor = renderedData[lineIndex].line.color;
-        const dates = [];
-        const values = [];
-
-        for (let i = info.start_index; i <= info.end_index; i++) {
-            dates.push(tempGraphs[lineIndex].x[i]);
-            values.push(tempGraphs[lineIndex].y[i]);
-        }
 
+        // Dni nástupu posiela server, lebo zredukovaný rad ich nemusí obsahovať
         const markerTrace = {
-            x: dates,
-            y: values,
+            x: info.dates,
+            y: info.values,
             mode: 'markers',
             type: 'scatter',
             name: `${yearCol} - Threshold`,
@@ -496,6 +535,61 @@ async function handleAnalysis() {
     analyzeBtn.disabled = true;
     analyzeBtn.textContent = 'Spracúvam...';
 
+    const resetButton = () => {
+        analyzeBtn.disabled = false;
+        analyzeBtn.textContent = 'Analyzovať trend';
+    };
+
+    // Prehliadače bez podpory Server-Sent Events čakajú na jednu dlhú požiadavku
+    if (!window.EventSource) {
+        await runAnalysisRequest(selectedYears, selectedSeason);
+        resetButton();
+        return;
+    }
+
+    // Priebežný stav analýzy cez Server-Sent Events
+    const params = new URLSearchParams({years: selectedYears.join(','), season: selectedSeason});
+    cancelActiveAnalysis();
+    const source = new EventSource(`/api/analyze/stream?${params}`);
+    activeAnalysis = source;
+    const finish = () => {
+        source.close();
+        activeAnalysis = null;
+        resetButton();
+    };
+
+    source.addEventListener('start', (event) => {
+        const data = JSON.parse(event.data);
+        showProgress(`Sťahujem satelitné dáta (0/${data.total} rokov)...`);
+    });
+    source.addEventListener('download', (event) => {
+        const data = JSON.parse(event.data);
+        const status = data.ok ? '' : ' (bez dát)';
+        showProgress(`Stiahnutý rok ${data.year}${status} – ${data.done}/${data.total} rokov`);
+    });
+    source.addEventListener('preview', (event) => {
+        showPreview(JSON.parse(event.data).image_url);
+    });
+    source.addEventListener('degraded', (event) => {
+        showDegradedPreview(JSON.parse(event.data).image_url);
+        finish();
+    });
+    source.addEventListener('trend', () => showProgress('Počítam trend pre každý pixel...'));
+    source.addEventListener('render', () => showProgress('Vykresľujem mapu trendu...'));
+    source.addEventListener('done', (event) => {
+        showImage(JSON.parse(event.data).image_url);
+        finish();
+    });
+    source.addEventListener('error', (event) => {
+        // Chyba zo servera má dáta, chyba spojenia nie
+        const message = event.data ? JSON.parse(event.data).error : 'Spojenie so serverom bolo prerušené.';
+        console.error('Analysis error:', message);
+        showError(`Chyba pri analýze: ${message}`);
+        finish();
+    });
+}
+
+async function runAnalysisRequest(selectedYears, selectedSeason) {
     try {
         const response = await fetch('/api/analyze', {
             method: 'POST',
@@ -503,19 +597,46 @@ async function handleAnalysis() {
             body: JSON.stringify({
                 years: selectedYears,
                 season: selectedSeason,
+                progressive: true,
             }),
         });
         const data = await response.json();
         if (!response.ok) {
             throw new Error(data.error || `HTTP error! Status: ${response.status}`);
         }
-        showImage(data.image_url);
+        if (data.full_ready) {
+            showImage(data.image_url);
+            return;
+        }
+        // Pri nízkom rozpočte PU sa plné rozlíšenie nepočíta a nie je na čo čakať
+        if (data.degraded || !data.status_url) {
+            showDegradedPreview(data.image_url);
+            return;
+        }
+        // Náhľad v nízkom rozlíšení; plné rozlíšenie sa počíta na pozadí
+        showPreview(data.image_url);
+        await waitForFullMap(data.status_url);
     } catch (error) {
         console.error('Analysis error:', error);
         showError(`Chyba pri analýze: ${error.message}`);
-    } finally {
-        analyzeBtn.disabled = false;
-        analyzeBtn.textContent = 'Analyzovať trend';
+    }
+}
+
+async function waitForFullMap(statusUrl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 3000));
+        const response = await fetch(statusUrl);
+        const status = await response.json();
+        if (!response.ok) {
+            throw new Error(status.error || `HTTP error! Status: ${response.status}`);
+        }
+        if (status.full_ready) {
+            showImage(status.levels.full);
+            return;
+        }
+        if (!status.pending) {
+            throw new Error('Mapu v plnom rozlíšení sa nepodarilo vygenerovať.');
+        }
     }
 }
 
@@ -526,11 +647,42 @@ function showLoading() {
     }
 }
 
+function showProgress(message) {
+    // Ak je zobrazený náhľad, aktualizuje sa iba text pod ním
+    const previewProgress = document.getElementById('analysis-progress');
+    if (previewProgress) {
+        previewProgress.textContent = message;
+        return;
+    }
+    const resultsSection = document.getElementById('results');
+    if (resultsSection) {
+        resultsSection.innerHTML = `<div class="spinner"></div><p class="placeholder-text" style="margin-top: 10px;">${message}</p>`;
+    }
+}
+
+function showPreview(imageUrl) {
+    const resultsSection = document.getElementById('results');
+    if (resultsSection) {
+        resultsSection.innerHTML = `
+            <img src="${imageUrl}" alt="Náhľad mapy trendu vegetácie">
+            <p id="analysis-progress" class="placeholder-text">Náhľad v nízkom rozlíšení, počítam mapu v plnom rozlíšení...</p>`;
+    }
+}
+
+function showDegradedPreview(imageUrl) {
+    const resultsSection = document.getElementById('results');
+    if (resultsSection) {
+        resultsSection.innerHTML = `
+            <img src="${imageUrl}" alt="Náhľad mapy trendu vegetácie">
+            <p class="placeholder-text">Náhľad v nízkom rozlíšení. Rozpočet pre satelitné dáta je takmer vyčerpaný, mapa v plnom rozlíšení sa teraz nepočíta.</p>`;
+    }
+}
+
 function showImage(imageUrl) {
     const resultsSection = document.getElementById('results');
     if (resultsSection) {
-        const url = `${imageUrl}?t=${new Date().getTime()}`;
-        resultsSection.innerHTML = `<img src="${url}" alt="Mapa trendu vegetácie">`;
+        // Mapy v static/output server revaliduje cez ETag, takže nie je potrebný parameter proti cache
+        resultsSection.innerHTML = `<img src="${imageUrl}" alt="Mapa trendu vegetácie">`;
     }
 }
 